@@ -19,7 +19,8 @@ class CanInfo(models.Model):
     Attributes:
         can_id {uuid} -- The uuid of the can. Should match the can username
         owner {User} -- The can's user account that is only for this can
-        channel_name {str} -- Channel used to find correct websocket via channels
+        channel_name {str} -- No longer written, sockets are found through
+            VoteHandler.presence and the can's channel layer group
         config {str} -- A TextField that can store additional information
         default_bin {Bin} -- The bin to use when no other bin matches the category
     """
@@ -13,6 +13,7 @@ from django.urls import reverse
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import UpdateView
 
+from VoteHandler.utils import notify_bins_changed
 from .models import CanInfo, Bin
 from .forms import ConfigurationForm, CanConfigurationForm
 
@@ -24,10 +25,8 @@ def configlist(request):
         return render(request, 'landing.html',
                       {'error_message' : 'Please enter your UUID.'}
                      )
-    bins = Bin.objects.filter(s_id__can_id=uuid.UUID(can_id).hex)
+    bins = Bin.objects.filter(s_id__can_id=uuid.UUID(can_id).hex).select_related('category')
     can = CanInfo.objects.get(can_id=uuid.UUID(can_id).hex)
-    print(bins)
-    print(can)
     return render(request, 'list.html', {'bins': bins, 'can': can})
 
 
@@ -41,6 +40,8 @@ def configure_can(request, pk):
         can_id = form.cleaned_data['request.user.username']
         owner = form.cleaned_data['owner']
         form.save()
+        # The default category decides where unmatched categories go
+        notify_bins_changed(instance)
         return HttpResponseRedirect(reverse('Config:configlist'))
     return render(request, 'edit.html', {'form':form})
 
@@ -54,6 +55,7 @@ def configure_bins(request):
             bin_num = form.cleaned_data['bin_num']
             category = form.cleaned_data['category']
             new_bin = Bin.objects.create(s_id=this_can, bin_num=bin_num, category=category,)
+            notify_bins_changed(this_can)
             return HttpResponseRedirect(reverse('Config:config_detail', args=(new_bin.id,)))
     else:
         form = ConfigurationForm()
@@ -69,6 +71,7 @@ def edit_bin(request, pk):
         bin_num = form.cleaned_data['bin_num']
         category = form.cleaned_data['category']
         form.save()
+        notify_bins_changed(bin_config.s_id)
         return HttpResponseRedirect(reverse('Config:config_detail', kwargs={'pk':pk}))
     return render(request, 'configure.html', {'form':form})
 
@@ -6,7 +6,10 @@ defined in the ASGI_APPLICATION setting.
 import os
 import django
 from channels.routing import get_default_application
+from django.core.management import call_command
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "VoteHandler.settings")
 django.setup()
+# Servers don't run the system checks, show their warnings, ex. VoteHandler.W001
+call_command('check')
 application = get_default_application()
\ No newline at end of file
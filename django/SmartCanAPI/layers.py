@@ -0,0 +1,104 @@
+"""Channel layers for running without redis
+
+Classes:
+    InMemoryChannelLayer -- A single process channel layer with groups
+"""
+import asyncio
+import random
+import string
+import time
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class InMemoryChannelLayer(BaseChannelLayer):
+    """A single process channel layer with groups, for tests and local load testing
+
+    The in-memory layer that ships with channels 2.0.2 files process-specific
+    messages under a different name than it reads them from, never awaits
+    the sleep while polling, so waiting blocks the event loop, and has no
+    groups. Messages and group memberships expire like they do with redis.
+
+    Keyword Arguments:
+        expiry {int} -- Seconds before an unreceived message is dropped
+        group_expiry {int} -- Seconds before a group membership is dropped
+        capacity {int} -- The most messages waiting on one channel
+    """
+
+    extensions = ['groups', 'flush']
+    _POLL_S = 0.01
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.group_expiry = group_expiry
+        # {channel: [(expires_at, message)]} and {group: {channel: joined_at}}
+        self.channels = {}
+        self.groups = {}
+
+    ##### Channels
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        queue = self.channels.setdefault(channel, [])
+        self._expire(queue)
+        if len(queue) >= self.capacity:
+            raise ChannelFull(channel)
+        queue.append((time.time() + self.expiry, dict(message)))
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        while True:
+            queue = self.channels.get(channel)
+            if queue:
+                self._expire(queue)
+            if queue:
+                return queue.pop(0)[1]
+            await asyncio.sleep(self._POLL_S)
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.inmemory!%s" % (
+            prefix,
+            "".join(random.choice(string.ascii_letters) for i in range(12)),
+        )
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+
+    ##### Groups
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        self.groups.setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        members = self.groups.get(group, {})
+        members.pop(channel, None)
+        if not members:
+            self.groups.pop(group, None)
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        joined_after = time.time() - self.group_expiry
+        members = self.groups.get(group, {})
+        for channel, joined_at in list(members.items()):
+            if joined_at < joined_after:
+                del members[channel]
+                continue
+            # Like redis, a full channel doesn't stop the rest of the group
+            try:
+                await self.send(channel, message)
+            except ChannelFull:
+                pass
+
+    ##### Helpers
+
+    @staticmethod
+    def _expire(queue):
+        now = time.time()
+        while queue and queue[0][0] < now:
+            queue.pop(0)
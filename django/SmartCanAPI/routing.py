@@ -2,7 +2,7 @@ from django.urls import path
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 
-from VoteHandler.consumers import CommanderConsumer
+from VoteHandler.consumers import AsyncCommanderConsumer
 
 
 application = ProtocolTypeRouter({
@@ -10,6 +10,6 @@ application = ProtocolTypeRouter({
 
     #TODO: Wrap in AuthMiddleware
     "websocket": URLRouter([
-        path("ws/", CommanderConsumer)
+        path("ws/", AsyncCommanderConsumer)
     ])
-})
\ No newline at end of file
+})
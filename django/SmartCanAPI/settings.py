@@ -16,19 +16,50 @@ import os.path
 ###### Channels settings
 redis_host = os.environ.get('REDIS_HOST', 'localhost')
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [(redis_host, 6379)],
+if os.environ.get('CHANNEL_LAYER') == 'memory':
+    # Single process only, ex. for local load testing without redis
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "SmartCanAPI.layers.InMemoryChannelLayer",
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [(redis_host, 6379)],
+            },
+        },
+    }
 
 # ASGI_APPLICATION should be set to your outermost router
 ASGI_APPLICATION = 'SmartCanAPI.routing.application'
 
 
+###### Cache settings
+# Use redis in production by setting REDIS_CACHE_URL, ex. redis://localhost:6379/1
+redis_cache_url = os.environ.get('REDIS_CACHE_URL')
+
+if redis_cache_url:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": redis_cache_url,
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            },
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "smartcan",
+        },
+    }
+
+
 ###### Project specific settings
 
 # How many votes to add when a user categorizes
@@ -36,6 +67,50 @@ CATEGORIZE_VOTE_WEIGHT = 1
 # Minimum confidence required to not redirect cause a redirect to the categorize page
 MIN_CONFIDENCE = 0.20
 MIN_NORMALIZE_COUNT = 100
+# Most votes accepted by a single batch vote request
+VOTE_BATCH_MAX_SIZE = 1000
+# Buffer carousel votes in memory and write them in bulk, for high traffic events
+VOTE_BUFFER_ENABLED = os.environ.get('VOTE_BUFFER_ENABLED') == '1'
+VOTE_BUFFER_FLUSH_INTERVAL = 5
+VOTE_BUFFER_FLUSH_SIZE = 500
+# Most items accepted by a single classify request
+CLASSIFY_BATCH_MAX_SIZE = 200
+# Seconds a cached classification is fresh, then how long it may be served stale
+CLASSIFICATION_CACHE_TTL = 300
+CLASSIFICATION_CACHE_STALE_TTL = 60
+# Seconds between loading names created by other processes into the name indexes
+NAME_INDEX_REFRESH_INTERVAL = 30
+# Load names into the name indexes from a background thread, so requests never wait on it
+NAME_INDEX_BACKGROUND_REFRESH = os.environ.get('NAME_INDEX_BACKGROUND_REFRESH', '1') == '1'
+# Misspellings allow one edit per FUZZY_MATCH_CHARS_PER_EDIT characters, up to the max
+FUZZY_MATCH_MAX_DISTANCE = 2
+FUZZY_MATCH_CHARS_PER_EDIT = 5
+# Most suggestions returned by the autocomplete endpoint
+AUTOCOMPLETE_MAX_RESULTS = 10
+# Seconds between heartbeats of a connected can, and before a silent can is offline
+PRESENCE_HEARTBEAT_INTERVAL = 30
+PRESENCE_TTL = 90
+# Send rotates from a background thread so responses don't wait on redis, see VoteHandler.dispatch
+CHANNEL_DISPATCH_BACKGROUND = os.environ.get('CHANNEL_DISPATCH_BACKGROUND', '1') == '1'
+CHANNEL_DISPATCH_MAX_QUEUED = 1000
+# Cans whose presence is checked, and whose groups are queued, at once when broadcasting
+BROADCAST_BATCH_SIZE = 500
+# Seconds between pings of a connected can, and how many may go unanswered before closing it
+PING_INTERVAL = 15
+PING_MISSED_LIMIT = 2
+# Round trip times kept per can, and seconds a can's latency summary is kept after its last pong
+LATENCY_WINDOW = 100
+LATENCY_TTL = 3600
+# Seconds a can may reconnect with its resume token, and that a resumed can's account is cached
+RESUME_TOKEN_MAX_AGE = 7 * 24 * 3600
+RESUME_CACHE_TTL = 300
+# Commands in flight to a can that acks them, seconds to wait for an ack, and sends before giving up
+COMMAND_WINDOW = 4
+COMMAND_ACK_TIMEOUT = 5
+COMMAND_MAX_ATTEMPTS = 3
+# Password log ins checked at once per process, and seconds the cans turned away wait at least
+MAX_CONCURRENT_LOGINS = 20
+RECONNECT_RETRY_AFTER = 10
 
 
 ###### Normal Django settings
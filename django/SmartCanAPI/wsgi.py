@@ -9,8 +9,11 @@ https://docs.djangoproject.com/en/1.11/howto/deployment/wsgi/
 
 import os
 
+from django.core.management import call_command
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartCanAPI.settings")
 
 application = get_wsgi_application()
+# Servers don't run the system checks, show their warnings, ex. VoteHandler.W001
+call_command('check')
@@ -8,3 +8,4 @@ from . import models
 admin.site.register(models.Category)
 admin.site.register(models.Disposable)
 admin.site.register(models.DisposableVote)
+admin.site.register(models.DisposableSummary)
@@ -0,0 +1,53 @@
+"""Turns cans away while the server is busy logging others in
+
+After an outage every can reconnects at once, and each password log in runs
+the whole password hasher. Rather than letting them queue up behind each
+other until they time out and retry in step, a process only checks up to
+settings.MAX_CONCURRENT_LOGINS passwords at once. The cans past that are
+sent {"error": "OVERLOADED", "retry_after": seconds} and closed, and spread
+their next attempt over settings.RECONNECT_RETRY_AFTER seconds or more.
+Resuming with a token is cheap, see VoteHandler.resume, so it is never
+turned away.
+
+Classes:
+    LoginLimiter -- Counts the password log ins in progress
+
+Attributes:
+    login_limiter {LoginLimiter} -- The limiter shared by the sockets of this
+        process
+"""
+import threading
+
+from django.conf import settings
+
+
+class LoginLimiter():
+    """Counts the password log ins in progress in this process
+
+    Keyword Arguments:
+        limit {int} -- The most log ins at once, settings.MAX_CONCURRENT_LOGINS
+            if None (default: {None})
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self.in_progress = 0
+        # Sync sockets log in from worker threads
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Starts a log in, returns False if too many are in progress"""
+        limit = settings.MAX_CONCURRENT_LOGINS if self.limit is None else self.limit
+        with self._lock:
+            if self.in_progress >= limit:
+                return False
+            self.in_progress += 1
+            return True
+
+    def release(self) -> None:
+        """Ends a log in started by try_acquire"""
+        with self._lock:
+            self.in_progress -= 1
+
+
+login_limiter = LoginLimiter()
@@ -2,7 +2,14 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.core import checks
 
 
 class VoteHandlerConfig(AppConfig):
     name = 'VoteHandler'
+
+    def ready(self):
+        # Connects the signal receivers
+        from . import signals  # noqa: F401
+        from .checks import check_presence_cache
+        checks.register(check_presence_cache, checks.Tags.caches)
@@ -0,0 +1,192 @@
+"""Query count and latency benchmarks for the hot path views
+
+Each benchmark drives a view through Django's test client, as the can whose
+account is first in the database, and records how many queries it ran and
+how long it took. Everything runs in a transaction that is rolled back, so
+benchmarking never changes the data. Create realistic data with the
+generate_benchmark_data management command first, then run benchmark_views.
+
+Both commands are development tools. They refuse to run against a database
+that isn't on this machine, like the production one in settings, unless
+they are passed --allow-remote-database.
+
+Functions:
+    check_local_database -- Refuses a database that isn't on this machine
+    run_benchmarks -- Measures the query counts and latencies of the views
+
+Attributes:
+    QUERY_BUDGETS {Dict[str, int]} -- The most queries each view may run
+        once warmed up
+"""
+from collections import OrderedDict, namedtuple
+import time
+from typing import Callable, Dict, Iterable, List
+import uuid
+
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from Config.models import CanInfo
+from .models import DisposableSummary
+from .stats import percentile
+
+
+QUERY_BUDGETS = OrderedDict([
+    ('home', 4),
+    ('dispose', 3),
+    ('categorize', 5),
+    ('result', 4),
+    ('carousel_vote', 13),
+    ('configlist', 4),
+    ('register', 8),
+])
+
+Fixtures = namedtuple('Fixtures', ['user', 'disposable', 'category'])
+
+# Database hosts on this machine, '' is the default socket
+LOCAL_HOSTS = {'', 'localhost', '127.0.0.1', '::1'}
+
+
+def check_local_database(allow_remote: bool = False) -> None:
+    """Refuses to go on if the default database isn't on this machine
+
+    Keyword Arguments:
+        allow_remote {bool} -- Go on anyway (default: {False})
+
+    Raises:
+        ValueError -- If the database is remote and allow_remote is False
+    """
+    db_settings = connection.settings_dict
+    host = db_settings.get('HOST') or ''
+    if allow_remote or 'sqlite3' in db_settings['ENGINE'] or \
+            host in LOCAL_HOSTS or host.startswith('/'):
+        return
+    raise ValueError(f"The database is on '{host}', these are development tools. "
+                     'Pass --allow-remote-database if that is really what you want')
+
+
+##### Views
+
+def _home(client: Client, fixtures: Fixtures):
+    return client.get(reverse('VoteHandler:home'))
+
+
+def _dispose(client: Client, fixtures: Fixtures):
+    return client.post(reverse('VoteHandler:dispose'),
+                       {'disposable_item': fixtures.disposable.name})
+
+
+def _categorize(client: Client, fixtures: Fixtures):
+    return client.get(reverse('VoteHandler:categorize', args=[fixtures.disposable.name]))
+
+
+def _result(client: Client, fixtures: Fixtures):
+    args = (fixtures.disposable.id, fixtures.category.id)
+    return client.get(reverse('VoteHandler:result', args=args))
+
+
+def _carousel_vote(client: Client, fixtures: Fixtures):
+    return client.post(reverse('VoteHandler:carousel_vote'),
+                       {'disp_item': fixtures.disposable.name, 'vote': fixtures.category.name})
+
+
+def _configlist(client: Client, fixtures: Fixtures):
+    return client.get(reverse('Config:configlist'))
+
+
+def _register(client: Client, fixtures: Fixtures):
+    return client.post(reverse('Config:register', args=[uuid.uuid4()]))
+
+
+_VIEWS: Dict[str, Callable] = {
+    'home': _home,
+    'dispose': _dispose,
+    'categorize': _categorize,
+    'result': _result,
+    'carousel_vote': _carousel_vote,
+    'configlist': _configlist,
+    'register': _register,
+}
+
+
+##### Measuring
+
+def _fixtures() -> Fixtures:
+    can = CanInfo.objects.filter(owner__isnull=False).select_related('owner').order_by('id').first()
+    summary = DisposableSummary.objects.select_related('disposable', 'top_category') \
+                                       .order_by('-total_votes', 'disposable').first()
+    if can is None or summary is None:
+        raise ValueError('Benchmarks need a can and a voted item, '
+                         'run the generate_benchmark_data command first')
+    return Fixtures(user=can.owner, disposable=summary.disposable, category=summary.top_category)
+
+
+def _measure(view: Callable, client: Client, fixtures: Fixtures, repeat: int) -> dict:
+    # The first request warms up the caches and in-process indexes
+    view(client, fixtures)
+
+    queries, latencies, statuses = [], [], set()
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = view(client, fixtures)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+        statuses.add(response.status_code)
+
+    latencies.sort()
+    return {
+        'queries': max(queries),
+        'statuses': sorted(statuses),
+        'latency_ms': {
+            'min': latencies[0],
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'max': latencies[-1],
+        },
+    }
+
+
+def run_benchmarks(repeat: int = 20, views: Iterable[str] = None) -> List[dict]:
+    """Measures the query counts and latencies of the views
+
+    Arguments:
+        repeat {int} -- Measured requests per view, after one warm up request
+
+    Keyword Arguments:
+        views {Iterable[str]} -- The views to measure, defaults to every view
+            in QUERY_BUDGETS (default: {None})
+
+    Raises:
+        ValueError -- If a view is unknown or there is no data to measure with
+
+    Returns:
+        List[dict] -- For each view its name, the most queries one request ran,
+            the budget, whether it was exceeded, the response status codes and
+            the latency percentiles in milliseconds
+    """
+    views = list(QUERY_BUDGETS) if views is None else list(views)
+    unknown = set(views) - set(_VIEWS)
+    if unknown:
+        raise ValueError(f"Unknown views: {', '.join(sorted(unknown))}")
+
+    results = []
+    with transaction.atomic():
+        fixtures = _fixtures()
+        client = Client()
+        client.force_login(fixtures.user)
+        for name in views:
+            measured = _measure(_VIEWS[name], client, fixtures, repeat)
+            budget = QUERY_BUDGETS[name]
+            results.append(OrderedDict([
+                ('view', name),
+                ('queries', measured['queries']),
+                ('budget', budget),
+                ('over_budget', measured['queries'] > budget),
+                ('statuses', measured['statuses']),
+                ('latency_ms', measured['latency_ms']),
+            ]))
+        transaction.set_rollback(True)
+    return results
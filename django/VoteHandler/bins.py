@@ -0,0 +1,53 @@
+"""Helpers for working out which bin of a can accepts a category
+
+Classes:
+    BinRouting -- The category to bin mapping of a single can
+"""
+from typing import Dict, Optional
+
+from django.contrib.auth.models import User
+
+from Config.models import Bin
+
+
+class BinRouting():
+    """The category to bin mapping of a single can
+
+    Arguments:
+        category_bins {Dict[int, int]} -- category id to bin number
+        default_bin {Optional[int]} -- The bin of the can's default category,
+            used when no bin accepts a category
+    """
+
+    def __init__(self, category_bins: Dict[int, int], default_bin: Optional[int] = None):
+        self.category_bins = category_bins
+        self.default_bin = default_bin
+
+    @classmethod
+    def for_user(cls, user: User) -> 'BinRouting':
+        """Loads the routing of the can the user is logged in as in one query
+
+        Arguments:
+            user {User} -- The user account the can is logged in as
+
+        Returns:
+            BinRouting -- The routing, empty if the user has no can
+        """
+        bins = Bin.objects.filter(s_id__owner=user, category__isnull=False).select_related('s_id')
+        category_bins, default_category = {}, None
+        for can_bin in bins:
+            category_bins[can_bin.category_id] = can_bin.bin_num
+            default_category = can_bin.s_id.default_category_id
+        return cls(category_bins, category_bins.get(default_category))
+
+    def get_bin(self, category_id: int) -> Optional[int]:
+        """Returns the bin number that accepts the category
+
+        Arguments:
+            category_id {int} -- The id of the category to look up
+
+        Returns:
+            Optional[int] -- The bin number, the default bin if no bin accepts
+                the category, or None if there is no default bin either
+        """
+        return self.category_bins.get(category_id, self.default_bin)
@@ -0,0 +1,96 @@
+"""Sends a command to many cans at once
+
+Every identified socket joins ALL_CANS_GROUP as well as its can's group, see
+VoteHandler.utils.can_group_name. A broadcast to the whole fleet is a single
+group_send to ALL_CANS_GROUP. A broadcast to some cans skips the cans that
+are offline, with one cache read per batch, and hands each batch of groups to
+the channel dispatcher at once, which sends them concurrently, see
+VoteHandler.dispatch.
+
+Attributes:
+    ALL_CANS_GROUP {str} -- The channel layer group of every identified socket
+
+Functions:
+    broadcast_command -- Sends a command to the SmartCans themselves
+    broadcast_refresh_bins -- Makes the sockets of cans reload their bin routing
+"""
+from itertools import islice
+from typing import Iterable, Optional, Union
+import uuid
+
+from django.conf import settings
+
+from . import presence
+from .dispatch import ChannelDispatcher, channel_dispatcher
+from .utils import can_group_name
+
+
+ALL_CANS_GROUP = 'cans'
+
+
+def broadcast_command(content: dict,
+                      can_ids: Optional[Iterable[Union[str, uuid.UUID]]] = None,
+                      dispatcher: ChannelDispatcher = None) -> Optional[int]:
+    """Sends a command to the SmartCans themselves, ex. {"command": "close"}
+
+    Arguments:
+        content {dict} -- The JSON sent to each can, with a command key
+
+    Keyword Arguments:
+        can_ids {Optional[Iterable[Union[str, uuid.UUID]]]} -- The cans to
+            send to, ex. the can_ids of a filtered CanInfo queryset, None
+            for every can (default: {None})
+        dispatcher {ChannelDispatcher} -- Sends the messages, None for
+            VoteHandler.dispatch.channel_dispatcher (default: {None})
+
+    Returns:
+        Optional[int] -- The number of online cans it was sent to, None when
+            sent to every can
+    """
+    if 'command' not in content:
+        raise ValueError('Broadcast content needs a command')
+    message = {
+        "type": "ws.broadcast",
+        "content": content
+    }
+    return _broadcast(message, can_ids, dispatcher)
+
+
+def broadcast_refresh_bins(can_ids: Optional[Iterable[Union[str, uuid.UUID]]] = None,
+                           dispatcher: ChannelDispatcher = None) -> Optional[int]:
+    """Makes the sockets of cans reload their bin routing, ex. after a new layout
+
+    Keyword Arguments:
+        can_ids {Optional[Iterable[Union[str, uuid.UUID]]]} -- The cans whose
+            bins changed, None for every can (default: {None})
+        dispatcher {ChannelDispatcher} -- Sends the messages, None for
+            VoteHandler.dispatch.channel_dispatcher (default: {None})
+
+    Returns:
+        Optional[int] -- The number of online cans it was sent to, None when
+            sent to every can
+    """
+    message = {
+        "type": "ws.refresh_bins"
+    }
+    return _broadcast(message, can_ids, dispatcher)
+
+
+def _broadcast(message: dict, can_ids: Optional[Iterable[Union[str, uuid.UUID]]],
+               dispatcher: Optional[ChannelDispatcher]) -> Optional[int]:
+    if dispatcher is None:
+        dispatcher = channel_dispatcher
+    if can_ids is None:
+        dispatcher.group_send(ALL_CANS_GROUP, message)
+        return None
+
+    sent = 0
+    can_ids = iter(can_ids)
+    while True:
+        batch = list(islice(can_ids, settings.BROADCAST_BATCH_SIZE))
+        if not batch:
+            return sent
+        online = presence.online_can_ids(batch)
+        if online:
+            dispatcher.group_send_many([can_group_name(can_id) for can_id in online], message)
+            sent += len(online)
@@ -0,0 +1,203 @@
+"""Write-behind buffering of votes for high traffic events
+
+Instead of writing every vote to its DisposableVote row, votes are summed in
+memory per (disposable, category) and written with apply_vote_deltas every
+settings.VOTE_BUFFER_FLUSH_INTERVAL seconds, or as soon as
+settings.VOTE_BUFFER_FLUSH_SIZE votes are waiting. Buffered votes live in the
+memory of the process that received them until they are flushed.
+
+Classes:
+    VoteBuffer -- Sums vote increments in memory and flushes them in bulk
+
+Attributes:
+    vote_buffer {VoteBuffer} -- The process wide buffer used by the views
+"""
+import atexit
+from collections import OrderedDict
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache import Classification
+from .ingestion import apply_vote_deltas
+from .models import Category, Disposable
+from .utils import counts_to_percentages
+
+
+class VoteBuffer():
+    """Sums vote increments in memory and flushes them in bulk
+
+    Arguments:
+        flush_interval {Optional[float]} -- Seconds between background
+            flushes, None to only flush on size or when asked to
+        flush_size {int} -- Number of buffered votes that triggers a flush
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None, flush_size: int = 500):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, int], int] = OrderedDict()
+        self._pending_votes = 0
+        self._flushing: Dict[Tuple[int, int], int] = OrderedDict()
+        # The names of anything with pending votes, so reads can merge them
+        self._disposable_ids: Dict[str, int] = {}
+        self._category_names: Dict[int, str] = {}
+        self._flusher: threading.Thread = None
+
+    ##### Writing
+
+    def add(self, disposable: Disposable, category: Category, weight: int) -> None:
+        """Buffers weight votes for category on disposable
+
+        Flushes when the buffer is full. A failed flush is logged rather than
+        raised, its votes stay buffered for the next flush.
+
+        Arguments:
+            disposable {Disposable} -- The item that was voted on
+            category {Category} -- The category that was voted for
+            weight {int} -- The number of votes, non-positive weights are ignored
+        """
+        if weight <= 0:
+            return
+
+        key = (disposable.id, category.id)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + weight
+            self._pending_votes += weight
+            self._disposable_ids[disposable.name] = disposable.id
+            self._category_names[category.id] = category.name
+            should_flush = self._pending_votes >= self.flush_size
+        self._ensure_flusher()
+
+        if should_flush:
+            # The votes are buffered again if this fails, so the request goes on
+            try:
+                self.flush()
+            except Exception as ex:
+                print(f'Failed to flush buffered votes, will retry. Error: {ex}')
+
+    def flush(self) -> int:
+        """Writes every buffered vote to the database
+
+        Votes being written still count as pending for reads until the write
+        finishes. If the write fails the votes are put back so the next flush
+        retries them.
+
+        Returns:
+            int -- The number of (disposable, category) rows written
+        """
+        with self._lock:
+            if self._flushing or not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, OrderedDict()
+            flushing_votes, self._pending_votes = self._pending_votes, 0
+
+        try:
+            apply_vote_deltas((d_id, c_id, weight)
+                              for (d_id, c_id), weight in self._flushing.items())
+        except Exception:
+            with self._lock:
+                for key, weight in self._flushing.items():
+                    self._pending[key] = self._pending.get(key, 0) + weight
+                self._pending_votes += flushing_votes
+                self._flushing = OrderedDict()
+            raise
+
+        with self._lock:
+            flushed, self._flushing = len(self._flushing), OrderedDict()
+            pending_ids = {d_id for d_id, _ in self._pending}
+            self._disposable_ids = {name: d_id for name, d_id in self._disposable_ids.items()
+                                    if d_id in pending_ids}
+        return flushed
+
+    ##### Reading
+
+    def pending_for(self, disposable_id: int) -> Dict[int, int]:
+        """Returns the buffered votes of a disposable by category id"""
+        pending = {}
+        with self._lock:
+            for buffered in (self._flushing, self._pending):
+                for (d_id, c_id), weight in buffered.items():
+                    if d_id == disposable_id:
+                        pending[c_id] = pending.get(c_id, 0) + weight
+        return pending
+
+    def merge(self, name: str,
+              classification: Optional[Classification]) -> Optional[Classification]:
+        """Returns the classification with the buffered votes added in
+
+        Arguments:
+            name {str} -- The normalized name of the item
+            classification {Optional[Classification]} -- The classification as
+                stored, None if the item has no stored votes
+
+        Returns:
+            Optional[Classification] -- The classification including buffered
+                votes, or None if there are no votes at all
+        """
+        if classification is not None:
+            disposable_id = classification.disposable_id
+        else:
+            with self._lock:
+                disposable_id = self._disposable_ids.get(name)
+            if disposable_id is None:
+                return None
+
+        pending = self.pending_for(disposable_id)
+        if not pending:
+            return classification
+
+        counts = OrderedDict()
+        if classification is not None:
+            for category_id, category_name, count in classification.vote_counts:
+                counts[category_id] = [category_name, count]
+        with self._lock:
+            for category_id, weight in pending.items():
+                counts.setdefault(category_id, [self._category_names[category_id], 0])
+                counts[category_id][1] += weight
+
+        # A stable sort keeps the stored order, and its tie-breaking, for ties
+        rows = sorted(((c_id, c_name, count) for c_id, (c_name, count) in counts.items()),
+                      key=lambda row: row[2], reverse=True)
+        return Classification(
+            disposable_id=disposable_id,
+            top_category_id=rows[0][0],
+            total_votes=sum(count for _, _, count in rows),
+            percentages=counts_to_percentages((c_name, count) for _, c_name, count in rows),
+            vote_counts=rows
+        )
+
+    ##### Background flushing
+
+    def _ensure_flusher(self) -> None:
+        if self.flush_interval is None or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher,
+                                                 name='vote-buffer-flusher',
+                                                 daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as ex:
+                print(f'Failed to flush buffered votes, will retry. Error: {ex}')
+            finally:
+                close_old_connections()
+
+
+vote_buffer = VoteBuffer(
+    flush_interval=settings.VOTE_BUFFER_FLUSH_INTERVAL,
+    flush_size=settings.VOTE_BUFFER_FLUSH_SIZE
+)
+# Don't lose buffered votes on a clean shutdown
+atexit.register(vote_buffer.flush)
@@ -0,0 +1,180 @@
+"""Caching for classification results
+
+Classifications are read from DisposableSummary and kept in Django's cache,
+keyed by the normalized item name. Entries go stale after
+settings.CLASSIFICATION_CACHE_TTL seconds but are kept for another
+settings.CLASSIFICATION_CACHE_STALE_TTL seconds, so when a popular item goes
+stale only one caller recomputes it while everyone else keeps getting the
+stale value.
+
+Classes:
+    Classification -- The cached classification of a disposable
+
+Functions:
+    normalize_name -- Normalizes item text the way cache keys and lookups expect
+    get_classification -- Returns the classification for an item name
+    get_classifications -- Returns the classifications for many item names
+    invalidate_classification -- Drops the cached classification for an item
+"""
+from collections import namedtuple
+import hashlib
+import time
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import DisposableSummary
+
+
+Classification = namedtuple(
+    'Classification',
+    ['disposable_id', 'top_category_id', 'total_votes', 'percentages', 'vote_counts']
+)
+
+# Cached in place of a Classification when the item is missing or has no votes
+_NO_CLASSIFICATION = 'none'
+# How long a recompute may hold the lock before someone else may try
+_LOCK_TIMEOUT_S = 10
+# How long callers with nothing to serve wait for the lock holder
+_WAIT_TIMEOUT_S = 1
+_WAIT_POLL_S = 0.02
+
+
+def normalize_name(name: str) -> str:
+    """Lowercases the name and collapses whitespace"""
+    return ' '.join(name.split()).lower()
+
+
+def _key(name: str, prefix: str = 'classification') -> str:
+    # Hash so user text never produces an invalid key for memcached/redis
+    digest = hashlib.md5(normalize_name(name).encode('utf-8')).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def _compute(name: str) -> Optional[Classification]:
+    try:
+        summary = DisposableSummary.objects.get(disposable__name=normalize_name(name))
+    except DisposableSummary.DoesNotExist:
+        return None
+    return _from_summary(summary)
+
+
+def _from_summary(summary: DisposableSummary) -> Classification:
+    return Classification(
+        disposable_id=summary.disposable_id,
+        top_category_id=summary.top_category_id,
+        total_votes=summary.total_votes,
+        percentages=summary.get_percentages(),
+        vote_counts=summary.get_vote_counts()
+    )
+
+
+def _entry(classification: Optional[Classification]) -> dict:
+    value = _NO_CLASSIFICATION if classification is None else tuple(classification)
+    return {'value': value, 'fresh_until': time.time() + settings.CLASSIFICATION_CACHE_TTL}
+
+
+def _timeout() -> int:
+    return settings.CLASSIFICATION_CACHE_TTL + settings.CLASSIFICATION_CACHE_STALE_TTL
+
+
+def _unpack(entry: dict) -> Optional[Classification]:
+    value = entry['value']
+    return None if value == _NO_CLASSIFICATION else Classification(*value)
+
+
+def _recompute_and_store(name: str) -> Optional[Classification]:
+    classification = _compute(name)
+    cache.set(_key(name), _entry(classification), _timeout())
+    return classification
+
+
+def get_classification(name: str) -> Optional[Classification]:
+    """Returns the classification for an item name
+
+    Only one caller at a time recomputes a given item. While that happens the
+    others are served the stale entry, or wait briefly for the fresh one if
+    there is nothing to serve.
+
+    Arguments:
+        name {str} -- The item name as the user entered it
+
+    Returns:
+        Optional[Classification] -- The classification, or None if the item
+            doesn't exist or doesn't have any votes
+    """
+    key = _key(name)
+    entry = cache.get(key)
+    if entry is not None and entry['fresh_until'] > time.time():
+        return _unpack(entry)
+
+    lock_key = _key(name, prefix='classification-lock')
+    if cache.add(lock_key, 1, _LOCK_TIMEOUT_S):
+        try:
+            return _recompute_and_store(name)
+        finally:
+            cache.delete(lock_key)
+
+    # Somebody else is recomputing
+    if entry is not None:
+        return _unpack(entry)
+    deadline = time.time() + _WAIT_TIMEOUT_S
+    while time.time() < deadline:
+        time.sleep(_WAIT_POLL_S)
+        entry = cache.get(key)
+        if entry is not None:
+            return _unpack(entry)
+    return _compute(name)
+
+
+def get_classifications(names: Iterable[str]) -> Dict[str, Optional[Classification]]:
+    """Returns the classifications for many item names
+
+    Uses one cache round trip and at most one query no matter how many names
+    are asked for. Stale and missing entries are recomputed together without
+    taking the per-item lock, a batch never waits on other callers.
+
+    Arguments:
+        names {Iterable[str]} -- The item names as the user entered them
+
+    Returns:
+        Dict[str, Optional[Classification]] -- Each normalized name mapped to
+            its classification, or None if it doesn't have one
+    """
+    keys = {_key(name): normalize_name(name) for name in names}
+    entries = cache.get_many(list(keys))
+
+    now = time.time()
+    classifications, missing = {}, {}
+    for key, name in keys.items():
+        entry = entries.get(key)
+        if entry is not None and entry['fresh_until'] > now:
+            classifications[name] = _unpack(entry)
+        else:
+            missing[key] = name
+
+    if missing:
+        summaries = DisposableSummary.objects.filter(disposable__name__in=missing.values())
+        found = {summary.disposable.name: _from_summary(summary)
+                 for summary in summaries.select_related('disposable')}
+        for name in missing.values():
+            classifications[name] = found.get(name)
+        cache.set_many({key: _entry(found.get(name)) for key, name in missing.items()},
+                       _timeout())
+    return classifications
+
+
+def invalidate_classification(name: str) -> None:
+    """Drops the cached classification for an item
+
+    The entry is dropped right away and again once the current transaction
+    commits, so a read that raced the vote can't leave the old result cached.
+
+    Arguments:
+        name {str} -- The item name
+    """
+    key = _key(name)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,47 @@
+"""System checks for VoteHandler's settings
+
+Functions:
+    check_presence_cache -- Warns when presence can't be seen across processes
+"""
+from django.conf import settings
+from django.core import checks
+
+
+# Layers that only reach consumers in the same process
+IN_PROCESS_LAYERS = {
+    'channels.layers.InMemoryChannelLayer',
+    'SmartCanAPI.layers.InMemoryChannelLayer',
+}
+# Caches that only hold what was set in the same process
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def check_presence_cache(app_configs=None, **kwargs):
+    """Warns when presence can't be seen across processes
+
+    Presence lives in the default cache, see VoteHandler.presence. With a
+    channel layer shared between processes, like redis, the HTTP process
+    sending a rotate usually isn't the one holding the can's socket, so a
+    cache local to each process sees every can as offline.
+
+    Keyword Arguments:
+        app_configs {list} -- The apps being checked, unused (default: {None})
+
+    Returns:
+        list -- VoteHandler.W001 if the cache is local, otherwise empty
+    """
+    layer = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND')
+    cache = settings.CACHES.get('default', {}).get('BACKEND')
+    if layer is None or layer in IN_PROCESS_LAYERS or cache not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Warning(
+        'Presence is kept in a cache local to each process, but the channel '
+        'layer is shared between processes.',
+        hint='Set REDIS_CACHE_URL so every process sees the same cans online, or '
+             'serve HTTP and websockets from one process with CHANNEL_LAYER=memory. '
+             'Otherwise rotates sent from another process are dropped as offline.',
+        id='VoteHandler.W001',
+    )]
@@ -1,42 +1,118 @@
-from channels.generic.websocket import JsonWebsocketConsumer
-from contextlib import suppress
+"""Websocket consumers that send commands to SmartCans
 
+Classes:
+    AsyncCommanderConsumer -- The consumer for ws/, DB access runs in a
+        thread pool only when needed
+
+Functions:
+    rotate_command -- Returns the rotate command for the bin of a can that
+        accepts a category
+"""
+import asyncio
+import time
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 
-from Config.models import Bin, CanInfo
-from .models import Category
+from Config.models import CanInfo
+from . import presence, wire
+from .admission import login_limiter
+from .bins import BinRouting
+from .broadcast import ALL_CANS_GROUP
+from .delivery import DONE, QUEUED, CommandWindow
 from .exceptions import ClientError
+from .metrics import PingTracker, record_latency
+from .resume import make_resume_token, resume
+from .utils import can_group_name
+
+
+def rotate_command(routing: BinRouting, category_id: int) -> Optional[dict]:
+    """Returns the rotate command for the bin of a can that accepts a category
+
+    Falls back to the bin of the can's default category.
+
+    Arguments:
+        routing {BinRouting} -- The can's bins
+        category_id {int} -- The id of the category to find a bin for
+
+    Returns:
+        Optional[dict] -- The command, or None if neither the category nor
+            the default category has a bin on the can
+    """
+    bin_num = routing.get_bin(category_id)
+    if bin_num is None:
+        print(f'No matching bin or default bin for category {category_id}')
+        return None
+    if category_id not in routing.category_bins:
+        print(f'No matching bin for category {category_id}, defaulting to bin {bin_num}')
+    return {
+        "command": "rotate",
+        "position" : str(bin_num)
+    }
 
 
-class CommanderConsumer(JsonWebsocketConsumer):
+class AsyncCommanderConsumer(AsyncJsonWebsocketConsumer):
     """
     This class represents the consumer sending commands to a SmartCan instance.
     Each instance can be thought of as representing the communication line
     between django and a particular SmartCan.
     So there should be one instnace of this class per connected SmartCan.
+    Idle cans only cost a coroutine rather than a worker thread, and the ORM
+    is only used, from the thread pool, to identify and to load the bins.
     """
     # TODO: Move these CientError constants and the ws constants to a new file
     CONFIG_IS_NONE = "CONFIG_IS_NONE"
     LOGIN_REJECTED = "LOGIN_REJECTED"
     NO_CONFIG_EXISTS = "NO_CONFIG_EXISTS"
+    OVERLOADED = "OVERLOADED"
+    RESUME_REJECTED = "RESUME_REJECTED"
     UNKNOWN_CMD = "UNKNOWN_COMMAND"
+    # Sent when closing the socket of a can turned away, see VoteHandler.admission
+    OVERLOADED_CLOSE_CODE = 4003
+    # Sent when closing the socket of a can that failed to log in
+    LOGIN_REJECTED_CLOSE_CODE = 4001
+    # Sent when closing the socket of a can that stopped answering pings
+    PING_TIMEOUT_CLOSE_CODE = 4002
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.can_info: CanInfo = None
+        self.commands: CommandWindow = None
+        self.encoding = wire.JSON
+        self.pings = PingTracker(settings.LATENCY_WINDOW)
+        self._ping_task: asyncio.Future = None
+        self._retry_task: asyncio.Future = None
+        self.routing: BinRouting = None
         self.user: User = None
 
     ##### Websocket event handlers
 
-    def connect(self) -> None:
+    async def connect(self) -> None:
         '''Called when the ws is handshaking'''
-        # Just accept any connection, then ask it to authenticate
-        self.accept()
-        self.ask_for_identity()
+        await self.accept()
+        await self.ask_for_identity()
         print(f'Unknown client has connected on channel \'{self.channel_name}\'')
 
-    def receive_json(self, content) -> None:
+    async def receive(self, text_data=None, bytes_data=None, **kwargs) -> None:
+        """Decodes binary frames too, see VoteHandler.wire"""
+        if text_data is None and bytes_data is not None:
+            await self.receive_json(wire.decode(bytes_data), **kwargs)
+        else:
+            await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    async def send_json(self, content, close=False) -> None:
+        """Sends in the encoding picked at identify, see VoteHandler.wire"""
+        if self.encoding == wire.MSGPACK:
+            await self.send(bytes_data=wire.encode(content), close=close)
+        else:
+            await super().send_json(content, close=close)
+
+    async def receive_json(self, content, **kwargs) -> None:
         """
         Called when we receive a text frame.
         Channels handles decoding the JSON and gives us it as content.
@@ -47,71 +123,146 @@ class CommanderConsumer(JsonWebsocketConsumer):
         command = content.get("command", None)
 
         # If the aren't authed just keep asking for valid credentials
-        # In a production system we would want logic to prevent brute forcing
         if not self.authed() and command != 'identify':
-            self.ask_for_identity()
+            await self.ask_for_identity()
+            return
 
         try:
             if command == 'identify':
-                self.identify(content)
+                await self.identify(content)
+            elif command == 'heartbeat':
+                await self.heartbeat()
+            elif command == 'pong':
+                await self.pong(content)
+            elif command == 'ack':
+                await self.ack(content)
             elif command == 'echo':
-                self.echo(content)
+                await self.echo(content)
             else:
                 raise ClientError(self.UNKNOWN_CMD)
         except ClientError as c_e:
-            # send the error code to the can
-            self.send_json({'error': c_e.code})
+            await self.send_json(self.error_message(c_e.code))
             if c_e.code == self.LOGIN_REJECTED:
-                self.disconnect(401)
+                await self.close(code=self.LOGIN_REJECTED_CLOSE_CODE)
+            elif c_e.code == self.OVERLOADED:
+                await self.close(code=self.OVERLOADED_CLOSE_CODE)
+            elif c_e.code == self.RESUME_REJECTED:
+                # Let the can log in with its password instead
+                await self.ask_for_identity()
 
-    def disconnect(self, code) -> None:
+    async def disconnect(self, code) -> None:
         print(f'Websocket \'{self.channel_name}\' disconnected with code {code}')
-        if self.authed():
-            try:
-                self.remove_config_cn()
-            except ClientError:
-                pass
+        for task in (self._ping_task, self._retry_task):
+            if task is not None:
+                task.cancel()
+        if self.commands is not None and self.commands.unacked:
+            print(f'{self.commands.unacked} commands were never acked by {self.channel_name}')
+        if self.can_info is not None:
+            await sync_to_async(presence.mark_offline)(self.can_info.can_id, self.channel_name)
+            await self.channel_layer.group_discard(can_group_name(self.can_info.can_id),
+                                                   self.channel_name)
+            await self.channel_layer.group_discard(ALL_CANS_GROUP, self.channel_name)
 
     ##### Helpers for receive_json
 
-    def echo(self, content: dict) -> None:
-        '''
-        Simply echos back a message so we can do simple testing.
-        '''
-        self.send_json({'message': content.get('message')})
+    async def heartbeat(self) -> None:
+        """Keeps the can online, see VoteHandler.presence"""
+        if self.can_info is None:
+            raise ClientError(self.NO_CONFIG_EXISTS)
+        await sync_to_async(presence.mark_online)(self.can_info.can_id, self.channel_name)
+        await self.join_groups()
+
+    async def pong(self, content: dict) -> None:
+        """Records the round trip time of a ping, see VoteHandler.metrics"""
+        if self.can_info is None:
+            raise ClientError(self.NO_CONFIG_EXISTS)
+        if self.pings.pong(content.get('id')) is not None:
+            await sync_to_async(record_latency)(self.can_info.can_id,
+                                                self.pings.latencies.summary())
+
+    async def ack(self, content: dict) -> None:
+        """Records the ack of a command, see VoteHandler.delivery"""
+        if self.commands is None:
+            raise ClientError(self.UNKNOWN_CMD)
+        status = content.get('status')
+        await self._send_commands(self.commands.ack(content.get('seq'), status))
+        if status == QUEUED and len(self.commands.delivery):
+            await sync_to_async(record_latency)(self.can_info.can_id,
+                                                self.commands.delivery.summary(), 'delivery')
+        elif status == DONE and len(self.commands.completion):
+            await sync_to_async(record_latency)(self.can_info.can_id,
+                                                self.commands.completion.summary(), 'completion')
+
+    async def echo(self, content: dict) -> None:
+        '''Simply echos back a message so we can do simple testing.'''
+        await self.send_json({'message': content.get('message')})
 
-    def identify(self, content: dict) -> None:
+    async def identify(self, content: dict) -> None:
         '''
         Called when a can attempts to identify.
         If the credentials are valid, self.user gets a value.
         Raises ClientError if credentials are invalid
         '''
+        if content.get('token') is not None:
+            await self.resume(content['token'])
+        else:
+            await self.log_in(content)
+        username = self.user.username
+        # Join before loading, so a bin change in between still refreshes us
+        await self.join_groups()
+        self.routing = await database_sync_to_async(BinRouting.for_user)(self.user)
+        await sync_to_async(presence.mark_online)(self.can_info.can_id, self.channel_name)
+        await self.send_info(f'Authentication as {username} was succesful')
+        await self.send_heartbeat_interval()
+        await self.send_resume_token()
+        if 'encodings' in content:
+            await self.switch_encoding(wire.negotiate(content['encodings']))
+        if content.get('acks') and self.commands is None:
+            self.commands = CommandWindow(settings.COMMAND_WINDOW, settings.COMMAND_ACK_TIMEOUT,
+                                          settings.COMMAND_MAX_ATTEMPTS, settings.LATENCY_WINDOW)
+        if self._ping_task is None:
+            self._ping_task = asyncio.ensure_future(self._ping_loop())
+
+    async def join_groups(self) -> None:
+        """Joins the groups rotates and broadcasts are sent to, again on each heartbeat"""
+        await self.channel_layer.group_add(can_group_name(self.can_info.can_id),
+                                           self.channel_name)
+        await self.channel_layer.group_add(ALL_CANS_GROUP, self.channel_name)
+
+    async def log_in(self, content: dict) -> None:
+        """Identifies the can by its username and password"""
         username = content.get('username')
         password = content.get('password')
 
-        # user is None if the login fails
-        self.user = authenticate(username=username, password=password)
-
-        # Kick them off, politely
+        if not login_limiter.try_acquire():
+            print(f'Turned away {username}, too many cans are logging in')
+            raise ClientError(self.OVERLOADED)
+        try:
+            # Password hashing is slow on purpose, keep it off the event loop too
+            self.user = await database_sync_to_async(authenticate)(
+                username=username, password=password
+            )
+        finally:
+            login_limiter.release()
         if not self.authed():
             print(f'Unknown client failed to identify as {username}')
             raise ClientError(self.LOGIN_REJECTED)
 
         print(f'Client successfully identified as {username}')
-        self.can_info = CanInfo.objects.get(owner=self.user)
-        self.set_channel_name()
-        self.send_info(f'Authentication as {username} was succesful')
+        self.can_info = await database_sync_to_async(self._get_can_info)()
 
-    ##### Handlers for messages sent over the channel layer
-
-        # These helper methods are named by the types we send
-        # ex. chat.join becomes chat_join
-        # They're how we receive messages from other consumers in django
+    async def resume(self, token: str) -> None:
+        """Identifies the can by a resume token, see VoteHandler.resume"""
+        can = await database_sync_to_async(resume)(token)
+        if can is None:
+            print('Unknown client failed to resume')
+            raise ClientError(self.RESUME_REJECTED)
+        self.user, self.can_info = can
+        print(f'Client successfully resumed as {self.user.username}')
 
-        # These will be called if we want to operate on our Consumer from
-        # somewhere else in the application
+    ##### Handlers for messages sent over the channel layer
 
-    def ws_rotate(self, event):
+    async def ws_rotate(self, event):
         """
         Send the bin number for the SmartCan to rotate to based on the
         category provided.
@@ -124,40 +275,28 @@ class CommanderConsumer(JsonWebsocketConsumer):
         if event.get('category') is None:
             raise ValueError("category cannot be None or empty")
 
-        try:
-            bin_num = None
-            category = event['category']
-            category_name = Category.objects.get(id=category).name
-            with suppress(Bin.DoesNotExist):
-                bin_num = Bin.objects.get(s_id=self.can_info, category=category).bin_num
-            
-            # If no matching bin was found, try the default bin
-            if bin_num is None:
-                default_cat = self.can_info.default_category
-                bin_num = Bin.objects.get(s_id=self.can_info, category=default_cat).bin_num
-                print(f'No matching bin for {category_name} on can {self.can_info}, '
-                      f'defaulting to {default_cat} in bin {bin_num}')
-        except Bin.DoesNotExist:
-            print(f'No matching default bin for category {default_cat} on bin {self.can_info}')
-            return
-        except Category.DoesNotExist:
-            print(f'Cannot send category to {self.can_info}. No category exists with id {category}')
+        command = rotate_command(self.routing, event['category'])
+        if command is None:
             return
 
-        print(f'DEBUG: Sending command to rotate to bin #{bin_num} on {self.channel_name}')
-        self.send_json({
-            "command": "rotate",
-            "position" : str(bin_num)
-        })
+        print(f'DEBUG: Sending command to rotate to bin #{command["position"]} on {self.channel_name}')
+        await self.send_command(command)
+
+    async def ws_refresh_bins(self, event):
+        """Reloads the bin routing after the can's bins were changed"""
+        if self.authed():
+            self.routing = await database_sync_to_async(BinRouting.for_user)(self.user)
+
+    async def ws_broadcast(self, event):
+        """Passes a command sent to many cans on to the SmartCan, see VoteHandler.broadcast"""
+        if self.can_info is not None:
+            await self.send_command(event['content'])
 
     ##### Other funcs
 
-    def ask_for_identity(self) -> None:
-        """
-        Ask the SmartCan to send us back its uuid and password.
-        SmartCan should respond with an identify.
-        """
-        self.send_json({
+    async def ask_for_identity(self) -> None:
+        """Ask the SmartCan to send us back its uuid and password."""
+        await self.send_json({
             "command": "identify"
         })
 
@@ -165,29 +304,87 @@ class CommanderConsumer(JsonWebsocketConsumer):
         '''Whether or not there is a valid user assosciated with this socket'''
         return self.user is not None
 
-    def remove_config_cn(self) -> None:
-        """
-        Removes the unique channel name from the Config for this can.
-        Raises a ClientError if there is not already a can_info set.
-        """
-        if self.can_info is None or self.can_info.channel_name is None:
-            raise ClientError(self.NO_CONFIG_EXISTS)
-        self.can_info.channel_name = None
-        self.can_info.save()
-
-    def send_info(self, msg) -> None:
+    async def send_info(self, msg) -> None:
         '''Sends an information sting to the client. Useful for debugging.'''
-        self.send_json({
+        await self.send_json({
             "command": "info",
             "message": msg
         })
 
-    def set_channel_name(self) -> None:
-        """
-        Set the unique channel name from the Config for this can.
-        Raises a ClientError if the operation fails.
-        """
-        if self.can_info is None:
+    async def send_heartbeat_interval(self) -> None:
+        """Tell the SmartCan how often to send a heartbeat to stay online"""
+        await self.send_json({
+            "command": "heartbeat",
+            "interval": settings.PRESENCE_HEARTBEAT_INTERVAL
+        })
+
+    async def send_resume_token(self) -> None:
+        """Give the SmartCan a token to identify with when it reconnects"""
+        await self.send_json({
+            "command": "resume_token",
+            "token": make_resume_token(self.user)
+        })
+
+    async def switch_encoding(self, encoding: str) -> None:
+        """Tell the SmartCan which encoding we send in from now on"""
+        await self.send_json({
+            "command": "encoding",
+            "encoding": encoding
+        })
+        self.encoding = encoding
+
+    @classmethod
+    def error_message(cls, code: str) -> dict:
+        """The message telling the SmartCan about an error"""
+        message = {'error': code}
+        if code == cls.OVERLOADED:
+            # When to try again, the can adds jitter of its own
+            message['retry_after'] = settings.RECONNECT_RETRY_AFTER
+        return message
+
+    async def send_command(self, command: dict) -> None:
+        """Sends a command, numbered and tracked if the SmartCan acks them"""
+        if self.commands is None:
+            await self.send_json(command)
+            return
+        await self._send_commands(self.commands.push(command))
+
+    async def _send_commands(self, commands) -> None:
+        for command in commands:
+            await self.send_json(command)
+        # Something is in flight, make sure it gets resent if it isn't acked
+        if self.commands.next_due() is not None and (self._retry_task is None or
+                                                     self._retry_task.done()):
+            self._retry_task = asyncio.ensure_future(self._retry_loop())
+
+    async def _retry_loop(self) -> None:
+        """Resends unacked commands until nothing is in flight"""
+        while True:
+            due_at = self.commands.next_due()
+            if due_at is None:
+                return
+            await asyncio.sleep(max(due_at - time.monotonic(), 0))
+            for command in self.commands.due():
+                await self.send_json(command)
+
+    async def _ping_loop(self) -> None:
+        """Pings the can every PING_INTERVAL and closes the socket once it
+        has missed PING_MISSED_LIMIT pings, so half-open sockets go offline
+        quickly instead of when their presence expires"""
+        while True:
+            await asyncio.sleep(settings.PING_INTERVAL)
+            if self.pings.unanswered >= settings.PING_MISSED_LIMIT:
+                print(f'No pong from {self.channel_name} for {self.pings.unanswered} pings, '
+                      f'closing it')
+                await sync_to_async(presence.mark_offline)(self.can_info.can_id,
+                                                           self.channel_name)
+                await self.close(code=self.PING_TIMEOUT_CLOSE_CODE)
+                return
+            await self.send_json(self.pings.ping(settings.PING_INTERVAL))
+
+    def _get_can_info(self) -> CanInfo:
+        """Loads the can of self.user"""
+        try:
+            return CanInfo.objects.get(owner=self.user)
+        except CanInfo.DoesNotExist:
             raise ClientError(self.NO_CONFIG_EXISTS)
-        self.can_info.channel_name = self.channel_name
-        self.can_info.save()
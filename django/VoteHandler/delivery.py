@@ -0,0 +1,142 @@
+"""Acknowledged, sequenced delivery of commands to a can
+
+Cans that identify with {"acks": true} get every command with a seq number
+that increases per socket. The can acks each one with
+{"command": "ack", "seq": n, "status": "queued"} once it has queued the
+command, "rejected" if it couldn't, and for rotates again with "done" or
+"failed" once the lids have moved. Up to a window of commands are in flight
+at once. An in flight command without an ack is resent after a timeout, the
+can drops the duplicates, and is given up on after a number of attempts.
+
+Attributes:
+    QUEUED, REJECTED, DONE, FAILED {str} -- The statuses of an ack
+
+Classes:
+    CommandWindow -- Numbers a socket's commands and tracks them until acked
+"""
+from collections import OrderedDict, deque
+import time
+from typing import Deque, Dict, List, Optional
+
+from .metrics import RollingPercentiles
+
+
+QUEUED = 'queued'
+REJECTED = 'rejected'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class CommandWindow():
+    """Numbers a socket's commands and tracks them until the can acks them
+
+    Keyword Arguments:
+        window {int} -- The most commands in flight at once (default: {4})
+        ack_timeout {float} -- Seconds to wait for an ack before resending
+            (default: {5})
+        max_attempts {int} -- Sends of a command before giving up on it
+            (default: {3})
+        latency_window {int} -- The number of latencies kept (default: {100})
+    """
+
+    # The most commands that were queued and may still report done
+    _MAX_COMPLETING = 64
+
+    def __init__(self, window: int = 4, ack_timeout: float = 5, max_attempts: int = 3,
+                 latency_window: int = 100):
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        # Milliseconds from first sending a command to it being queued, and done
+        self.delivery = RollingPercentiles(latency_window)
+        self.completion = RollingPercentiles(latency_window)
+        self.rejected = 0
+        self.lost = 0
+        self._next_seq = 0
+        self._waiting: Deque[dict] = deque()
+        # seq: [command, first sent, last sent, attempts]
+        self._in_flight: Dict[int, list] = OrderedDict()
+        # seq: first sent, for commands that are queued but not done yet
+        self._completing: Dict[int, float] = OrderedDict()
+
+    @property
+    def unacked(self) -> int:
+        """The number of commands in flight or waiting for room in the window"""
+        return len(self._in_flight) + len(self._waiting)
+
+    def push(self, command: dict) -> List[dict]:
+        """Numbers a command and returns the commands to send now
+
+        Arguments:
+            command {dict} -- The command, without a seq
+
+        Returns:
+            List[dict] -- The command if the window has room, otherwise nothing
+                until an ack makes room
+        """
+        self._next_seq += 1
+        self._waiting.append(dict(command, seq=self._next_seq))
+        return self._fill()
+
+    def ack(self, seq, status: str) -> List[dict]:
+        """Records an ack and returns the commands to send now it made room
+
+        Arguments:
+            seq -- The seq of the acked command
+            status {str} -- QUEUED, REJECTED, DONE or FAILED
+
+        Returns:
+            List[dict] -- Commands that were waiting for room in the window
+        """
+        now = time.monotonic()
+        entry = self._in_flight.pop(seq, None)
+        if entry is not None:
+            first_sent = entry[1]
+            if status == REJECTED:
+                self.rejected += 1
+                print(f'Can rejected command #{seq}: {entry[0]}')
+            else:
+                # A done or failed ack also means the lost queued ack arrived
+                self.delivery.add((now - first_sent) * 1000)
+                self._completing[seq] = first_sent
+                while len(self._completing) > self._MAX_COMPLETING:
+                    self._completing.popitem(last=False)
+
+        if status in (DONE, FAILED):
+            first_sent = self._completing.pop(seq, None)
+            if first_sent is not None and status == DONE:
+                self.completion.add((now - first_sent) * 1000)
+        return self._fill(now)
+
+    def due(self) -> List[dict]:
+        """Returns the in flight commands to resend, giving up on the ones
+        that were sent max_attempts times already"""
+        now = time.monotonic()
+        resend = []
+        for seq, entry in list(self._in_flight.items()):
+            if entry[2] + self.ack_timeout > now:
+                continue
+            if entry[3] >= self.max_attempts:
+                del self._in_flight[seq]
+                self.lost += 1
+                print(f'Giving up on command #{seq} after {entry[3]} attempts: {entry[0]}')
+                continue
+            entry[2] = now
+            entry[3] += 1
+            resend.append(entry[0])
+        return resend + self._fill(now)
+
+    def next_due(self) -> Optional[float]:
+        """The time.monotonic() at which due has something to do, None if nothing is in flight"""
+        if not self._in_flight:
+            return None
+        return min(entry[2] for entry in self._in_flight.values()) + self.ack_timeout
+
+    def _fill(self, now: float = None) -> List[dict]:
+        now = time.monotonic() if now is None else now
+        send = []
+        while self._waiting and len(self._in_flight) < self.window:
+            command = self._waiting.popleft()
+            self._in_flight[command['seq']] = [command, now, now, 1]
+            send.append(command)
+        return send
@@ -0,0 +1,194 @@
+"""Sends channel layer messages without making the request wait for them
+
+A group_send from a view has to bridge to an event loop with async_to_sync
+and wait on a round trip to redis before the response can go out. Views
+instead hand their messages to a ChannelDispatcher, whose background thread
+keeps one event loop, and so one set of channel layer connections, alive and
+sends whatever has queued up concurrently.
+
+channels_redis ties its connection pools to the event loop that opened them,
+so the background thread sends from a channel layer of its own rather than
+the process wide one the consumers use. The in memory layers keep their
+groups on the instance and don't hold connections, so they are shared.
+
+Messages to the same group are sent in the order they were queued, so a can
+reloads its bins before rotating for a category that just moved. Messages
+are fire-and-forget: a message that fails to send is logged and dropped, like
+a rotate sent to a can that just went offline.
+
+Classes:
+    ChannelDispatcher -- Sends group messages from a background thread
+
+Attributes:
+    channel_dispatcher {ChannelDispatcher} -- The process wide dispatcher
+        used by the views
+"""
+import asyncio
+import atexit
+from collections import OrderedDict
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import InMemoryChannelLayer, channel_layers, get_channel_layer
+from django.conf import settings
+
+from SmartCanAPI.layers import InMemoryChannelLayer as TestChannelLayer
+
+
+# Layers whose state lives on the instance, which have to be shared to be seen
+_IN_PROCESS_LAYERS = (InMemoryChannelLayer, TestChannelLayer)
+
+
+class ChannelDispatcher():
+    """Sends group messages from a background thread
+
+    Keyword Arguments:
+        background {bool} -- Send from the background thread, False sends
+            right away on the calling thread (default: {True})
+        max_queued {int} -- The most messages waiting to be sent, messages
+            sent while the queue is full are dropped (default: {1000})
+    """
+
+    def __init__(self, background: bool = True, max_queued: int = 1000):
+        self.background = background
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._sender: threading.Thread = None
+        # The sender's own channel layer, and the shared one it was made for
+        self._sender_layer = None
+        self._made_for = None
+
+    def group_send(self, group: str, message: dict) -> bool:
+        """Sends message to every channel in group
+
+        Arguments:
+            group {str} -- The channel layer group
+            message {dict} -- The message, with a type naming the handler
+
+        Returns:
+            bool -- False if the message was dropped because the queue is full
+                or there is no channel layer, True otherwise
+        """
+        return self.group_send_many([group], message)
+
+    def group_send_many(self, groups: List[str], message: dict) -> bool:
+        """Sends message to every channel in each of groups, concurrently
+
+        The groups take up a single place in the queue.
+
+        Arguments:
+            groups {List[str]} -- The channel layer groups
+            message {dict} -- The message, with a type naming the handler
+
+        Returns:
+            bool -- False if the message was dropped because the queue is full
+                or there is no channel layer, True otherwise
+        """
+        if not self.background:
+            channel_layer = get_channel_layer()
+            if channel_layer is None:
+                return False
+            for group in groups:
+                async_to_sync(channel_layer.group_send)(group, message)
+            return True
+
+        self._ensure_sender()
+        try:
+            self._queue.put_nowait((list(groups), message))
+        except queue.Full:
+            print(f'Dispatch queue is full, dropping {message.get("type")} '
+                  f'for {len(groups)} groups')
+            return False
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every queued message has been sent or dropped
+
+        Keyword Arguments:
+            timeout {Optional[float]} -- Seconds to wait at most, None to wait
+                as long as it takes (default: {None})
+
+        Returns:
+            bool -- True if the queue was emptied in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    ##### Background sending
+
+    def _ensure_sender(self) -> None:
+        if self._sender is not None:
+            return
+        with self._lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._run_sender,
+                                                name='channel-dispatcher',
+                                                daemon=True)
+                self._sender.start()
+
+    def _run_sender(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            # Block for the first message, then take everything else waiting
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                loop.run_until_complete(self._send_batch(batch))
+            except Exception as ex:
+                print(f'Failed to dispatch {len(batch)} messages. Error: {ex}')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _get_sender_layer(self):
+        # Looked up per batch, so tests that override CHANNEL_LAYERS are followed
+        shared = get_channel_layer()
+        if shared is None or isinstance(shared, _IN_PROCESS_LAYERS):
+            return shared
+        if self._made_for is not shared:
+            # Only ever used on the sender's loop, so its pools are opened there
+            self._sender_layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+            self._made_for = shared
+        return self._sender_layer
+
+    async def _send_batch(self, batch: List[Tuple[List[str], dict]]) -> None:
+        channel_layer = self._get_sender_layer()
+        if channel_layer is None:
+            return
+        by_group: Dict[str, List[dict]] = OrderedDict()
+        for groups, message in batch:
+            for group in groups:
+                by_group.setdefault(group, []).append(message)
+
+        async def send_in_order(group, messages):
+            for message in messages:
+                try:
+                    await channel_layer.group_send(group, message)
+                except Exception as ex:
+                    print(f'Failed to send {message.get("type")} to {group}. Error: {ex!r}')
+
+        await asyncio.gather(*[send_in_order(group, messages)
+                               for group, messages in by_group.items()])
+
+
+channel_dispatcher = ChannelDispatcher(
+    background=settings.CHANNEL_DISPATCH_BACKGROUND,
+    max_queued=settings.CHANNEL_DISPATCH_MAX_QUEUED
+)
+# Give queued rotates a moment to go out on a clean shutdown
+atexit.register(channel_dispatcher.join, 1)
@@ -0,0 +1,172 @@
+"""Vote ingestion for categorization
+
+Votes are applied with database-side increments so concurrent voters never
+lose each other's votes, and a whole batch is applied in one transaction.
+
+Functions:
+    apply_vote_deltas -- Atomically adds vote weights to DisposableVote counts
+    ingest_votes -- Resolves (disposable, category, weight) name tuples and
+        applies them as one batch
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .cache import normalize_name
+from .models import Category, Disposable, DisposableVote
+from .utils import update_disposable_summary
+
+
+def _coalesce(deltas: Iterable[Tuple[int, int, int]]) -> Dict[Tuple[int, int], int]:
+    """Sums the weights of deltas that target the same DisposableVote row"""
+    coalesced = OrderedDict()
+    for disposable_id, category_id, weight in deltas:
+        if weight <= 0:
+            continue
+        key = (disposable_id, category_id)
+        coalesced[key] = coalesced.get(key, 0) + weight
+    return coalesced
+
+
+def _upsert_mysql(coalesced: Dict[Tuple[int, int], int]) -> None:
+    """Applies every delta in a single INSERT ... ON DUPLICATE KEY UPDATE"""
+    meta = DisposableVote._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    disposable_col = quote(meta.get_field('disposable').column)
+    category_col = quote(meta.get_field('category').column)
+    count_col = quote(meta.get_field('count').column)
+
+    rows = ', '.join(['(%s, %s, %s)'] * len(coalesced))
+    params = [value for (d_id, c_id), weight in coalesced.items() for value in (d_id, c_id, weight)]
+    sql = (f'INSERT INTO {table} ({disposable_col}, {category_col}, {count_col}) '
+           f'VALUES {rows} '
+           f'ON DUPLICATE KEY UPDATE {count_col} = {count_col} + VALUES({count_col})')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _upsert_portable(coalesced: Dict[Tuple[int, int], int]) -> None:
+    """Applies each delta with an F() increment, creating missing rows"""
+    for (disposable_id, category_id), weight in coalesced.items():
+        votes = DisposableVote.objects.filter(disposable=disposable_id, category=category_id)
+        if votes.update(count=F('count') + weight):
+            continue
+        try:
+            # Savepoint so a lost creation race doesn't break the batch
+            with transaction.atomic():
+                DisposableVote.objects.bulk_create([DisposableVote(
+                    disposable_id=disposable_id, category_id=category_id, count=weight
+                )])
+        except IntegrityError:
+            votes.update(count=F('count') + weight)
+
+
+def apply_vote_deltas(deltas: Iterable[Tuple[int, int, int]]) -> Dict[Tuple[int, int], int]:
+    """Atomically adds vote weights to DisposableVote counts
+
+    Deltas for the same disposable and category are merged, non-positive
+    weights are ignored, missing rows are created, and the summaries of every
+    touched disposable are rebuilt, all in a single transaction.
+
+    Arguments:
+        deltas {Iterable[Tuple[int, int, int]]} -- (disposable_id, category_id,
+            weight) tuples
+
+    Returns:
+        Dict[Tuple[int, int], int] -- The weight that was applied for each
+            (disposable_id, category_id) pair
+    """
+    coalesced = _coalesce(deltas)
+    if not coalesced:
+        return coalesced
+
+    with transaction.atomic():
+        if connection.vendor == 'mysql':
+            _upsert_mysql(coalesced)
+        else:
+            _upsert_portable(coalesced)
+
+        # Bulk writes skip the DisposableVote signals, so rebuild here
+        for disposable_id in sorted({d_id for d_id, _ in coalesced}):
+            update_disposable_summary(disposable_id)
+    return coalesced
+
+
+def ingest_votes(votes: Iterable[Tuple]) -> Tuple[int, List[dict]]:
+    """Resolves (disposable, category, weight) name tuples and applies them
+
+    Disposables that don't exist yet are created, so votes queued while a
+    kiosk was offline aren't lost. They are created in the same transaction
+    the votes are applied in, so a failed batch leaves nothing behind. The
+    weight may be omitted, in which case settings.CATEGORIZE_VOTE_WEIGHT is
+    used, and must be positive.
+
+    Arguments:
+        votes {Iterable[Tuple]} -- (disposable_name, category_name[, weight])
+
+    Returns:
+        Tuple[int, List[dict]] -- The number of votes applied and a list of
+            {'index', 'error'} dicts for the entries that were rejected
+    """
+    parsed, rejected = [], []
+    for index, vote in enumerate(votes):
+        try:
+            disposable_name, category_name, *rest = vote
+            weight = rest[0] if rest else settings.CATEGORIZE_VOTE_WEIGHT
+            if len(rest) > 1 or not isinstance(weight, int) or isinstance(weight, bool):
+                raise ValueError
+        except (TypeError, ValueError):
+            rejected.append({'index': index,
+                             'error': 'Expected [disposable, category] or '
+                                      '[disposable, category, weight]'})
+            continue
+        if weight <= 0:
+            rejected.append({'index': index, 'error': 'The weight must be positive'})
+            continue
+        parsed.append((index, normalize_name(str(disposable_name)), str(category_name), weight))
+
+    names = {disposable_name for _, disposable_name, _, _ in parsed}
+    disposable_ids = dict(Disposable.objects.filter(name__in=names).values_list('name', 'id'))
+    category_ids = dict(
+        Category.objects.filter(name__in={c_name for _, _, c_name, _ in parsed})
+        .values_list('name', 'id')
+    )
+
+    accepted = []
+    for index, disposable_name, category_name, weight in parsed:
+        category_id = category_ids.get(category_name)
+        if category_id is None:
+            rejected.append({'index': index, 'error': f"Unknown category '{category_name}'"})
+            continue
+        accepted.append((disposable_name, category_id, weight))
+
+    with transaction.atomic():
+        missing = {disposable_name for disposable_name, _, _ in accepted} - set(disposable_ids)
+        if missing:
+            _create_disposables(missing)
+            disposable_ids.update(Disposable.objects.filter(name__in=missing)
+                                  .values_list('name', 'id'))
+        apply_vote_deltas([(disposable_ids[disposable_name], category_id, weight)
+                           for disposable_name, category_id, weight in accepted])
+    rejected.sort(key=lambda error: error['index'])
+    return len(accepted), rejected
+
+
+def _create_disposables(names: Iterable[str]) -> None:
+    """Creates disposables for already normalized names, in one query
+
+    Bulk creates skip the post_save signal, the name indexes pick the new rows
+    up on their next refresh.
+    """
+    names = sorted(names)
+    try:
+        with transaction.atomic():
+            Disposable.objects.bulk_create([Disposable(name=name) for name in names])
+    except IntegrityError:
+        # Another request created some of them first
+        for name in names:
+            Disposable.objects.get_or_create(name=name)
@@ -0,0 +1,258 @@
+"""An asyncio HTTP load generator for the dispose and vote flow
+
+Every virtual kiosk logs in as its own can and repeatedly runs the flow a
+person at the can would: open home, dispose of an item, then either view the
+result or categorize the item and vote for it in the carousel. Requests are
+sent over keep-alive connections with plain asyncio streams, so the generator
+has no dependencies and can be pointed at any local runserver, daphne or other
+ASGI server, ideally one started with CHANNEL_LAYER=memory.
+
+Classes:
+    HttpSession -- A minimal cookie keeping HTTP/1.1 client
+    LoadTestStats -- Collects latencies per step and summarizes them
+
+Functions:
+    run_load_test -- Runs the flow with many concurrent kiosks
+"""
+import asyncio
+from collections import OrderedDict
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlencode, urlsplit
+
+from .stats import percentile
+
+
+STEPS = ['login', 'home', 'dispose', 'result', 'categorize', 'carousel_vote']
+
+
+class LoadTestError(Exception):
+    """Raised when the server answers a step with an unexpected response"""
+
+
+class HttpSession():
+    """A minimal cookie keeping HTTP/1.1 client
+
+    Arguments:
+        host {str} -- The server's host name
+        port {int} -- The server's port
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.cookies: Dict[str, str] = {}
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def request(self, method: str, path: str,
+                      data: dict = None) -> Tuple[int, Dict[str, str], bytes]:
+        """Sends a request, reconnecting if the server closed the connection
+
+        Arguments:
+            method {str} -- GET or POST
+            path {str} -- The path and query string
+
+        Keyword Arguments:
+            data {dict} -- Form fields to POST (default: {None})
+
+        Returns:
+            Tuple[int, Dict[str, str], bytes] -- The status, the headers with
+                lowercased names, and the body
+        """
+        body = urlencode(data).encode('utf-8') if data is not None else b''
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        if method == 'POST':
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+            lines.append(f'X-CSRFToken: {self.cookies.get("csrftoken", "")}')
+        lines.append(f'Content-Length: {len(body)}')
+        raw_request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        # A kept alive connection may have been closed by the server meanwhile
+        for attempt in range(2):
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self._writer.write(raw_request)
+                await self._writer.drain()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+
+    async def _read_response(self) -> Tuple[int, Dict[str, str], bytes]:
+        status_line = await self._reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = (await self._reader.readuntil(b'\r\n')).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                cookie_name, _, cookie_value = value.split(';', 1)[0].partition('=')
+                self.cookies[cookie_name] = cookie_value
+            headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await self._reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                body += chunk[:-2]
+        else:
+            body = await self._reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, headers, body
+
+
+class LoadTestStats():
+    """Collects latencies per step and summarizes them"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {step: [] for step in STEPS}
+        self.errors: Dict[str, int] = {step: 0 for step in STEPS}
+        self.flows = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, step: str, seconds: float) -> None:
+        self.latencies[step].append(seconds * 1000)
+
+    def summary(self) -> dict:
+        """Returns the throughput and latency percentiles of every step
+
+        Returns:
+            dict -- The duration, completed flows and flows per second, and
+                for each step the number of requests, errors, requests per
+                second and p50/p95/p99/max latencies in milliseconds
+        """
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        steps = OrderedDict()
+        for step in STEPS:
+            latencies = sorted(self.latencies[step])
+            steps[step] = OrderedDict([
+                ('requests', len(latencies)),
+                ('errors', self.errors[step]),
+                ('per_second', len(latencies) / elapsed if elapsed else 0),
+            ])
+            if latencies:
+                steps[step]['latency_ms'] = OrderedDict(
+                    [(f'p{pct}', percentile(latencies, pct)) for pct in (50, 95, 99)]
+                    + [('max', latencies[-1])]
+                )
+        return OrderedDict([
+            ('seconds', elapsed),
+            ('flows', self.flows),
+            ('flows_per_second', self.flows / elapsed if elapsed else 0),
+            ('steps', steps),
+        ])
+
+
+async def _timed(stats: LoadTestStats, step: str, session: HttpSession, method: str,
+                 path: str, data: dict = None, expect: Sequence[int] = (200, 302)):
+    start = time.perf_counter()
+    try:
+        status, headers, body = await session.request(method, path, data)
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        stats.errors[step] += 1
+        raise
+    stats.record(step, time.perf_counter() - start)
+    if status not in expect:
+        stats.errors[step] += 1
+        raise LoadTestError(f'{step} answered {status}')
+    return status, headers, body
+
+
+async def _kiosk(session: HttpSession, username: str, password: str, items: List[str],
+                 categories: List[str], new_item_ratio: float, deadline: float,
+                 stats: LoadTestStats, rng: random.Random) -> None:
+    # Fetch the CSRF cookie, then log in
+    try:
+        await session.request('GET', '/accounts/login/')
+        await _timed(stats, 'login', session, 'POST', '/accounts/login/',
+                     {'username': username, 'password': password,
+                      'csrfmiddlewaretoken': session.cookies.get('csrftoken', '')},
+                     expect=(302,))
+    except (LoadTestError, OSError, asyncio.IncompleteReadError, ValueError):
+        # Counted as a login error, this kiosk sits the test out
+        return
+
+    while time.perf_counter() < deadline:
+        try:
+            await _timed(stats, 'home', session, 'GET', '/api/', expect=(200,))
+
+            if rng.random() < new_item_ratio:
+                item = f'loadtest item {rng.getrandbits(48):x}'
+            else:
+                item = rng.choice(items)
+            _, headers, _ = await _timed(stats, 'dispose', session, 'POST', '/api/dispose/',
+                                         {'disposable_item': item}, expect=(302,))
+
+            location = urlsplit(headers.get('location', ''))
+            path = location.path + (f'?{location.query}' if location.query else '')
+            if location.path.startswith('/api/result/'):
+                await _timed(stats, 'result', session, 'GET', path, expect=(200,))
+            else:
+                await _timed(stats, 'categorize', session, 'GET', path, expect=(200,))
+                name = unquote(location.path.rsplit('/', 1)[-1])
+                await _timed(stats, 'carousel_vote', session, 'POST', '/api/vote/carousel',
+                             {'disp_item': name, 'vote': rng.choice(categories)},
+                             expect=(302,))
+            stats.flows += 1
+        except (LoadTestError, OSError, asyncio.IncompleteReadError, ValueError):
+            # The failed step is counted, start the next flow on a new connection
+            await session.close()
+
+
+async def run_load_test(host: str, port: int, accounts: List[Tuple[str, str]],
+                        items: List[str], categories: List[str], duration: float,
+                        new_item_ratio: float = 0.1, seed: int = 0) -> dict:
+    """Runs the flow with one concurrent kiosk per account
+
+    Arguments:
+        host {str} -- The server's host name
+        port {int} -- The server's port
+        accounts {List[Tuple[str, str]]} -- (username, password) of the can
+            accounts the kiosks log in as
+        items {List[str]} -- Names of existing items to dispose of
+        categories {List[str]} -- Category names to vote for
+        duration {float} -- Seconds to keep starting new flows for
+
+    Keyword Arguments:
+        new_item_ratio {float} -- Share of disposals that use a brand new
+            item, which go through categorize and carousel_vote (default: {0.1})
+        seed {int} -- Seeds the choice of items and votes (default: {0})
+
+    Returns:
+        dict -- See LoadTestStats.summary
+    """
+    stats = LoadTestStats()
+    deadline = time.perf_counter() + duration
+    sessions = [HttpSession(host, port) for _ in accounts]
+    try:
+        await asyncio.gather(*[
+            _kiosk(session, username, password, items, categories, new_item_ratio,
+                   deadline, stats, random.Random(seed + num))
+            for num, (session, (username, password)) in enumerate(zip(sessions, accounts))
+        ])
+    finally:
+        stats.finished = time.perf_counter()
+        for session in sessions:
+            await session.close()
+    return stats.summary()
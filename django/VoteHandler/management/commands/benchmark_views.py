@@ -0,0 +1,54 @@
+"""Measures the query counts and latencies of the hot path views
+
+Usage:
+    python manage.py benchmark_views [--repeat 20] [--output results.json]
+        [--view dispose --view home ...] [--allow-remote-database]
+
+A development tool, it refuses to run against a database on another host
+unless passed --allow-remote-database.
+
+Exits with an error if any view ran more queries than its budget in
+VoteHandler.benchmarks.QUERY_BUDGETS.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from VoteHandler.benchmarks import QUERY_BUDGETS, check_local_database, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the hot path views and fails if one is over its query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Measured requests per view')
+        parser.add_argument('--view', action='append', dest='views',
+                            choices=list(QUERY_BUDGETS),
+                            help='A view to benchmark, may be repeated, defaults to all')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--allow-remote-database', action='store_true',
+                            help='Run even though the database is on another host')
+
+    def handle(self, *args, **options):
+        try:
+            check_local_database(options['allow_remote_database'])
+            results = run_benchmarks(repeat=options['repeat'], views=options['views'])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+        for result in results:
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{result['view']:<15} {result['queries']:>3}/{result['budget']:<3} queries  "
+                f"p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  "
+                f"max {latency['max']:8.2f}ms  status {result['statuses']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+        over_budget = [result['view'] for result in results if result['over_budget']]
+        if over_budget:
+            raise CommandError(f"Over the query budget: {', '.join(over_budget)}")
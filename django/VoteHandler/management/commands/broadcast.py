@@ -0,0 +1,58 @@
+"""Sends a command to every can, or to the cans matching a filter
+
+Usage:
+    python manage.py broadcast '{"command": "close"}' [--can UUID ...]
+        [--config-contains TEXT]
+    python manage.py broadcast --refresh-bins [--can UUID ...]
+
+Only cans that are online receive the command, see VoteHandler.broadcast.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Config.models import CanInfo
+from VoteHandler.broadcast import broadcast_command, broadcast_refresh_bins
+from VoteHandler.dispatch import channel_dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Sends a command to every can, or to the cans matching a filter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('content', nargs='?',
+                            help='The JSON to send, with a command key')
+        parser.add_argument('--refresh-bins', action='store_true',
+                            help='Make the cans reload their bins instead')
+        parser.add_argument('--can', action='append', dest='cans',
+                            help='The uuid of a can to send to, may be repeated')
+        parser.add_argument('--config-contains',
+                            help='Only send to cans whose config contains this text')
+
+    def handle(self, *args, **options):
+        if options['refresh_bins'] == bool(options['content']):
+            raise CommandError('Give either the JSON to send or --refresh-bins')
+
+        can_ids = None
+        if options['cans'] or options['config_contains']:
+            cans = CanInfo.objects.all()
+            if options['cans']:
+                cans = cans.filter(can_id__in=options['cans'])
+            if options['config_contains']:
+                cans = cans.filter(config__contains=options['config_contains'])
+            can_ids = cans.values_list('can_id', flat=True).iterator()
+
+        if options['refresh_bins']:
+            sent = broadcast_refresh_bins(can_ids)
+        else:
+            try:
+                sent = broadcast_command(json.loads(options['content']), can_ids)
+            except (ValueError, TypeError) as ex:
+                raise CommandError(f'Invalid command: {ex}')
+
+        # The dispatcher sends from a daemon thread, wait for it before exiting
+        channel_dispatcher.join()
+        if sent is None:
+            self.stdout.write('Sent to every online can')
+        else:
+            self.stdout.write(f'Sent to {sent} online cans')
@@ -0,0 +1,41 @@
+"""Prints the round trip times between the server and each can
+
+Usage:
+    python manage.py can_latency [--kind ping] [--output latency.json]
+
+Kinds other than ping are the latencies of acked commands, from first sending
+one to the can queuing it (delivery) or finishing it (completion). Only cans
+with a latency recorded within settings.LATENCY_TTL are listed, see
+VoteHandler.metrics.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from Config.models import CanInfo
+from VoteHandler.metrics import LATENCY_KINDS, latency_for
+
+
+class Command(BaseCommand):
+    help = 'Prints the round trip time percentiles of each can'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=LATENCY_KINDS, default='ping',
+                            help='The latency to print')
+        parser.add_argument('--output', help='Write the latencies to this JSON file')
+
+    def handle(self, *args, **options):
+        can_ids = CanInfo.objects.values_list('can_id', flat=True)
+        latencies = latency_for(can_ids, options['kind'])
+
+        for can_id, summary in sorted(latencies.items(), key=lambda item: -item[1]['p95']):
+            self.stdout.write(
+                f"{can_id}  p50 {summary['p50']:8.2f}ms  p95 {summary['p95']:8.2f}ms  "
+                f"p99 {summary['p99']:8.2f}ms  max {summary['max']:8.2f}ms  "
+                f"samples {summary['count']}"
+            )
+        self.stdout.write(f'{len(latencies)} of {len(can_ids)} cans have latencies')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(latencies, output, indent=2)
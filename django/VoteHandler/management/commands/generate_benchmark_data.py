@@ -0,0 +1,174 @@
+"""Generates realistic volumes of data for benchmark_views
+
+Usage:
+    python manage.py generate_benchmark_data [--disposables 100000]
+        [--votes 1000000] [--cans 10000] [--seed 0] [--flush]
+        [--allow-remote-database]
+
+A development tool, it creates thousands of accounts and deletes by name
+prefix, so it refuses to run against a database on another host unless
+passed --allow-remote-database.
+"""
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Config.models import LANDFILL_ID, Bin, CanInfo
+from VoteHandler.benchmarks import check_local_database
+from VoteHandler.models import Category, Disposable, DisposableSummary, DisposableVote
+from VoteHandler.utils import counts_to_percentages
+
+
+# Generated rows are marked so --flush can find them again
+NAME_PREFIX = 'bm '
+CATEGORY_PREFIX = 'Benchmark '
+CAN_CONFIG = '{"benchmark": true}'
+
+ADJECTIVES = ['plastic', 'paper', 'glass', 'metal', 'greasy', 'empty', 'broken',
+              'used', 'wet', 'foam', 'wax', 'aluminum', 'cardboard', 'ceramic']
+NOUNS = ['bottle', 'cup', 'bag', 'box', 'wrapper', 'straw', 'lid', 'plate',
+         'napkin', 'can', 'jar', 'tray', 'fork', 'carton', 'sleeve', 'container']
+
+
+class Command(BaseCommand):
+    help = 'Generates disposables, votes, cans and bins to benchmark against'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--disposables', type=int, default=100000)
+        parser.add_argument('--votes', type=int, default=1000000,
+                            help='DisposableVote rows, spread over the disposables')
+        parser.add_argument('--cans', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=12,
+                            help='Categories to vote for, created if there are fewer')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete previously generated data first')
+        parser.add_argument('--allow-remote-database', action='store_true',
+                            help='Run even though the database is on another host')
+
+    def handle(self, *args, **options):
+        try:
+            check_local_database(options['allow_remote_database'])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        self.verbosity = options['verbosity']
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        if options['flush']:
+            self.flush()
+        elif Disposable.objects.filter(name__startswith=NAME_PREFIX).exists():
+            raise CommandError('Benchmark data already exists, pass --flush to replace it')
+
+        categories = self.create_categories(options['categories'])
+        if options['votes'] > options['disposables'] * len(categories):
+            raise CommandError('Every vote row needs a distinct disposable and category, '
+                               'ask for fewer votes or more categories')
+
+        self.create_disposables(options['disposables'])
+        self.create_votes(options['votes'], categories)
+        self.create_cans(options['cans'], categories)
+
+    ##### Helpers
+
+    def log(self, message: str) -> None:
+        if self.verbosity < 1:
+            return
+        self.stdout.write(message)
+        self.stdout.flush()
+
+    def batches(self, rows: list):
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+
+    def flush(self) -> None:
+        self.log('Deleting previously generated data')
+        with transaction.atomic():
+            User.objects.filter(caninfo__config=CAN_CONFIG).delete()
+            Disposable.objects.filter(name__startswith=NAME_PREFIX).delete()
+            Category.objects.filter(name__startswith=CATEGORY_PREFIX).delete()
+
+    ##### Generators
+
+    def create_categories(self, count: int) -> list:
+        categories = list(Category.objects.order_by('id'))
+        for num in range(len(categories), count):
+            categories.append(Category.objects.create(name=f'{CATEGORY_PREFIX}{num}'))
+        return categories
+
+    def create_disposables(self, count: int) -> None:
+        self.log(f'Creating {count} disposables')
+        names = [f'{NAME_PREFIX}{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)} {num}'
+                 for num in range(count)]
+        for batch in self.batches(names):
+            Disposable.objects.bulk_create([Disposable(name=name) for name in batch])
+
+    def create_votes(self, count: int, categories: list) -> None:
+        self.log(f'Creating {count} votes and their summaries')
+        disposable_ids = list(Disposable.objects.filter(name__startswith=NAME_PREFIX)
+                              .order_by('id').values_list('id', flat=True))
+        if not disposable_ids:
+            return
+
+        # Spread the rows evenly, popular items get long tailed counts
+        per_disposable, extra = divmod(count, len(disposable_ids))
+        for batch in self.batches(disposable_ids):
+            votes, summaries = [], []
+            for disposable_id in batch:
+                num_votes = per_disposable + (1 if extra > 0 else 0)
+                extra -= 1
+                if num_votes == 0:
+                    continue
+
+                rows = [(category.id, category.name, int(self.rng.paretovariate(1.2)))
+                        for category in self.rng.sample(categories, num_votes)]
+                votes.extend(DisposableVote(disposable_id=disposable_id, category_id=c_id,
+                                            count=vote_count)
+                             for c_id, _, vote_count in rows)
+
+                # Match update_disposable_summary, ties go to the oldest vote
+                rows.sort(key=lambda row: row[2], reverse=True)
+                summary = DisposableSummary(disposable_id=disposable_id,
+                                            total_votes=sum(row[2] for row in rows),
+                                            top_category_id=rows[0][0])
+                summary.set_percentages(counts_to_percentages((name, c) for _, name, c in rows))
+                summary.set_vote_counts(rows)
+                summaries.append(summary)
+
+            # Bulk writes skip the signals, so the summaries are written here
+            with transaction.atomic():
+                DisposableVote.objects.bulk_create(votes)
+                DisposableSummary.objects.bulk_create(summaries)
+
+    def create_cans(self, count: int, categories: list) -> None:
+        self.log(f'Creating {count} cans and their bins')
+        # Hashing is slow on purpose, every can gets the same password
+        password = make_password('benchmark')
+        default_category_id = LANDFILL_ID if any(c.id == LANDFILL_ID for c in categories) \
+                              else categories[0].id
+
+        can_ids = [uuid.UUID(int=self.rng.getrandbits(128)).hex for _ in range(count)]
+        for batch in self.batches(can_ids):
+            with transaction.atomic():
+                User.objects.bulk_create([User(username=can_id, password=password)
+                                          for can_id in batch])
+                user_ids = dict(User.objects.filter(username__in=batch)
+                                .values_list('username', 'id'))
+                CanInfo.objects.bulk_create([
+                    CanInfo(can_id=can_id, owner_id=user_ids[can_id], config=CAN_CONFIG,
+                            default_category_id=default_category_id)
+                    for can_id in batch
+                ])
+
+                bins = []
+                cans = CanInfo.objects.filter(can_id__in=batch).values_list('id', flat=True)
+                for can_pk in cans:
+                    num_bins = self.rng.randint(3, min(5, len(categories)))
+                    for bin_num, category in enumerate(self.rng.sample(categories, num_bins)):
+                        bins.append(Bin(s_id_id=can_pk, bin_num=bin_num, category=category))
+                Bin.objects.bulk_create(bins)
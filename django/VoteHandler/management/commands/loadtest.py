@@ -0,0 +1,76 @@
+"""Load tests a running server with many concurrent kiosks
+
+Usage:
+    CHANNEL_LAYER=memory python manage.py runserver 8000
+    python manage.py loadtest [--port 8000] [--kiosks 50] [--duration 30]
+        [--output results.json]
+
+The kiosks log in as the cans made by generate_benchmark_data and dispose of
+its items, so run that against the same database first.
+"""
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Config.models import CanInfo
+from VoteHandler.loadtest import STEPS, run_load_test
+from VoteHandler.models import Category, DisposableSummary
+from .generate_benchmark_data import CAN_CONFIG
+
+
+class Command(BaseCommand):
+    help = 'Drives the dispose and vote flow against a running server and reports latencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--kiosks', type=int, default=50,
+                            help='Concurrent kiosks, each logged in as a different can')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to keep starting new flows for')
+        parser.add_argument('--new-item-ratio', type=float, default=0.1,
+                            help='Share of disposals of brand new items')
+        parser.add_argument('--items', type=int, default=1000,
+                            help='How many of the most voted items to dispose of')
+        parser.add_argument('--password', default='benchmark',
+                            help='The password of the generated can accounts')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        usernames = list(CanInfo.objects.filter(config=CAN_CONFIG, owner__isnull=False)
+                         .order_by('id').values_list('owner__username', flat=True)
+                         [:options['kiosks']])
+        items = list(DisposableSummary.objects.order_by('-total_votes')
+                     .values_list('disposable__name', flat=True)[:options['items']])
+        categories = list(Category.objects.values_list('name', flat=True))
+        if len(usernames) < options['kiosks'] or not items or not categories:
+            raise CommandError(f"Need {options['kiosks']} cans and some voted items, "
+                               'run the generate_benchmark_data command first')
+
+        summary = asyncio.get_event_loop().run_until_complete(run_load_test(
+            options['host'], options['port'],
+            accounts=[(username, options['password']) for username in usernames],
+            items=items,
+            categories=categories,
+            duration=options['duration'],
+            new_item_ratio=options['new_item_ratio'],
+            seed=options['seed']
+        ))
+
+        self.stdout.write(f"{summary['flows']} flows in {summary['seconds']:.1f}s, "
+                          f"{summary['flows_per_second']:.1f} flows/s")
+        for step in STEPS:
+            result = summary['steps'][step]
+            line = f"{step:<15} {result['requests']:>7} reqs {result['per_second']:8.1f}/s " \
+                   f"{result['errors']:>5} errors"
+            if 'latency_ms' in result:
+                latency = result['latency_ms']
+                line += f"  p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  " \
+                        f"p99 {latency['p99']:8.2f}ms"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(summary, output, indent=2)
@@ -0,0 +1,136 @@
+"""Round trip times between the server and each can
+
+Sockets ping their can and time the pong. Each socket keeps a rolling window
+of its can's round trip times and writes the percentiles to the cache after
+every pong, so any process can read the latencies of the whole fleet. The
+latencies of acked commands are kept the same way, see VoteHandler.delivery.
+
+Attributes:
+    LATENCY_KINDS {Tuple[str, ...]} -- What latencies are kept: ping round
+        trips, command delivery up to queued and command completion up to done
+
+Classes:
+    RollingPercentiles -- Percentiles of the most recent samples
+    PingTracker -- Matches a can's pongs to the pings sent to it
+
+Functions:
+    record_latency -- Saves the latency summary of a can
+    latency_for -- The latency summaries of cans
+"""
+import bisect
+from collections import deque
+import time
+from typing import Dict, Iterable, Optional, Union
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .stats import percentile
+
+
+LATENCY_KINDS = ('ping', 'delivery', 'completion')
+
+
+class RollingPercentiles():
+    """Percentiles of the most recent samples
+
+    Keyword Arguments:
+        window {int} -- The number of samples kept (default: {100})
+    """
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)
+        # The same samples kept sorted, so percentiles don't sort every time
+        self._sorted = []
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, value: float) -> None:
+        if len(self._samples) == self._samples.maxlen:
+            oldest = self._samples[0]
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._samples.append(value)
+        bisect.insort(self._sorted, value)
+
+    def summary(self) -> Optional[dict]:
+        """Returns the count, p50, p95, p99 and max, None without samples"""
+        if not self._sorted:
+            return None
+        summary = {'count': len(self._sorted)}
+        for pct in (50, 95, 99):
+            summary[f'p{pct}'] = percentile(self._sorted, pct)
+        summary['max'] = self._sorted[-1]
+        return summary
+
+
+class PingTracker():
+    """Matches a can's pongs to the pings sent to it
+
+    Keyword Arguments:
+        window {int} -- The number of round trip times kept (default: {100})
+    """
+
+    def __init__(self, window: int = 100):
+        self.latencies = RollingPercentiles(window)
+        self._next_id = 0
+        self._sent: Dict[int, float] = {}
+
+    @property
+    def unanswered(self) -> int:
+        """The number of pings sent since the last one that was answered"""
+        return len(self._sent)
+
+    def ping(self, interval: float) -> dict:
+        """Returns a new ping command
+
+        Arguments:
+            interval {float} -- Seconds until the next ping, so the can can
+                tell when the server has gone quiet
+        """
+        self._next_id += 1
+        self._sent[self._next_id] = time.monotonic()
+        return {'command': 'ping', 'id': self._next_id, 'interval': interval}
+
+    def pong(self, ping_id) -> Optional[float]:
+        """Records the answer to a ping
+
+        Arguments:
+            ping_id -- The id of the ping that was answered
+
+        Returns:
+            Optional[float] -- The round trip time in milliseconds, or None if
+                the ping is unknown or was already answered
+        """
+        sent = self._sent.pop(ping_id, None)
+        if sent is None:
+            return None
+        round_trip = (time.monotonic() - sent) * 1000
+        # Pongs come back in order, so anything older was lost
+        self._sent = {key: value for key, value in self._sent.items() if key > ping_id}
+        self.latencies.add(round_trip)
+        return round_trip
+
+
+def _key(can_id: Union[str, uuid.UUID], kind: str) -> str:
+    return f'latency:{kind}:{uuid.UUID(str(can_id)).hex}'
+
+
+def record_latency(can_id: Union[str, uuid.UUID], summary: dict, kind: str = 'ping') -> None:
+    """Saves the latency summary of a can, see RollingPercentiles.summary
+
+    Arguments:
+        can_id {Union[str, uuid.UUID]} -- The can
+        summary {dict} -- The summary to save
+
+    Keyword Arguments:
+        kind {str} -- One of LATENCY_KINDS (default: {'ping'})
+    """
+    cache.set(_key(can_id, kind), summary, settings.LATENCY_TTL)
+
+
+def latency_for(can_ids: Iterable[Union[str, uuid.UUID]], kind: str = 'ping') -> Dict[str, dict]:
+    """The latency summaries of cans, by hex can id, skipping cans without one"""
+    keys = [_key(can_id, kind) for can_id in can_ids]
+    return {key.rsplit(':', 1)[1]: summary for key, summary in cache.get_many(keys).items()}
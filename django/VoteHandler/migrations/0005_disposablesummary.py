@@ -0,0 +1,51 @@
+# Generated by Django 2.0.2 on 2026-10-18 12:00
+
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_summaries(apps, schema_editor):
+    """Backfills a DisposableSummary for every Disposable that has votes"""
+    DisposableVote = apps.get_model('VoteHandler', 'DisposableVote')
+    DisposableSummary = apps.get_model('VoteHandler', 'DisposableSummary')
+
+    votes_by_disposable = {}
+    votes = DisposableVote.objects.select_related('category').order_by('-count', 'id')
+    for vote in votes.iterator():
+        votes_by_disposable.setdefault(vote.disposable_id, []).append(vote)
+
+    summaries = []
+    for disposable_id, votes in votes_by_disposable.items():
+        total = sum(vote.count for vote in votes)
+        normalize_total = max(total, settings.MIN_NORMALIZE_COUNT)
+        percentages = [[vote.category.name, 100*vote.count/normalize_total] for vote in votes]
+        summaries.append(DisposableSummary(
+            disposable_id=disposable_id,
+            total_votes=total,
+            top_category_id=votes[0].category_id,
+            percentages=json.dumps(percentages)
+        ))
+    DisposableSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VoteHandler', '0004_auto_20180307_2302'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisposableSummary',
+            fields=[
+                ('disposable', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='VoteHandler.Disposable')),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+                ('percentages', models.TextField(default='[]')),
+                ('top_category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='VoteHandler.Category')),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.0.2 on 2026-10-18 14:00
+
+import json
+
+from django.db import migrations, models
+
+
+def fill_vote_counts(apps, schema_editor):
+    """Fills vote_counts for the summaries that already exist"""
+    DisposableVote = apps.get_model('VoteHandler', 'DisposableVote')
+    DisposableSummary = apps.get_model('VoteHandler', 'DisposableSummary')
+
+    counts_by_disposable = {}
+    votes = DisposableVote.objects.order_by('-count', 'id')
+    for row in votes.values_list('disposable_id', 'category_id', 'category__name', 'count').iterator():
+        counts_by_disposable.setdefault(row[0], []).append(list(row[1:]))
+
+    for summary in DisposableSummary.objects.iterator():
+        summary.vote_counts = json.dumps(counts_by_disposable.get(summary.disposable_id, []))
+        summary.save(update_fields=['vote_counts'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VoteHandler', '0005_disposablesummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disposablesummary',
+            name='vote_counts',
+            field=models.TextField(default='[]'),
+        ),
+        migrations.RunPython(fill_vote_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VoteHandler', '0006_disposablesummary_vote_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disposablesummary',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
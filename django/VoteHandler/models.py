@@ -4,14 +4,17 @@
         Category -- the various waste categories
         Disposable -- an item that can be disposed of
         DisposableVote -- the total votes an object has recieved for a category
+        DisposableSummary -- the denormalized classification of a Disposable
 """
 
 from __future__ import unicode_literals
+import json
+from typing import List, Tuple
 
 from django.core.exceptions import EmptyResultSet
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import QuerySet
+from django.db.models import F
 
 # Create your models here.
 class Category(models.Model):
@@ -48,32 +51,28 @@ class Disposable(models.Model):
         Returns:
             Category -- Disposable with the most votes
         """
-        #  select_related caches these attributes when it does the query so we
-        #  get the entry and the foreign fields we want to use later all in one
-        #  query
-        votes_set = DisposableVote.objects.filter(disposable=self.id)
+        #  select_related caches the category when it does the query so we
+        #  get the top vote and the category we want to return in one query.
+        #  Ties go to the oldest vote.
+        votes_set = DisposableVote.objects.filter(disposable=self.id).select_related('category')
+        top_vote = votes_set.order_by('-count', 'id').first()
 
-        if not votes_set.exists():
+        if top_vote is None:
             raise EmptyResultSet
-        votes_set.select_related('category')
+        return top_vote.category
 
-        top_category = None
-        max_count = 0
-        for vote in votes_set:
-            if vote.count > max_count:
-                top_category = vote.category
-                max_count = vote.count
-        return top_category
-
-    def get_top_votes(self, slice_size: int = None) -> QuerySet:
+    def get_top_votes(self, slice_size: int = None) -> List['DisposableVote']:
         """Returns up to slice_size of the top vote counts for this disposable
 
+        The votes and their categories are fetched in one query, views that
+        only need the counts can read DisposableSummary.vote_counts instead.
+
         Keyword Arguments:
             slice_size {int} -- The number of items to take from the front of
                 the list. (default: {None})
 
         Returns:
-            QuerySet[Disposable] -- The slice of disposables with the most votes
+            List[DisposableVote] -- The slice of votes with their categories
         """
         if slice_size is not None:
             try:
@@ -84,13 +83,14 @@ class Disposable(models.Model):
             if slice_size < 1:
                 raise IndexError('slice_size must at least 1')
 
-        votes_set = DisposableVote.objects.filter(disposable=self.id)
-        if not votes_set.exists():
-            raise EmptyResultSet
-
-        votes = votes_set.select_related('category').order_by('count')
+        votes = DisposableVote.objects.filter(disposable=self.id)
+        votes = votes.select_related('category').order_by('count')
         if slice_size is not None:
-            return votes[:slice_size]
+            votes = votes[:slice_size]
+        # Evaluated here, so there is no separate query to check for votes
+        votes = list(votes)
+        if not votes:
+            raise EmptyResultSet
         return votes
 
     def save(self, *args, **kwargs):
@@ -131,5 +131,64 @@ class DisposableVote(models.Model):
         """
         if count < 0:
             count = 0
-        self.count += count
-        self.save()
+        if self.pk is None:
+            self.count += count
+            self.save()
+            return
+
+        # Increment in the database so concurrent votes aren't lost
+        self.count = F('count') + count
+        self.save(update_fields=['count'])
+        self.refresh_from_db(fields=['count'])
+
+
+class DisposableSummary(models.Model):
+    """Model representing the denormalized classification of a Disposable
+
+    A row exists only while the Disposable has at least one vote. Rows are
+    rebuilt from DisposableVote whenever a vote changes, see
+    VoteHandler.utils.update_disposable_summary.
+
+    Attributes:
+        disposable {Disposable} -- The item that is summarized, doubles as the pk
+        total_votes {int} -- The sum of all votes the item has received
+        top_category {Category} -- The category with the most votes
+        percentages {str} -- JSON list of [category_name, percentage] pairs in
+            descending order, as returned by votes_to_percentages
+        vote_counts {str} -- JSON list of [category_id, category_name, count]
+            in the same order as percentages
+        updated {datetime} -- When the row was last rebuilt, lets caches
+            load only what changed
+    """
+
+    disposable = models.OneToOneField(Disposable, on_delete=models.CASCADE,
+                                      primary_key=True, related_name='summary')
+    total_votes = models.PositiveIntegerField(default=0)
+    top_category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    percentages = models.TextField(default='[]')
+    vote_counts = models.TextField(default='[]')
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.disposable_id} has {self.total_votes} votes, mostly for {self.top_category_id}"
+
+    def get_percentages(self) -> List[Tuple[str, float]]:
+        """Returns the stored percentages in votes_to_percentages format
+
+        Returns:
+            List[Tuple[str, float]] -- list of categories with confidence
+                percentages in ('category', percentage) format
+        """
+        return [(name, percentage) for name, percentage in json.loads(self.percentages)]
+
+    def set_percentages(self, percentage_tuples: List[Tuple[str, float]]) -> None:
+        """Serializes percentage_tuples into the percentages field"""
+        self.percentages = json.dumps([list(pair) for pair in percentage_tuples])
+
+    def get_vote_counts(self) -> List[Tuple[int, str, int]]:
+        """Returns the stored counts as (category_id, category_name, count)"""
+        return [tuple(row) for row in json.loads(self.vote_counts)]
+
+    def set_vote_counts(self, count_tuples: List[Tuple[int, str, int]]) -> None:
+        """Serializes count_tuples into the vote_counts field"""
+        self.vote_counts = json.dumps([list(row) for row in count_tuples])
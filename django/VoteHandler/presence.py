@@ -0,0 +1,100 @@
+"""Tracks which cans have a connected socket
+
+Presence lives in Django's cache, redis in production, rather than in
+CanInfo, so connects and disconnects never write to the database. The cache
+has to be shared by every process that serves HTTP or websockets, the
+VoteHandler.W001 check warns when it isn't. Each can has one entry holding
+the channel name of its newest socket. The entry expires
+settings.PRESENCE_TTL seconds after the last heartbeat, so a worker that dies
+without running disconnect doesn't leave its cans online forever.
+
+Commands reach a can through its channel layer group, see
+VoteHandler.utils.can_group_name, so presence only decides whether there is
+anyone to send to.
+
+Functions:
+    can_id_for_user -- The can id of a can's user account
+    mark_online -- Records that a socket of the can is connected
+    mark_offline -- Records that a socket of the can disconnected
+    online_channel -- The channel name of the can's newest socket
+    is_online -- Whether the can has a connected socket
+    online_can_ids -- The cans of a list that have a connected socket
+"""
+from typing import Iterable, List, Optional, Union
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+def _key(can_id: Union[str, uuid.UUID]) -> str:
+    return f'presence:{uuid.UUID(str(can_id)).hex}'
+
+
+def can_id_for_user(user: User) -> Optional[str]:
+    """The can id of a can's user account, without querying the database
+
+    Can accounts are named by the hex of the can's uuid, see Config.views.register.
+
+    Arguments:
+        user {User} -- The account
+
+    Returns:
+        Optional[str] -- The can id, or None if the account isn't a can's
+    """
+    try:
+        return uuid.UUID(user.username).hex
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def mark_online(can_id: Union[str, uuid.UUID], channel_name: str) -> None:
+    """Records that a socket of the can is connected, also used as the heartbeat
+
+    Arguments:
+        can_id {Union[str, uuid.UUID]} -- The can
+        channel_name {str} -- The channel name of the socket
+    """
+    cache.set(_key(can_id), channel_name, settings.PRESENCE_TTL)
+
+
+def mark_offline(can_id: Union[str, uuid.UUID], channel_name: str) -> None:
+    """Records that a socket of the can disconnected
+
+    Only the socket that was last marked online can clear the entry, so the
+    late disconnect of an old socket doesn't hide a can that has already
+    reconnected, possibly to a different worker. Should the two still race,
+    the new socket's next heartbeat puts the entry back.
+
+    Arguments:
+        can_id {Union[str, uuid.UUID]} -- The can
+        channel_name {str} -- The channel name of the socket
+    """
+    key = _key(can_id)
+    if cache.get(key) == channel_name:
+        cache.delete(key)
+
+
+def online_channel(can_id: Union[str, uuid.UUID]) -> Optional[str]:
+    """The channel name of the can's newest socket, None if it's offline"""
+    return cache.get(_key(can_id))
+
+
+def is_online(can_id: Union[str, uuid.UUID]) -> bool:
+    """Whether the can has a connected socket"""
+    return online_channel(can_id) is not None
+
+
+def online_can_ids(can_ids: Iterable[Union[str, uuid.UUID]]) -> List[str]:
+    """The cans of a list that have a connected socket, with one cache read
+
+    Arguments:
+        can_ids {Iterable[Union[str, uuid.UUID]]} -- The cans to check
+
+    Returns:
+        List[str] -- The hex can ids of the online cans, in the given order
+    """
+    keys = [_key(can_id) for can_id in can_ids]
+    online = cache.get_many(keys)
+    return [key.split(':', 1)[1] for key in keys if key in online]
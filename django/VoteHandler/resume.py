@@ -0,0 +1,95 @@
+"""Signed resume tokens that let a reconnecting can skip its password
+
+Checking a can's password runs the whole password hasher on purpose, which
+is what a server restart asks of every can at once. So a can that identified
+with its password is given a resume token, and presents that on its next
+connect instead. A token is the can's id and a digest of its password hash,
+signed with the SECRET_KEY and timestamped, so checking one is an HMAC and a
+cached lookup of the can. Tokens expire after settings.RESUME_TOKEN_MAX_AGE
+seconds and stop working when the can's password changes.
+
+Functions:
+    make_resume_token -- Issues a resume token for a can's account
+    resume -- Returns the account and can a resume token was issued for
+    forget_can -- Drops the cached account and can of a can
+"""
+from typing import Optional, Tuple, Union
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from Config.models import CanInfo
+from . import presence
+
+
+_SALT = 'VoteHandler.resume'
+
+
+def _key(can_id: Union[str, uuid.UUID]) -> str:
+    return f'resume:{uuid.UUID(str(can_id)).hex}'
+
+
+def _password_digest(user: User) -> str:
+    # A change of password, or of the hasher, invalidates the token
+    return salted_hmac(_SALT, user.password).hexdigest()[:16]
+
+
+def make_resume_token(user: User) -> Optional[str]:
+    """Issues a resume token for a can's account
+
+    Arguments:
+        user {User} -- The account the can identified as
+
+    Returns:
+        Optional[str] -- The token, or None if the account isn't a can's
+    """
+    can_id = presence.can_id_for_user(user)
+    if can_id is None:
+        return None
+    return signing.dumps({'c': can_id, 'p': _password_digest(user)}, salt=_SALT, compress=True)
+
+
+def resume(token: str) -> Optional[Tuple[User, CanInfo]]:
+    """Returns the account and can a resume token was issued for
+
+    The pair is cached for settings.RESUME_CACHE_TTL seconds, see forget_can.
+
+    Arguments:
+        token {str} -- A token from make_resume_token
+
+    Returns:
+        Optional[Tuple[User, CanInfo]] -- The account and its can, or None if
+            the token is invalid, expired or from before a password change, or
+            the can or its account no longer exist
+    """
+    try:
+        data = signing.loads(token, salt=_SALT, max_age=settings.RESUME_TOKEN_MAX_AGE)
+        key = _key(data['c'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+    can = cache.get(key)
+    if can is None:
+        try:
+            can_info = CanInfo.objects.select_related('owner').get(can_id=data['c'])
+        except CanInfo.DoesNotExist:
+            return None
+        if can_info.owner is None:
+            return None
+        can = (can_info.owner, can_info)
+        cache.set(key, can, settings.RESUME_CACHE_TTL)
+
+    user, can_info = can
+    if not user.is_active or not constant_time_compare(data.get('p', ''),
+                                                       _password_digest(user)):
+        return None
+    return user, can_info
+
+
+def forget_can(can_id: Union[str, uuid.UUID]) -> None:
+    """Drops the cached account and can of a can, after either changed"""
+    cache.delete(_key(can_id))
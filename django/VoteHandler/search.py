@@ -0,0 +1,386 @@
+"""In-process indexes over Disposable names
+
+Each process keeps its own copy of the names. New rows saved in the process
+are added right away by VoteHandler.signals, and rows created by other
+processes are picked up incrementally, by id, at most every
+settings.NAME_INDEX_REFRESH_INTERVAL seconds. With
+settings.NAME_INDEX_BACKGROUND_REFRESH the loading happens on a background
+thread, so a request never waits on it and answers from the names loaded so
+far.
+
+Classes:
+    TrigramIndex -- Finds words within an edit distance by their trigrams
+    NameIndex -- Base class for indexes that load Disposable names incrementally
+    FuzzyIndex -- Finds the known names closest to a misspelled one
+    PrefixIndex -- Finds the most voted names starting with a prefix
+
+Functions:
+    levenshtein -- The edit distance between two strings
+
+Attributes:
+    fuzzy_index {FuzzyIndex} -- The process wide index used by the views
+    prefix_index {PrefixIndex} -- The process wide index used by autocomplete
+"""
+import bisect
+from collections import Counter
+from datetime import datetime, timedelta
+import heapq
+from itertools import chain
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Disposable, DisposableSummary
+
+
+def levenshtein(a: str, b: str, max_distance: int = None) -> int:
+    """The edit distance between two strings
+
+    Arguments:
+        a {str} -- The first string
+        b {str} -- The second string
+
+    Keyword Arguments:
+        max_distance {int} -- Stop early once the distance is known to be
+            greater than this (default: {None})
+
+    Returns:
+        int -- The distance, or max_distance + 1 if it stopped early
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex():
+    """Finds words within an edit distance by the trigrams they share
+
+    An edit changes at most three of a word's trigrams, so a word within k
+    edits of another still has all but 3k of the other's distinct trigrams.
+    Only the words sharing that many are compared with levenshtein, which
+    stops as soon as they are too far apart.
+    """
+
+    # Marks the ends of a word, so its first and last characters get trigrams too
+    _PAD = '\x00\x00'
+
+    def __init__(self):
+        self._words: List[str] = []
+        self._known: Set[str] = set()
+        # Trigram to the positions in _words of the words containing it
+        self._postings: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self._words)
+
+    @classmethod
+    def trigrams(cls, word: str) -> Set[str]:
+        """The distinct trigrams of word, including the ones across its ends"""
+        padded = cls._PAD + word + cls._PAD
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, word: str) -> None:
+        """Adds a word, adding a word that is already in the index does nothing"""
+        if word in self._known:
+            return
+        self._known.add(word)
+        position = len(self._words)
+        self._words.append(word)
+        for trigram in self.trigrams(word):
+            self._postings.setdefault(trigram, []).append(position)
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        """Returns every word within max_distance of word
+
+        Arguments:
+            word {str} -- The word to look for
+            max_distance {int} -- The largest edit distance to accept
+
+        Returns:
+            List[Tuple[int, str]] -- (distance, word) pairs, closest first
+        """
+        trigrams = self.trigrams(word)
+        needed = len(trigrams) - 3 * max_distance
+        if needed > 0:
+            shared = Counter(chain.from_iterable(self._postings.get(trigram, ())
+                                                 for trigram in trigrams))
+            candidates = [self._words[position]
+                          for position, count in shared.items() if count >= needed]
+        else:
+            # Too short for the trigrams to rule anything out
+            candidates = self._words
+
+        matches = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            distance = levenshtein(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        return sorted(matches)
+
+
+class NameIndex():
+    """Base class for indexes that load Disposable names incrementally
+
+    Subclasses implement _add and _clear, and may implement _loaded, which are
+    called with the lock held, and _fetch, which reads from the database
+    without it.
+
+    Keyword Arguments:
+        background {bool} -- Refresh from a background thread when the index
+            is used, False refreshes on the calling thread (default: {False})
+    """
+
+    def __init__(self, background: bool = False):
+        self.background = background
+        self._lock = threading.RLock()
+        # Held for a whole refresh, so the database is read without self._lock
+        self._refresh_lock = threading.Lock()
+        self._refresher: threading.Thread = None
+        self._last_id = 0
+        self._refreshed_at = None
+        self._loaded_at: Optional[datetime] = None
+
+    def _add(self, disposable_id: int, name: str) -> None:
+        raise NotImplementedError
+
+    def _clear(self) -> None:
+        raise NotImplementedError
+
+    def _fetch(self, since: Optional[datetime]) -> Any:
+        """Reads whatever else the index keeps, before the lock is taken
+
+        Arguments:
+            since {Optional[datetime]} -- When the previous refresh started,
+                None if this was the first one
+
+        Returns:
+            Any -- Passed on to _loaded
+        """
+
+    def _loaded(self, fetched: Any) -> None:
+        """Called after each refresh has added the new names
+
+        Arguments:
+            fetched {Any} -- What _fetch returned
+        """
+
+    def reset(self) -> None:
+        """Drops every name so the next use reloads them from the database"""
+        with self._lock:
+            self._clear()
+            self._last_id = 0
+            self._refreshed_at = None
+            self._loaded_at = None
+
+    def add(self, disposable_id: int, name: str) -> None:
+        """Adds a single disposable, ex. one that was just created"""
+        with self._lock:
+            if self._refreshed_at is not None:
+                self._add(disposable_id, name)
+
+    def _due(self, now: float) -> bool:
+        return self._refreshed_at is None or \
+            now - self._refreshed_at >= settings.NAME_INDEX_REFRESH_INTERVAL
+
+    def refresh(self, force: bool = False) -> None:
+        """Loads the disposables created since the last refresh
+
+        Keyword Arguments:
+            force {bool} -- Refresh even if the last refresh was recent
+                (default: {False})
+        """
+        with self._refresh_lock:
+            now = time.monotonic()
+            if not force and not self._due(now):
+                return
+            since, loaded_at = self._loaded_at, timezone.now()
+            new_rows = Disposable.objects.filter(id__gt=self._last_id).order_by('id')
+            new_rows = list(new_rows.values_list('id', 'name'))
+            fetched = self._fetch(since)
+            with self._lock:
+                for disposable_id, name in new_rows:
+                    self._add(disposable_id, name)
+                    self._last_id = disposable_id
+                self._loaded(fetched)
+                self._loaded_at = loaded_at
+                self._refreshed_at = now
+
+    def refresh_in_background(self) -> None:
+        """Starts a refresh on a background thread if one is due, without waiting"""
+        if not self._due(time.monotonic()):
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._run_refresher,
+                                               name='name-index-refresh', daemon=True)
+            self._refresher.start()
+
+    def _run_refresher(self) -> None:
+        try:
+            self.refresh()
+        except Exception as ex:
+            print(f'Failed to refresh {type(self).__name__}. Error: {ex}')
+        finally:
+            # The thread's connection would otherwise stay open until it is reused
+            connection.close()
+
+    def _use(self) -> None:
+        """Refreshes the index as configured before it is used"""
+        if self.background:
+            self.refresh_in_background()
+        else:
+            self.refresh()
+
+
+class FuzzyIndex(NameIndex):
+    """Finds the known names closest to a misspelled one
+
+    Longer names tolerate more edits, one per settings.FUZZY_MATCH_CHARS_PER_EDIT
+    characters up to settings.FUZZY_MATCH_MAX_DISTANCE, so short names like
+    'can' never match a different short word.
+    """
+
+    def __init__(self, background: bool = False):
+        super().__init__(background)
+        self._trigrams = TrigramIndex()
+
+    def _add(self, disposable_id: int, name: str) -> None:
+        self._trigrams.add(name)
+
+    def _clear(self) -> None:
+        self._trigrams = TrigramIndex()
+
+    def matches(self, name: str) -> List[str]:
+        """Returns the known names close enough to name, closest first
+
+        Arguments:
+            name {str} -- A normalized name
+
+        Returns:
+            List[str] -- The other known names within the allowed distance,
+                ties are broken alphabetically
+        """
+        max_distance = min(settings.FUZZY_MATCH_MAX_DISTANCE,
+                           len(name) // settings.FUZZY_MATCH_CHARS_PER_EDIT)
+        if max_distance < 1:
+            return []
+
+        self._use()
+        with self._lock:
+            matches = self._trigrams.search(name, max_distance)
+        return [match for _, match in matches if match != name]
+
+
+class PrefixIndex(NameIndex):
+    """Finds the most voted names starting with a prefix
+
+    Names are kept in a sorted list so the names sharing a prefix are one
+    contiguous slice found by bisection. Vote totals are read from the
+    DisposableSummary rows updated since the last refresh, and answers are
+    memoized until the names or totals change, so repeated keystrokes for
+    short, popular prefixes don't rescan their slice.
+    """
+
+    # Sorts after any character a name can contain
+    _PREFIX_END = '\U0010ffff'
+    # Summaries saved while a refresh was running may carry an older timestamp
+    _UPDATED_SLACK = timedelta(seconds=5)
+    # Bounds the memory used by memoized answers
+    _MAX_MEMOIZED = 10000
+
+    def __init__(self, background: bool = False):
+        super().__init__(background)
+        self._names: List[str] = []
+        self._new_names: List[str] = []
+        self._totals: Dict[str, int] = {}
+        self._results: Dict[Tuple[str, int], List[str]] = {}
+
+    def _add(self, disposable_id: int, name: str) -> None:
+        self._new_names.append(name)
+        self._results.clear()
+
+    def _clear(self) -> None:
+        self._names, self._new_names = [], []
+        self._totals = {}
+        self._results.clear()
+
+    def _fetch(self, since: Optional[datetime]) -> List[Tuple[str, int]]:
+        summaries = DisposableSummary.objects.all()
+        if since is not None:
+            summaries = summaries.filter(updated__gte=since - self._UPDATED_SLACK)
+        return list(summaries.values_list('disposable__name', 'total_votes'))
+
+    def _loaded(self, fetched: List[Tuple[str, int]]) -> None:
+        for name, total_votes in fetched:
+            self._totals[name] = total_votes
+            self._results.clear()
+
+    def _merge_new_names(self) -> None:
+        if self._new_names:
+            # Timsort merges the two sorted runs in linear time
+            self._new_names.sort()
+            self._names.extend(self._new_names)
+            self._names.sort()
+            self._new_names = []
+
+    def matches(self, prefix: str, limit: int = None) -> List[str]:
+        """Returns the known names starting with prefix, most voted first
+
+        Arguments:
+            prefix {str} -- The text typed so far, leading whitespace and case
+                are ignored
+
+        Keyword Arguments:
+            limit {int} -- The most names to return, defaults to
+                settings.AUTOCOMPLETE_MAX_RESULTS (default: {None})
+
+        Returns:
+            List[str] -- The matching names, ties are broken alphabetically
+        """
+        prefix = re.sub(r'\s+', ' ', prefix.lower()).lstrip()
+        limit = settings.AUTOCOMPLETE_MAX_RESULTS if limit is None else limit
+        if not prefix or limit < 1:
+            return []
+
+        self._use()
+        with self._lock:
+            results = self._results.get((prefix, limit))
+            if results is not None:
+                return results
+
+            self._merge_new_names()
+            start = bisect.bisect_left(self._names, prefix)
+            end = bisect.bisect_left(self._names, prefix + self._PREFIX_END, start)
+            totals = self._totals
+            # The slice is already alphabetical, so nlargest keeps that order for ties
+            results = heapq.nlargest(limit, self._names[start:end],
+                                     key=lambda name: totals.get(name, 0))
+            if len(self._results) >= self._MAX_MEMOIZED:
+                self._results.clear()
+            self._results[(prefix, limit)] = results
+        return results
+
+
+fuzzy_index = FuzzyIndex(background=settings.NAME_INDEX_BACKGROUND_REFRESH)
+prefix_index = PrefixIndex(background=settings.NAME_INDEX_BACKGROUND_REFRESH)
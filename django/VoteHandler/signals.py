@@ -0,0 +1,45 @@
+"""Signal receivers that keep VoteHandler's denormalized data in sync
+
+Receivers:
+    refresh_summary_on_vote_change -- Rebuilds the DisposableSummary whenever
+        a DisposableVote is saved or deleted
+    index_new_disposable -- Adds new Disposables to the in-process name indexes
+    forget_resumed_can -- Drops a can's cached account and CanInfo whenever
+        either is saved or deleted
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Config.models import CanInfo
+from .models import Disposable, DisposableVote
+from .presence import can_id_for_user
+from .resume import forget_can
+from .search import fuzzy_index, prefix_index
+from .utils import update_disposable_summary
+
+
+@receiver(post_save, sender=DisposableVote)
+@receiver(post_delete, sender=DisposableVote)
+def refresh_summary_on_vote_change(sender, instance, **kwargs):
+    """Rebuilds the summary of the disposable that the vote belongs to"""
+    update_disposable_summary(instance.disposable_id)
+
+
+@receiver(post_save, sender=Disposable)
+def index_new_disposable(sender, instance, created, **kwargs):
+    """Adds the disposable to the name indexes so it can be matched right away"""
+    if created:
+        fuzzy_index.add(instance.id, instance.name)
+        prefix_index.add(instance.id, instance.name)
+
+
+@receiver(post_save, sender=CanInfo)
+@receiver(post_delete, sender=CanInfo)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_resumed_can(sender, instance, **kwargs):
+    """Makes the next resume of the can load its account and CanInfo again"""
+    can_id = instance.can_id if sender is CanInfo else can_id_for_user(instance)
+    if can_id is not None:
+        forget_can(can_id)
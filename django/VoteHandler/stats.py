@@ -0,0 +1,13 @@
+"""Small statistics helpers shared by the metrics, benchmarks and load tests
+
+Functions:
+    percentile -- Nearest-rank percentile of an already sorted list
+"""
+import math
+from typing import List
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
@@ -0,0 +1,18 @@
+"""Tests for VoteHandler.admission"""
+from django.test import SimpleTestCase, override_settings
+
+from ..admission import LoginLimiter
+
+
+class LoginLimiterTestCase(SimpleTestCase):
+    @override_settings(MAX_CONCURRENT_LOGINS=2)
+    def test_limit(self):
+        """Log ins past the limit are turned away until one ends"""
+        limiter = LoginLimiter()
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release()
+        self.assertTrue(limiter.try_acquire())
+        self.assertEqual(limiter.in_progress, 2)
+        self.assertFalse(LoginLimiter(limit=0).try_acquire())
@@ -0,0 +1,64 @@
+"""Tests for the benchmark data generator and the view query budgets"""
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from Config.models import Bin, CanInfo
+from ..benchmarks import QUERY_BUDGETS, check_local_database, run_benchmarks
+from ..models import Category, Disposable, DisposableSummary, DisposableVote
+
+
+class BenchmarkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(id=19, name='Landfill')
+        call_command('generate_benchmark_data', disposables=50, votes=120, cans=3,
+                     categories=4, verbosity=0)
+
+    def test_generated_data(self):
+        """The requested rows are created along with their summaries"""
+        self.assertEqual(Disposable.objects.count(), 50)
+        self.assertEqual(DisposableVote.objects.count(), 120)
+        self.assertEqual(DisposableSummary.objects.count(), 50)
+        self.assertEqual(CanInfo.objects.count(), 3)
+        self.assertEqual(Category.objects.count(), 4)
+        self.assertTrue(all(3 <= can.bin_set.count() <= 4 for can in CanInfo.objects.all()))
+        self.assertFalse(Bin.objects.filter(category=None).exists())
+
+    def test_flush(self):
+        """--flush replaces the generated data instead of adding to it"""
+        call_command('generate_benchmark_data', disposables=10, votes=10, cans=1,
+                     categories=4, flush=True, verbosity=0)
+        self.assertEqual(Disposable.objects.count(), 10)
+        self.assertEqual(CanInfo.objects.count(), 1)
+
+    def test_query_budgets(self):
+        """No hot path view runs more queries than its budget"""
+        results = run_benchmarks(repeat=2)
+        self.assertEqual([result['view'] for result in results], list(QUERY_BUDGETS))
+        for result in results:
+            self.assertFalse(result['over_budget'], result)
+            self.assertLess(max(result['statuses']), 400, result)
+
+    def test_refuses_remote_database(self):
+        """Neither command runs against another host without opting in"""
+        remote = {'ENGINE': 'django.db.backends.mysql', 'HOST': 'db.example.com'}
+        with patch.dict(connection.settings_dict, remote):
+            with self.assertRaisesMessage(CommandError, 'db.example.com'):
+                call_command('generate_benchmark_data', disposables=1, votes=1, cans=1,
+                             flush=True, verbosity=0)
+            with self.assertRaisesMessage(CommandError, 'db.example.com'):
+                call_command('benchmark_views', repeat=1)
+            check_local_database(allow_remote=True)
+        with patch.dict(connection.settings_dict, {'ENGINE': 'django.db.backends.mysql',
+                                                   'HOST': '127.0.0.1'}):
+            check_local_database()
+        self.assertEqual(Disposable.objects.count(), 50)
+
+    def test_rolled_back(self):
+        """Benchmarking doesn't change the data"""
+        run_benchmarks(repeat=1, views=['carousel_vote', 'register'])
+        self.assertEqual(CanInfo.objects.count(), 3)
+        self.assertEqual(DisposableVote.objects.count(), 120)
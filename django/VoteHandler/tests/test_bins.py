@@ -0,0 +1,41 @@
+"""Tests for VoteHandler's bin routing"""
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from Config.models import Bin, CanInfo
+from ..bins import BinRouting
+from ..models import Category
+
+
+UUID = '00000000-0000-0000-0000-000000000000'
+
+
+class BinRoutingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(UUID.replace('-', ''), password='')
+        cls.landfill = Category.objects.update_or_create(id=19, defaults={'name': 'Landfill'})[0]
+        cls.metal = Category.objects.create(name='test_metal')
+        cls.paper = Category.objects.create(name='test_paper')
+        cls.can_info = CanInfo.objects.create(can_id=UUID, owner=cls.user)
+        Bin.objects.create(s_id=cls.can_info, bin_num=0, category=cls.landfill)
+        Bin.objects.create(s_id=cls.can_info, bin_num=1, category=cls.metal)
+        Bin.objects.create(s_id=cls.can_info, bin_num=2, category=None)
+
+    def test_for_user(self):
+        """Loads every categorized bin and the default bin in one query"""
+        with self.assertNumQueries(1):
+            routing = BinRouting.for_user(self.user)
+        self.assertEqual(routing.category_bins, {self.landfill.id: 0, self.metal.id: 1})
+        self.assertEqual(routing.default_bin, 0)
+
+    def test_for_user_without_can(self):
+        """A user without a can gets an empty routing"""
+        routing = BinRouting.for_user(User.objects.create_user('nobody', password=''))
+        self.assertIsNone(routing.get_bin(self.metal.id))
+
+    def test_get_bin(self):
+        """Matching categories get their bin, others fall back to the default"""
+        routing = BinRouting.for_user(self.user)
+        self.assertEqual(routing.get_bin(self.metal.id), 1)
+        self.assertEqual(routing.get_bin(self.paper.id), 0)
@@ -0,0 +1,79 @@
+"""Tests for VoteHandler.broadcast and the broadcast command"""
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from Config.models import CanInfo
+from .. import presence
+from ..broadcast import ALL_CANS_GROUP, broadcast_command, broadcast_refresh_bins
+from ..models import Category
+from ..utils import can_group_name
+
+
+CAN_IDS = [f'0000000000000000000000000000000{num}' for num in range(5)]
+
+
+class BroadcastTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dispatcher = Mock()
+
+    def test_every_can(self):
+        """Every can is reached with one group send"""
+        self.assertIsNone(broadcast_command({'command': 'close'}, dispatcher=self.dispatcher))
+        self.dispatcher.group_send.assert_called_once_with(
+            ALL_CANS_GROUP, {'type': 'ws.broadcast', 'content': {'command': 'close'}})
+
+    @override_settings(BROADCAST_BATCH_SIZE=2)
+    def test_some_cans(self):
+        """Only online cans are sent to, a batch of groups at a time"""
+        for can_id in CAN_IDS[1:4]:
+            presence.mark_online(can_id, 'channel')
+        sent = broadcast_refresh_bins(iter(CAN_IDS), dispatcher=self.dispatcher)
+        self.assertEqual(sent, 3)
+        message = {'type': 'ws.refresh_bins'}
+        self.assertEqual(self.dispatcher.group_send_many.call_args_list, [
+            (([can_group_name(CAN_IDS[1])], message),),
+            (([can_group_name(CAN_IDS[2]), can_group_name(CAN_IDS[3])], message),),
+        ])
+
+    def test_no_command(self):
+        """Content the cans can't act on is refused"""
+        with self.assertRaises(ValueError):
+            broadcast_command({'message': 'hi'}, dispatcher=self.dispatcher)
+        self.dispatcher.group_send.assert_not_called()
+
+
+@patch('VoteHandler.management.commands.broadcast.channel_dispatcher')
+class BroadcastCommandTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(id=19, name='Landfill')
+        for num, can_id in enumerate(CAN_IDS[:2]):
+            user = User.objects.create_user(can_id, password='')
+            CanInfo.objects.create(can_id=can_id, owner=user, config=f'{{"building": {num}}}')
+            presence.mark_online(can_id, 'channel')
+
+    @patch('VoteHandler.broadcast.channel_dispatcher')
+    def test_filter(self, dispatcher, command_dispatcher):
+        """Cans can be picked by their config"""
+        out = StringIO()
+        call_command('broadcast', '{"command": "close"}',
+                     '--config-contains', '"building": 1', stdout=out)
+        self.assertIn('Sent to 1 online cans', out.getvalue())
+        dispatcher.group_send_many.assert_called_once_with(
+            [can_group_name(CAN_IDS[1])], {'type': 'ws.broadcast', 'content': {'command': 'close'}})
+        command_dispatcher.join.assert_called_once_with()
+
+    def test_bad_arguments(self, _):
+        """Exactly one of a command and --refresh-bins is needed"""
+        with self.assertRaises(CommandError):
+            call_command('broadcast')
+        with self.assertRaises(CommandError):
+            call_command('broadcast', '{"command": "close"}', '--refresh-bins')
+        with self.assertRaises(CommandError):
+            call_command('broadcast', 'not json')
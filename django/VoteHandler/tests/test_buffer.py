@@ -0,0 +1,82 @@
+"""Tests for VoteHandler's write-behind vote buffer"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..buffer import VoteBuffer
+from ..cache import get_classification
+from ..models import Category, Disposable, DisposableVote
+
+
+class VoteBufferTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.disposable = Disposable.objects.create(name='test_disposable')
+        cls.category_1 = Category.objects.create(name='test_category_1')
+        cls.category_2 = Category.objects.create(name='test_category_2')
+
+    def setUp(self):
+        cache.clear()
+        self.buffer = VoteBuffer(flush_interval=None, flush_size=10)
+
+    def test_add_does_not_write(self):
+        """Buffered votes are summed in memory only"""
+        self.buffer.add(self.disposable, self.category_1, 1)
+        self.buffer.add(self.disposable, self.category_1, 2)
+        self.buffer.add(self.disposable, self.category_2, 0)
+        self.assertEqual(self.buffer.pending_for(self.disposable.id), {self.category_1.id: 3})
+        self.assertFalse(DisposableVote.objects.exists())
+
+    def test_flush(self):
+        """Flushing writes one row per (disposable, category) and empties the buffer"""
+        for _ in range(3):
+            self.buffer.add(self.disposable, self.category_1, 1)
+        self.buffer.add(self.disposable, self.category_2, 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(DisposableVote.objects.get(category=self.category_1).count, 3)
+        self.assertEqual(DisposableVote.objects.get(category=self.category_2).count, 2)
+        self.assertEqual(self.buffer.pending_for(self.disposable.id), {})
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_flush_on_size(self):
+        """Reaching the flush size writes the buffer right away"""
+        self.buffer.add(self.disposable, self.category_1, 9)
+        self.assertFalse(DisposableVote.objects.exists())
+        self.buffer.add(self.disposable, self.category_1, 1)
+        self.assertEqual(DisposableVote.objects.get(category=self.category_1).count, 10)
+
+    @patch('VoteHandler.buffer.apply_vote_deltas', side_effect=RuntimeError)
+    def test_failed_flush_keeps_votes(self, _):
+        """Votes are kept for the next flush when writing fails"""
+        self.buffer.add(self.disposable, self.category_1, 2)
+        with self.assertRaises(RuntimeError):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.pending_for(self.disposable.id), {self.category_1.id: 2})
+
+    @patch('VoteHandler.buffer.apply_vote_deltas', side_effect=RuntimeError)
+    def test_failed_flush_on_size(self, _):
+        """A flush on size that fails doesn't fail the vote that triggered it"""
+        self.buffer.add(self.disposable, self.category_1, 9)
+        self.buffer.add(self.disposable, self.category_1, 1)
+        self.assertEqual(self.buffer.pending_for(self.disposable.id), {self.category_1.id: 10})
+
+    def test_merge_without_stored_votes(self):
+        """Items whose only votes are buffered still classify"""
+        self.assertIsNone(self.buffer.merge(self.disposable.name, None))
+        self.buffer.add(self.disposable, self.category_2, 4)
+        merged = self.buffer.merge(self.disposable.name, None)
+        self.assertEqual(merged.top_category_id, self.category_2.id)
+        self.assertEqual(merged.total_votes, 4)
+
+    def test_merge_matches_flushed(self):
+        """Merging buffered votes gives the same result as flushing them"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=3)
+        self.buffer.add(self.disposable, self.category_2, 5)
+        merged = self.buffer.merge(self.disposable.name, get_classification(self.disposable.name))
+        self.assertEqual(merged.top_category_id, self.category_2.id)
+
+        self.buffer.flush()
+        self.assertEqual(self.buffer.merge(self.disposable.name,
+                                           get_classification(self.disposable.name)),
+                         merged)
@@ -0,0 +1,65 @@
+"""Tests for VoteHandler's classification cache"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..cache import _key, get_classification, normalize_name
+from ..models import Category, Disposable, DisposableVote
+
+
+class NormalizeNameTestCase(TestCase):
+    def test_normalize_name(self):
+        """Case and whitespace differences normalize to the same name"""
+        self.assertEqual(normalize_name('  Plastic \t BOTTLE '), 'plastic bottle')
+
+
+class GetClassificationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.disposable = Disposable.objects.create(name='plastic bottle')
+        cls.category = Category.objects.create(name='test_category')
+
+    def setUp(self):
+        cache.clear()
+        self.votes = DisposableVote.objects.create(disposable=self.disposable,
+                                                   category=self.category,
+                                                   count=3)
+
+    def test_no_votes(self):
+        """Items without votes classify as None, and that is cached too"""
+        self.votes.delete()
+        self.assertIsNone(get_classification('plastic bottle'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_classification('plastic bottle'))
+
+    def test_cached_after_first_read(self):
+        """Repeat reads of any spelling of the name don't touch the database"""
+        classification = get_classification('Plastic Bottle')
+        self.assertEqual(classification.disposable_id, self.disposable.id)
+        self.assertEqual(classification.top_category_id, self.category.id)
+        self.assertEqual(classification.total_votes, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_classification('plastic  bottle'), classification)
+
+    def test_invalidated_on_vote(self):
+        """A new vote is visible on the next read"""
+        get_classification('plastic bottle')
+        self.votes.add_votes(2)
+        self.assertEqual(get_classification('plastic bottle').total_votes, 5)
+
+    def test_stale_served_while_locked(self):
+        """While another caller recomputes, the stale entry is served"""
+        get_classification('plastic bottle')
+        entry = cache.get(_key('plastic bottle'))
+        entry['fresh_until'] = 0
+        cache.set(_key('plastic bottle'), entry)
+        cache.add(_key('plastic bottle', prefix='classification-lock'), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_classification('plastic bottle').total_votes, 3)
+
+    @patch('VoteHandler.cache._WAIT_TIMEOUT_S', 0)
+    def test_computes_when_lock_holder_is_slow(self):
+        """With nothing to serve and a stuck lock, the caller computes itself"""
+        cache.add(_key('plastic bottle', prefix='classification-lock'), 1)
+        self.assertEqual(get_classification('plastic bottle').total_votes, 3)
@@ -0,0 +1,25 @@
+"""Tests for VoteHandler's system checks"""
+from django.test import SimpleTestCase, override_settings
+
+from ..checks import check_presence_cache
+
+
+REDIS_LAYER = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}}
+MEMORY_LAYER = {'default': {'BACKEND': 'SmartCanAPI.layers.InMemoryChannelLayer'}}
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+REDIS_CACHE = {'default': {'BACKEND': 'django_redis.cache.RedisCache',
+                           'LOCATION': 'redis://localhost:6379/1'}}
+
+
+class PresenceCacheCheckTestCase(SimpleTestCase):
+    @override_settings(CHANNEL_LAYERS=REDIS_LAYER, CACHES=LOCAL_CACHE)
+    def test_shared_layer_local_cache(self):
+        """A redis channel layer with a per process cache is warned about"""
+        self.assertEqual([warning.id for warning in check_presence_cache()],
+                         ['VoteHandler.W001'])
+
+    def test_consistent(self):
+        """One process, or a shared cache, is fine"""
+        for layers, caches in [(MEMORY_LAYER, LOCAL_CACHE), (REDIS_LAYER, REDIS_CACHE)]:
+            with self.settings(CHANNEL_LAYERS=layers, CACHES=caches):
+                self.assertEqual(check_presence_cache(), [])
@@ -0,0 +1,368 @@
+"""Tests for VoteHandler's websocket consumers"""
+import json
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from Config.models import Bin, CanInfo
+from .. import presence
+from ..bins import BinRouting
+from ..broadcast import broadcast_command
+from ..consumers import AsyncCommanderConsumer, rotate_command
+from ..metrics import latency_for
+from ..models import Category
+from ..resume import make_resume_token
+from ..utils import notify_bins_changed, send_rotate_to_can
+from ..wire import decode, encode, negotiate
+
+
+UUID = '00000000000000000000000000000000'
+PASSWORD = 'secret'
+
+
+TEST_CHANNEL_LAYERS = {'default': {'BACKEND': 'SmartCanAPI.layers.InMemoryChannelLayer'}}
+
+
+class RotateCommandTestCase(SimpleTestCase):
+    def test_rotate_command(self):
+        """Categories without a bin go to the default bin, if there is one"""
+        routing = BinRouting({1: 0, 2: 3}, default_bin=0)
+        self.assertEqual(rotate_command(routing, 2), {'command': 'rotate', 'position': '3'})
+        self.assertEqual(rotate_command(routing, 5), {'command': 'rotate', 'position': '0'})
+        self.assertIsNone(rotate_command(BinRouting({1: 0}), 5))
+
+
+class WireTestCase(SimpleTestCase):
+    def test_negotiate(self):
+        """msgpack is preferred, JSON is the fallback"""
+        self.assertEqual(negotiate(['json', 'msgpack']), 'msgpack')
+        self.assertEqual(negotiate(['json']), 'json')
+        self.assertEqual(negotiate(['bogus']), 'json')
+        self.assertEqual(negotiate('msgpack'), 'json')
+
+    def test_round_trip(self):
+        """Messages come back unchanged, and only maps are accepted"""
+        content = {'command': 'rotate', 'position': '2'}
+        self.assertEqual(decode(encode(content)), content)
+        self.assertLess(len(encode(content)), len('{"command": "rotate", "position": "2"}'))
+        with self.assertRaises(ValueError):
+            decode(encode([1, 2]))
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class AsyncCommanderConsumerTestCase(TransactionTestCase):
+    """Sockets run on an event loop and query from other threads, so the data
+    has to be committed"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(UUID, password=PASSWORD)
+        self.landfill = Category.objects.create(id=19, name='Landfill')
+        self.glass = Category.objects.create(name='Glass')
+        self.paper = Category.objects.create(name='Paper')
+        self.can_info = CanInfo.objects.create(can_id=UUID, owner=self.user)
+        Bin.objects.create(s_id=self.can_info, bin_num=0, category=self.landfill)
+        Bin.objects.create(s_id=self.can_info, bin_num=2, category=self.glass)
+
+    async def _connect(self):
+        communicator = WebsocketCommunicator(AsyncCommanderConsumer, '/ws/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await communicator.receive_json_from(), {'command': 'identify'})
+        return communicator
+
+    async def _identify(self, communicator, password=PASSWORD):
+        await communicator.send_json_to({'command': 'identify', 'username': UUID,
+                                         'password': password})
+        return await communicator.receive_json_from()
+
+    async def _connect_identified(self):
+        communicator = await self._connect()
+        await self._identify(communicator)
+        self.assertEqual((await communicator.receive_json_from())['command'], 'heartbeat')
+        self.assertEqual((await communicator.receive_json_from())['command'], 'resume_token')
+        return communicator
+
+    async def _send_rotate(self, category):
+        self.assertTrue(await sync_to_async(send_rotate_to_can)(self.user, category.id))
+
+    def test_identify(self):
+        """A can with valid credentials is told so, and how often to heartbeat"""
+        async def run():
+            communicator = await self._connect()
+            responses = [await self._identify(communicator),
+                         await communicator.receive_json_from()]
+            online = presence.is_online(UUID)
+            await communicator.disconnect()
+            return responses, online
+
+        (response, heartbeat), online = async_to_sync(run)()
+        self.assertEqual(response['command'], 'info')
+        self.assertIn('succesful', response['message'])
+        self.assertEqual(heartbeat, {'command': 'heartbeat',
+                                     'interval': settings.PRESENCE_HEARTBEAT_INTERVAL})
+        self.assertTrue(online)
+        # Offline again after disconnecting, without touching the CanInfo
+        self.assertFalse(presence.is_online(UUID))
+        self.can_info.refresh_from_db()
+        self.assertIsNone(self.can_info.channel_name)
+
+    @override_settings(MAX_CONCURRENT_LOGINS=0, RECONNECT_RETRY_AFTER=10)
+    def test_overloaded(self):
+        """Cans past the log in limit are told when to retry and closed"""
+        async def run():
+            communicator = await self._connect()
+            response = await self._identify(communicator)
+            closed = await communicator.receive_output()
+            return response, closed
+
+        response, closed = async_to_sync(run)()
+        self.assertEqual(response, {'error': AsyncCommanderConsumer.OVERLOADED,
+                                    'retry_after': 10})
+        self.assertEqual(closed, {'type': 'websocket.close',
+                                  'code': AsyncCommanderConsumer.OVERLOADED_CLOSE_CODE})
+
+    def test_heartbeat(self):
+        """A heartbeat brings back a can whose presence expired"""
+        async def run():
+            communicator = await self._connect_identified()
+            cache.clear()
+            await communicator.send_json_to({'command': 'heartbeat'})
+            await communicator.receive_nothing(timeout=0.1)
+            online = presence.is_online(UUID)
+            await communicator.disconnect()
+            return online
+
+        self.assertTrue(async_to_sync(run)())
+
+    def test_heartbeat_rejoins_groups(self):
+        """A heartbeat keeps a long lived socket in its groups past group_expiry"""
+        async def run():
+            communicator = await self._connect_identified()
+            # Age every membership past the layer's group_expiry
+            for members in get_channel_layer().groups.values():
+                for channel in members:
+                    members[channel] = 0
+            await communicator.send_json_to({'command': 'heartbeat'})
+            await communicator.receive_nothing(timeout=0.1)
+            await sync_to_async(broadcast_command)({'command': 'close'})
+            await self._send_rotate(self.glass)
+            responses = [await communicator.receive_json_from(),
+                         await communicator.receive_json_from()]
+            await communicator.disconnect()
+            return responses
+
+        self.assertEqual(async_to_sync(run)(), [
+            {'command': 'close'},
+            {'command': 'rotate', 'position': '2'},
+        ])
+
+    def test_rotate_offline(self):
+        """Rotates for a can that isn't connected aren't sent"""
+        self.assertFalse(send_rotate_to_can(self.user, self.glass.id))
+
+    def test_identify_rejected(self):
+        """A can with bad credentials gets an error and is disconnected"""
+        async def run():
+            communicator = await self._connect()
+            response = await self._identify(communicator, password='wrong')
+            closed = await communicator.receive_output()
+            return response, closed
+
+        response, closed = async_to_sync(run)()
+        self.assertEqual(response, {'error': AsyncCommanderConsumer.LOGIN_REJECTED})
+        self.assertEqual(closed, {'type': 'websocket.close',
+                                  'code': AsyncCommanderConsumer.LOGIN_REJECTED_CLOSE_CODE})
+
+    def test_not_identified(self):
+        """Commands before identifying are answered by asking to identify"""
+        async def run():
+            communicator = await self._connect()
+            await communicator.send_json_to({'command': 'echo', 'message': 'hi'})
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        self.assertEqual(async_to_sync(run)(), {'command': 'identify'})
+
+    def test_rotate(self):
+        """Rotates go to the category's bin, or the default category's bin"""
+        async def run():
+            communicator = await self._connect_identified()
+            responses = []
+            for category in (self.glass, self.paper):
+                await self._send_rotate(category)
+                responses.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return responses
+
+        self.assertEqual(async_to_sync(run)(), [
+            {'command': 'rotate', 'position': '2'},
+            {'command': 'rotate', 'position': '0'},
+        ])
+
+    def test_refresh_bins(self):
+        """Bin changes reach the socket without a reconnect"""
+        def move_glass():
+            Bin.objects.filter(category=self.glass).update(bin_num=1)
+            notify_bins_changed(self.can_info)
+
+        async def run():
+            communicator = await self._connect_identified()
+            await database_sync_to_async(move_glass)()
+            # Let the refresh message be handled before the rotate
+            await communicator.receive_nothing(timeout=0.2)
+            await self._send_rotate(self.glass)
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        self.assertEqual(async_to_sync(run)(), {'command': 'rotate', 'position': '1'})
+
+    def test_broadcast(self):
+        """Broadcasts reach every identified socket"""
+        async def run():
+            communicator = await self._connect_identified()
+            await sync_to_async(broadcast_command)({'command': 'close'})
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        self.assertEqual(async_to_sync(run)(), {'command': 'close'})
+
+    @override_settings(PING_INTERVAL=0.05, PING_MISSED_LIMIT=2)
+    def test_ping(self):
+        """Pongs are timed, and cans that stop answering are closed"""
+        async def run():
+            communicator = await self._connect_identified()
+            ping = await communicator.receive_json_from(timeout=1)
+            await communicator.send_json_to({'command': 'pong', 'id': ping['id']})
+            # Stop answering
+            await communicator.receive_json_from(timeout=1)
+            await communicator.receive_json_from(timeout=1)
+            closed = await communicator.receive_output(timeout=1)
+            online = presence.is_online(UUID)
+            await communicator.disconnect()
+            return ping, closed, online
+
+        ping, closed, online = async_to_sync(run)()
+        self.assertEqual(ping['command'], 'ping')
+        self.assertEqual(closed, {'type': 'websocket.close',
+                                  'code': AsyncCommanderConsumer.PING_TIMEOUT_CLOSE_CODE})
+        self.assertFalse(online)
+        self.assertEqual(latency_for([UUID])[UUID]['count'], 1)
+
+    @override_settings(PING_INTERVAL=0.05, PING_MISSED_LIMIT=2)
+    def test_ping_resumed(self):
+        """Resumed cans are pinged too, and heartbeats don't keep a can that stopped answering"""
+        async def run():
+            communicator = await self._connect()
+            token = await sync_to_async(make_resume_token)(self.user)
+            await communicator.send_json_to({'command': 'identify', 'token': token})
+            for _ in range(3):
+                await communicator.receive_json_from()
+            received = []
+            while True:
+                # Heartbeats still arrive, only the pongs are missing
+                await communicator.send_json_to({'command': 'heartbeat'})
+                output = await communicator.receive_output(timeout=1)
+                if output['type'] == 'websocket.close':
+                    break
+                received.append(json.loads(output['text']))
+            await communicator.disconnect()
+            return received, output
+
+        received, closed = async_to_sync(run)()
+        self.assertEqual([message['command'] for message in received], ['ping', 'ping'])
+        self.assertEqual(closed, {'type': 'websocket.close',
+                                  'code': AsyncCommanderConsumer.PING_TIMEOUT_CLOSE_CODE})
+
+    def test_resume(self):
+        """A can reconnects with its resume token instead of its password"""
+        async def run():
+            communicator = await self._connect()
+            await self._identify(communicator)
+            await communicator.receive_json_from()
+            token = (await communicator.receive_json_from())['token']
+            await communicator.disconnect()
+
+            communicator = await self._connect()
+            with patch('VoteHandler.consumers.authenticate') as authenticate:
+                await communicator.send_json_to({'command': 'identify', 'token': token})
+                response = await communicator.receive_json_from()
+            online = presence.is_online(UUID)
+            await communicator.send_json_to({'command': 'identify', 'token': token + 'x'})
+            rejected = [await communicator.receive_json_from() for _ in range(4)][-2:]
+            await communicator.disconnect()
+            return response, authenticate.called, online, rejected
+
+        response, authenticated, online, rejected = async_to_sync(run)()
+        self.assertIn('succesful', response['message'])
+        self.assertFalse(authenticated)
+        self.assertTrue(online)
+        self.assertEqual(rejected, [{'error': AsyncCommanderConsumer.RESUME_REJECTED},
+                                    {'command': 'identify'}])
+
+    def test_acks(self):
+        """Cans that ack get numbered commands, resent until acked"""
+        async def run():
+            communicator = await self._connect()
+            await communicator.send_json_to({'command': 'identify', 'username': UUID,
+                                             'password': PASSWORD, 'acks': True})
+            for _ in range(3):
+                await communicator.receive_json_from()
+            await self._send_rotate(self.glass)
+            sent = await communicator.receive_json_from()
+            resent = await communicator.receive_json_from(timeout=1)
+            for status in ('queued', 'done'):
+                await communicator.send_json_to({'command': 'ack', 'seq': sent['seq'],
+                                                 'status': status})
+            await communicator.receive_nothing(timeout=0.3)
+            await communicator.disconnect()
+            return sent, resent
+
+        with self.settings(COMMAND_ACK_TIMEOUT=0.1):
+            sent, resent = async_to_sync(run)()
+        self.assertEqual(sent, {'command': 'rotate', 'position': '2', 'seq': 1})
+        self.assertEqual(resent, sent)
+        self.assertEqual(latency_for([UUID], 'delivery')[UUID]['count'], 1)
+        self.assertEqual(latency_for([UUID], 'completion')[UUID]['count'], 1)
+
+    def test_ack_without_acks(self):
+        """Cans that didn't ask for acks get plain commands and can't ack"""
+        async def run():
+            communicator = await self._connect_identified()
+            await self._send_rotate(self.glass)
+            sent = await communicator.receive_json_from()
+            await communicator.send_json_to({'command': 'ack', 'seq': 1, 'status': 'queued'})
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return sent, response
+
+        sent, response = async_to_sync(run)()
+        self.assertNotIn('seq', sent)
+        self.assertEqual(response, {'error': AsyncCommanderConsumer.UNKNOWN_CMD})
+
+    def test_msgpack(self):
+        """Cans that offer msgpack are switched to binary frames"""
+        async def run():
+            communicator = await self._connect()
+            await communicator.send_json_to({'command': 'identify', 'username': UUID,
+                                             'password': PASSWORD,
+                                             'encodings': ['msgpack', 'json']})
+            switch = [await communicator.receive_json_from() for _ in range(4)][-1]
+            await communicator.send_to(bytes_data=encode({'command': 'echo', 'message': 'hi'}))
+            echo = await communicator.receive_from()
+            await communicator.disconnect()
+            return switch, echo
+
+        switch, echo = async_to_sync(run)()
+        self.assertEqual(switch, {'command': 'encoding', 'encoding': 'msgpack'})
+        self.assertEqual(decode(echo), {'message': 'hi'})
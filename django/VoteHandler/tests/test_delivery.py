@@ -0,0 +1,64 @@
+"""Tests for VoteHandler.delivery"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from ..delivery import DONE, QUEUED, REJECTED, CommandWindow
+
+
+ROTATE = {'command': 'rotate', 'position': '2'}
+
+
+@patch('VoteHandler.delivery.time.monotonic')
+class CommandWindowTestCase(SimpleTestCase):
+    def test_window(self, monotonic):
+        """Commands past the window wait for an ack to make room"""
+        monotonic.return_value = 0
+        commands = CommandWindow(window=2)
+        self.assertEqual(commands.push(ROTATE), [dict(ROTATE, seq=1)])
+        self.assertEqual(commands.push(ROTATE), [dict(ROTATE, seq=2)])
+        self.assertEqual(commands.push(ROTATE), [])
+        self.assertEqual(commands.unacked, 3)
+        self.assertEqual(commands.ack(1, QUEUED), [dict(ROTATE, seq=3)])
+        # Acks for unknown or already acked commands change nothing
+        self.assertEqual(commands.ack(1, QUEUED), [])
+        self.assertEqual(commands.ack('bogus', QUEUED), [])
+        self.assertEqual(commands.unacked, 2)
+
+    def test_latencies(self, monotonic):
+        """Delivery is timed up to queued, completion up to done"""
+        monotonic.return_value = 0
+        commands = CommandWindow()
+        commands.push(ROTATE)
+        commands.push(ROTATE)
+        monotonic.return_value = 0.05
+        commands.ack(1, QUEUED)
+        commands.ack(2, REJECTED)
+        monotonic.return_value = 2
+        commands.ack(1, DONE)
+        # A rejected command never completes
+        commands.ack(2, DONE)
+        self.assertEqual(commands.delivery.summary()['max'], 50)
+        self.assertEqual(commands.completion.summary(),
+                         {'count': 1, 'p50': 2000, 'p95': 2000, 'p99': 2000, 'max': 2000})
+        self.assertEqual(commands.rejected, 1)
+
+    def test_retry(self, monotonic):
+        """Unacked commands are resent after the timeout, then given up on"""
+        monotonic.return_value = 0
+        commands = CommandWindow(window=1, ack_timeout=5, max_attempts=2)
+        commands.push(ROTATE)
+        commands.push(ROTATE)
+        self.assertEqual(commands.next_due(), 5)
+        monotonic.return_value = 4
+        self.assertEqual(commands.due(), [])
+        monotonic.return_value = 5
+        self.assertEqual(commands.due(), [dict(ROTATE, seq=1)])
+        self.assertEqual(commands.next_due(), 10)
+        # Giving up makes room for the next command
+        monotonic.return_value = 10
+        self.assertEqual(commands.due(), [dict(ROTATE, seq=2)])
+        self.assertEqual(commands.lost, 1)
+        self.assertEqual(commands.unacked, 1)
+        commands.ack(2, QUEUED)
+        self.assertIsNone(commands.next_due())
@@ -0,0 +1,165 @@
+"""Tests for VoteHandler's background channel dispatcher"""
+import asyncio
+import socket
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import channel_layers, get_channel_layer
+from channels_redis.core import RedisChannelLayer
+from django.test import SimpleTestCase, override_settings
+
+from ..dispatch import ChannelDispatcher
+
+
+TEST_CHANNEL_LAYERS = {'default': {'BACKEND': 'SmartCanAPI.layers.InMemoryChannelLayer'}}
+REDIS_CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [('localhost', 6379)], 'prefix': 'test-dispatch:'},
+    },
+}
+
+
+def redis_available() -> bool:
+    try:
+        socket.create_connection(('localhost', 6379), timeout=0.2).close()
+    except OSError:
+        return False
+    return True
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class ChannelDispatcherTestCase(SimpleTestCase):
+    def setUp(self):
+        self.channel_layer = get_channel_layer()
+        self.channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)('test', self.channel)
+
+    def receive_all(self):
+        messages = []
+        while self.channel_layer.channels.get(self.channel):
+            messages.append(async_to_sync(self.channel_layer.receive)(self.channel))
+        return messages
+
+    def test_background(self):
+        """Messages are sent from the sender thread, in order"""
+        dispatcher = ChannelDispatcher()
+        sent_from = []
+        group_send = self.channel_layer.group_send
+
+        async def recording_group_send(group, message):
+            sent_from.append(threading.current_thread().name)
+            await group_send(group, message)
+
+        with patch.object(self.channel_layer, 'group_send', recording_group_send):
+            for num in range(5):
+                self.assertTrue(dispatcher.group_send('test', {'type': 'test', 'num': num}))
+            self.assertTrue(dispatcher.join(timeout=5))
+
+        self.assertEqual([message['num'] for message in self.receive_all()], list(range(5)))
+        self.assertEqual(set(sent_from), {'channel-dispatcher'})
+
+    def test_full_queue_drops(self):
+        """Messages are dropped rather than waited on when the queue is full"""
+        dispatcher = ChannelDispatcher(max_queued=1)
+        release = threading.Event()
+        group_send = self.channel_layer.group_send
+
+        async def blocked_group_send(group, message):
+            release.wait()
+            await group_send(group, message)
+
+        with patch.object(self.channel_layer, 'group_send', blocked_group_send):
+            self.assertTrue(dispatcher.group_send('test', {'type': 'test', 'num': 0}))
+            # Wait for the sender to take the first message and block on it
+            while dispatcher._queue.qsize():
+                pass
+            self.assertTrue(dispatcher.group_send('test', {'type': 'test', 'num': 1}))
+            self.assertFalse(dispatcher.group_send('test', {'type': 'test', 'num': 2}))
+            self.assertFalse(dispatcher.join(timeout=0.05))
+            release.set()
+            self.assertTrue(dispatcher.join(timeout=5))
+
+        self.assertEqual([message['num'] for message in self.receive_all()], [0, 1])
+
+    def test_failed_send_is_dropped(self):
+        """A failing send doesn't stop the messages after it"""
+        dispatcher = ChannelDispatcher()
+        group_send = self.channel_layer.group_send
+
+        async def flaky_group_send(group, message):
+            if message['num'] == 0:
+                raise ConnectionError
+            await group_send(group, message)
+
+        with patch.object(self.channel_layer, 'group_send', flaky_group_send):
+            dispatcher.group_send('test', {'type': 'test', 'num': 0})
+            dispatcher.group_send('test', {'type': 'test', 'num': 1})
+            self.assertTrue(dispatcher.join(timeout=5))
+
+        self.assertEqual([message['num'] for message in self.receive_all()], [1])
+
+    def test_foreground(self):
+        """Without the background thread, messages are sent before returning"""
+        dispatcher = ChannelDispatcher(background=False)
+        self.assertTrue(dispatcher.group_send('test', {'type': 'test', 'num': 0}))
+        self.assertIsNone(dispatcher._sender)
+        self.assertEqual(self.receive_all(), [{'type': 'test', 'num': 0}])
+
+
+@override_settings(CHANNEL_LAYERS=REDIS_CHANNEL_LAYERS)
+class RedisChannelDispatcherTestCase(SimpleTestCase):
+    def setUp(self):
+        # channels keeps the layers it made when CHANNEL_LAYERS is overridden
+        previous = channel_layers.set(DEFAULT_CHANNEL_LAYER,
+                                      channel_layers.make_backend(DEFAULT_CHANNEL_LAYER))
+        if previous is None:
+            self.addCleanup(channel_layers.backends.pop, DEFAULT_CHANNEL_LAYER)
+        else:
+            self.addCleanup(channel_layers.set, DEFAULT_CHANNEL_LAYER, previous)
+
+    def test_own_layer(self):
+        """The sender doesn't share the consumers' redis layer, its pools belong to their loop"""
+        dispatcher = ChannelDispatcher()
+        sent_with = []
+
+        async def recording_group_send(layer, group, message):
+            sent_with.append((layer, asyncio.get_event_loop()))
+
+        with patch.object(RedisChannelLayer, 'group_send', recording_group_send):
+            dispatcher.group_send('test', {'type': 'test', 'num': 0})
+            self.assertTrue(dispatcher.join(timeout=5))
+            dispatcher.group_send('test', {'type': 'test', 'num': 1})
+            self.assertTrue(dispatcher.join(timeout=5))
+
+        (first_layer, first_loop), (second_layer, second_loop) = sent_with
+        self.assertIsInstance(first_layer, RedisChannelLayer)
+        self.assertIsNot(first_layer, get_channel_layer())
+        # One layer and loop for the life of the sender
+        self.assertIs(first_layer, second_layer)
+        self.assertIs(first_loop, second_loop)
+
+    @skipUnless(redis_available(), 'needs a redis server on localhost:6379')
+    def test_redis_delivery(self):
+        """Messages reach a group joined through redis on another loop"""
+        dispatcher = ChannelDispatcher()
+
+        async def exchange():
+            # Opens the shared layer's pool on this loop, not the sender's
+            channel_layer = get_channel_layer()
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add('test', channel)
+            for num in range(3):
+                dispatcher.group_send('test', {'type': 'test', 'num': num})
+            sent = await asyncio.get_event_loop().run_in_executor(None, dispatcher.join, 5)
+            messages = [await asyncio.wait_for(channel_layer.receive(channel), 5)
+                        for _ in range(3)]
+            await channel_layer.group_discard('test', channel)
+            return sent, messages
+
+        sent, messages = async_to_sync(exchange)()
+        self.assertTrue(sent)
+        self.assertEqual([message['num'] for message in messages], [0, 1, 2])
@@ -0,0 +1,124 @@
+"""Tests for VoteHandler's vote ingestion"""
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..ingestion import apply_vote_deltas, ingest_votes
+from ..models import Category, Disposable, DisposableSummary, DisposableVote
+
+
+class ApplyVoteDeltasTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.disposable = Disposable.objects.create(name='test_disposable')
+        cls.category_1 = Category.objects.create(name='test_category_1')
+        cls.category_2 = Category.objects.create(name='test_category_2')
+
+    def count(self, category):
+        """Convenience method for reading the current count"""
+        return DisposableVote.objects.get(disposable=self.disposable, category=category).count
+
+    def test_creates_missing_votes(self):
+        """Votes that didn't exist are created with the weight as their count"""
+        apply_vote_deltas([(self.disposable.id, self.category_1.id, 3)])
+        self.assertEqual(self.count(self.category_1), 3)
+
+    def test_increments_existing_votes(self):
+        """Votes that existed are incremented"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=2)
+        apply_vote_deltas([(self.disposable.id, self.category_1.id, 3)])
+        self.assertEqual(self.count(self.category_1), 5)
+
+    def test_coalesces_and_skips_non_positive(self):
+        """Deltas for the same row are merged and non-positive weights ignored"""
+        applied = apply_vote_deltas([
+            (self.disposable.id, self.category_1.id, 1),
+            (self.disposable.id, self.category_2.id, 0),
+            (self.disposable.id, self.category_1.id, 2),
+            (self.disposable.id, self.category_2.id, -4),
+        ])
+        self.assertEqual(applied, {(self.disposable.id, self.category_1.id): 3})
+        self.assertEqual(self.count(self.category_1), 3)
+        self.assertFalse(DisposableVote.objects.filter(category=self.category_2).exists())
+
+    def test_updates_summary(self):
+        """The summary reflects the batch once it is applied"""
+        apply_vote_deltas([(self.disposable.id, self.category_1.id, 1),
+                           (self.disposable.id, self.category_2.id, 4)])
+        summary = DisposableSummary.objects.get(disposable=self.disposable)
+        self.assertEqual(summary.total_votes, 5)
+        self.assertEqual(summary.top_category, self.category_2)
+
+
+class IngestVotesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.disposable = Disposable.objects.create(name='test_disposable')
+        cls.category = Category.objects.create(name='test_category')
+
+    def test_success(self):
+        """Names are resolved and the default weight is used when omitted"""
+        accepted, rejected = ingest_votes([
+            ['TEST_disposable', self.category.name, 2],
+            [self.disposable.name, self.category.name],
+        ])
+        self.assertEqual((accepted, rejected), (2, []))
+        count = DisposableVote.objects.get(disposable=self.disposable).count
+        self.assertEqual(count, 2 + settings.CATEGORIZE_VOTE_WEIGHT)
+
+    def test_creates_missing_disposable(self):
+        """Votes for items that don't exist yet create the item"""
+        accepted, _ = ingest_votes([['New Item', self.category.name, 1]])
+        self.assertEqual(accepted, 1)
+        self.assertTrue(DisposableVote.objects.filter(disposable__name='new item').exists())
+
+    def test_normalizes_names(self):
+        """Names differing only in case and spacing reach the same row"""
+        accepted, _ = ingest_votes([['Paper  Cup', self.category.name, 1],
+                                    [' paper cup ', self.category.name, 1]])
+        self.assertEqual(accepted, 2)
+        vote = DisposableVote.objects.get(disposable__name='paper cup')
+        self.assertEqual(vote.count, 2)
+
+    def test_rejects_bad_entries(self):
+        """Malformed entries and unknown categories are reported by index"""
+        accepted, rejected = ingest_votes([
+            ['item'],
+            [self.disposable.name, 'not a category', 1],
+            [self.disposable.name, self.category.name, 'heavy'],
+            [self.disposable.name, self.category.name, 1],
+        ])
+        self.assertEqual(accepted, 1)
+        self.assertEqual([error['index'] for error in rejected], [0, 1, 2])
+
+    def test_rejects_non_positive_weights(self):
+        """Zero and negative weights are reported, not counted as applied"""
+        accepted, rejected = ingest_votes([
+            [self.disposable.name, self.category.name, 0],
+            [self.disposable.name, self.category.name, -3],
+            [self.disposable.name, self.category.name, 2],
+        ])
+        self.assertEqual(accepted, 1)
+        self.assertEqual([error['index'] for error in rejected], [0, 1])
+        self.assertEqual(DisposableVote.objects.get(disposable=self.disposable).count, 2)
+
+    def test_failed_batch_creates_nothing(self):
+        """Items created for a batch are rolled back with it"""
+        with patch('VoteHandler.ingestion.apply_vote_deltas', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                ingest_votes([['brand new', self.category.name, 1]])
+        self.assertFalse(Disposable.objects.filter(name='brand new').exists())
+
+    def test_creates_missing_disposables_in_one_query(self):
+        """Every new item of a batch is inserted at once"""
+        names = [f'new item {num}' for num in range(5)]
+        with patch('VoteHandler.ingestion.apply_vote_deltas'), \
+                CaptureQueriesContext(connection) as queries:
+            ingest_votes([[name, self.category.name] for name in names])
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Disposable.objects.filter(name__in=names).count(), 5)
@@ -0,0 +1,58 @@
+"""Tests for the load generator's HTTP client and statistics"""
+import asyncio
+
+from django.test import SimpleTestCase
+
+from ..loadtest import HttpSession, LoadTestStats
+
+
+class LoadTestStatsTestCase(SimpleTestCase):
+    def test_summary(self):
+        """Steps without requests have no latencies"""
+        stats = LoadTestStats()
+        stats.record('home', 0.002)
+        summary = stats.summary()
+        self.assertEqual(summary['steps']['home']['requests'], 1)
+        self.assertEqual(summary['steps']['home']['latency_ms']['p99'], 2)
+        self.assertNotIn('latency_ms', summary['steps']['dispose'])
+
+
+class HttpSessionTestCase(SimpleTestCase):
+    RESPONSES = [
+        b'HTTP/1.1 200 OK\r\nSet-Cookie: csrftoken=abc; Path=/\r\n'
+        b'Content-Length: 2\r\n\r\nhi',
+        b'HTTP/1.1 302 Found\r\nLocation: /api/\r\nTransfer-Encoding: chunked\r\n\r\n'
+        b'3\r\nfoo\r\n3\r\nbar\r\n0\r\n\r\n',
+    ]
+
+    def test_keep_alive(self):
+        """Cookies are kept and sent back, both body framings are read"""
+        requests = []
+
+        async def handle(reader, writer):
+            for response in self.RESPONSES:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+                requests.append(head + await reader.readexactly(length))
+                writer.write(response)
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            session = HttpSession('127.0.0.1', port)
+            first = await session.request('GET', '/accounts/login/')
+            second = await session.request('POST', '/accounts/login/', {'username': 'can'})
+            await session.close()
+            server.close()
+            return first, second
+
+        first, second = asyncio.new_event_loop().run_until_complete(run())
+        self.assertEqual(first, (200, {'set-cookie': 'csrftoken=abc; Path=/',
+                                       'content-length': '2'}, b'hi'))
+        self.assertEqual(second[0], 302)
+        self.assertEqual(second[1]['location'], '/api/')
+        self.assertEqual(second[2], b'foobar')
+        self.assertIn(b'Cookie: csrftoken=abc', requests[1])
+        self.assertIn(b'X-CSRFToken: abc', requests[1])
+        self.assertTrue(requests[1].endswith(b'username=can'))
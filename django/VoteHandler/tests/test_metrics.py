@@ -0,0 +1,65 @@
+"""Tests for VoteHandler.metrics"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from Config.models import CanInfo
+from ..metrics import PingTracker, RollingPercentiles, latency_for, record_latency
+from ..models import Category
+
+
+UUID = '00000000000000000000000000000001'
+
+
+class RollingPercentilesTestCase(SimpleTestCase):
+    def test_window(self):
+        """Only the most recent samples count"""
+        latencies = RollingPercentiles(window=4)
+        self.assertIsNone(latencies.summary())
+        for value in (100, 1, 2, 3, 4):
+            latencies.add(value)
+        self.assertEqual(len(latencies), 4)
+        self.assertEqual(latencies.summary(),
+                         {'count': 4, 'p50': 2, 'p95': 4, 'p99': 4, 'max': 4})
+
+
+class PingTrackerTestCase(SimpleTestCase):
+    @patch('VoteHandler.metrics.time.monotonic')
+    def test_round_trip(self, monotonic):
+        """Pongs are timed against their ping, older pings count as lost"""
+        tracker = PingTracker()
+        monotonic.return_value = 10
+        first = tracker.ping(15)
+        second = tracker.ping(15)
+        self.assertEqual(first, {'command': 'ping', 'id': 1, 'interval': 15})
+        self.assertEqual(tracker.unanswered, 2)
+
+        monotonic.return_value = 10.25
+        self.assertEqual(tracker.pong(second['id']), 250)
+        self.assertEqual(tracker.unanswered, 0)
+        self.assertIsNone(tracker.pong(first['id']))
+        self.assertIsNone(tracker.pong('bogus'))
+        self.assertEqual(len(tracker.latencies), 1)
+
+
+class LatencyCommandTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(id=19, name='Landfill')
+        user = User.objects.create_user(UUID, password='')
+        CanInfo.objects.create(can_id=UUID, owner=user)
+
+    def test_latency(self):
+        """Saved summaries are read back and listed"""
+        summary = {'count': 3, 'p50': 20.0, 'p95': 40.0, 'p99': 40.0, 'max': 40.0}
+        record_latency(UUID, summary)
+        self.assertEqual(latency_for([UUID]), {UUID: summary})
+
+        out = StringIO()
+        call_command('can_latency', stdout=out)
+        self.assertIn(f'{UUID}  p50    20.00ms', out.getvalue())
+        self.assertIn('1 of 1 cans', out.getvalue())
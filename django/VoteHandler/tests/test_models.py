@@ -5,7 +5,7 @@ from django.core.exceptions import EmptyResultSet
 from django.db import IntegrityError
 from django.test import TestCase
 
-from VoteHandler.models import Category, Disposable, DisposableVote
+from VoteHandler.models import Category, Disposable, DisposableSummary, DisposableVote
 
 
 TEST_CATEGORY_NAME = 'test_Category'
@@ -54,6 +54,11 @@ class DisposableTestCase(TestCase):
         """Correct top category is returned from valid call"""
         self.assertEqual(self.disposable.get_top_category(), self.category_2)
 
+    def test_disposable_get_top_category_single_query(self):
+        """The top category and its name are fetched in one query"""
+        with self.assertNumQueries(1):
+            self.assertEqual(self.disposable.get_top_category().name, self.category_2.name)
+
     def test_disposable_get_top_category_empty_filter(self):
         """Correct error is raised when top category is called but there are no votes"""
         with self.assertRaises(EmptyResultSet):
@@ -67,6 +72,13 @@ class DisposableTestCase(TestCase):
         self.assertEqual(list(self.disposable.get_top_votes(2)), votes_list[:2])
         self.assertEqual(list(self.disposable.get_top_votes(1)), votes_list[:1])
 
+    def test_disposable_get_top_votes_single_query(self):
+        """The votes and their categories are fetched in one query"""
+        with self.assertNumQueries(1):
+            votes = self.disposable.get_top_votes()
+            self.assertEqual([vote.category for vote in votes],
+                             [self.category_1, self.category_2])
+
     def test_disposable_get_top_votes_bad_slice_size(self):
         """Get top votes when slice size is less than one or not an integer"""
         with self.assertRaises(IndexError):
@@ -79,7 +91,7 @@ class DisposableTestCase(TestCase):
     def test_disposable_get_top_votes_empty_filter(self):
         """Correct error is raised when top votes is called but there are no votes"""
         with self.assertRaises(EmptyResultSet):
-            self.disposable_no_votes.get_top_category()
+            self.disposable_no_votes.get_top_votes()
 
     def test_disposable_save_lowercases_name(self):
         """Save lowercases the name field"""
@@ -131,3 +143,44 @@ class DisposableVoteTestCase(TestCase):
 
         with self.assertRaises(TypeError):
             self.votes.add_votes('not an integer')
+
+
+class DisposableSummaryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.disposable = Disposable.objects.create(name=TEST_DISPOSABLE_NAME)
+        cls.category_1 = Category.objects.create(name=TEST_CATEGORY_NAME + '_1')
+        cls.category_2 = Category.objects.create(name=TEST_CATEGORY_NAME + '_2')
+
+    def test_summary_created_on_vote(self):
+        """Saving a vote creates the summary"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=3)
+        summary = DisposableSummary.objects.get(disposable=self.disposable)
+        self.assertEqual(summary.total_votes, 3)
+        self.assertEqual(summary.top_category, self.category_1)
+
+    def test_summary_updated_on_vote(self):
+        """Changing votes moves the top category and total"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=3)
+        votes_2 = DisposableVote.objects.create(disposable=self.disposable,
+                                                category=self.category_2,
+                                                count=1)
+        votes_2.add_votes(5)
+        summary = DisposableSummary.objects.get(disposable=self.disposable)
+        self.assertEqual(summary.total_votes, 9)
+        self.assertEqual(summary.top_category, self.category_2)
+        self.assertEqual([name for name, _ in summary.get_percentages()],
+                         [self.category_2.name, self.category_1.name])
+
+    def test_summary_removed_with_last_vote(self):
+        """Deleting every vote removes the summary"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=3)
+        DisposableVote.objects.filter(disposable=self.disposable).delete()
+        self.assertFalse(DisposableSummary.objects.filter(disposable=self.disposable).exists())
+
+    def test_percentages_round_trip(self):
+        """Percentages survive being stored as JSON"""
+        percentages = [(self.category_2.name, 75.0), (self.category_1.name, 25.0)]
+        summary = DisposableSummary(disposable=self.disposable, top_category=self.category_2)
+        summary.set_percentages(percentages)
+        self.assertEqual(summary.get_percentages(), percentages)
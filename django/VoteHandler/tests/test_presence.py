@@ -0,0 +1,36 @@
+"""Tests for VoteHandler.presence"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from .. import presence
+
+
+UUID = '00000000-0000-0000-0000-000000000001'
+
+
+class PresenceTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_can_id_for_user(self):
+        """Can accounts are named by the can id, other accounts have none"""
+        self.assertEqual(presence.can_id_for_user(User(username=UUID.replace('-', ''))),
+                         UUID.replace('-', ''))
+        self.assertIsNone(presence.can_id_for_user(User(username='admin')))
+        self.assertIsNone(presence.can_id_for_user(None))
+
+    def test_online_and_offline(self):
+        """Dashed and plain can ids are the same can"""
+        self.assertFalse(presence.is_online(UUID))
+        presence.mark_online(UUID, 'first')
+        self.assertEqual(presence.online_channel(UUID.replace('-', '')), 'first')
+        presence.mark_offline(UUID, 'first')
+        self.assertFalse(presence.is_online(UUID))
+
+    def test_stale_disconnect(self):
+        """An old socket disconnecting doesn't hide the can's new socket"""
+        presence.mark_online(UUID, 'old')
+        presence.mark_online(UUID, 'new')
+        presence.mark_offline(UUID, 'old')
+        self.assertEqual(presence.online_channel(UUID), 'new')
@@ -0,0 +1,64 @@
+"""Tests for VoteHandler's resume tokens"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from Config.models import CanInfo
+from ..models import Category
+from ..resume import make_resume_token, resume
+
+
+UUID = '00000000000000000000000000000001'
+
+
+class ResumeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(id=19, name='Landfill')
+        self.user = User.objects.create_user(UUID, password='secret')
+        self.can_info = CanInfo.objects.create(can_id=UUID, owner=self.user)
+
+    def test_resume(self):
+        """A token resumes as its can, from the cache after the first time"""
+        token = make_resume_token(self.user)
+        self.assertEqual(resume(token), (self.user, self.can_info))
+        with self.assertNumQueries(0):
+            user, can_info = resume(token)
+        self.assertEqual((user.pk, can_info.pk), (self.user.pk, self.can_info.pk))
+
+    def test_not_a_can(self):
+        """Accounts that aren't a can's get no token"""
+        self.assertIsNone(make_resume_token(User(username='admin')))
+
+    def test_invalid(self):
+        """Tampered, expired and garbage tokens are refused"""
+        token = make_resume_token(self.user)
+        self.assertIsNone(resume(token[:-1]))
+        self.assertIsNone(resume('garbage'))
+        self.assertIsNone(resume(None))
+        with self.settings(RESUME_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(resume(token))
+
+    def test_password_change(self):
+        """Changing a can's password revokes its tokens, even cached ones"""
+        token = make_resume_token(self.user)
+        self.assertIsNotNone(resume(token))
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertIsNone(resume(token))
+        self.assertIsNotNone(resume(make_resume_token(self.user)))
+
+    def test_deleted_can(self):
+        """Tokens of a deleted can are refused"""
+        token = make_resume_token(self.user)
+        self.assertIsNotNone(resume(token))
+        self.can_info.delete()
+        self.assertIsNone(resume(token))
+
+    def test_inactive(self):
+        """Deactivated accounts can't resume"""
+        token = make_resume_token(self.user)
+        self.assertIsNotNone(resume(token))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(resume(token))
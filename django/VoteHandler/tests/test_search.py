@@ -0,0 +1,151 @@
+"""Tests for VoteHandler's name indexes"""
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ..models import Category, Disposable, DisposableVote
+from ..search import FuzzyIndex, PrefixIndex, TrigramIndex, levenshtein
+
+
+class LevenshteinTestCase(TestCase):
+    def test_distance(self):
+        """Insertions, deletions and substitutions each cost one"""
+        self.assertEqual(levenshtein('bottle', 'bottle'), 0)
+        self.assertEqual(levenshtein('bottle', 'bottles'), 1)
+        self.assertEqual(levenshtein('plastic', 'plastc'), 1)
+        self.assertEqual(levenshtein('cup', 'cap'), 1)
+        self.assertEqual(levenshtein('', 'abc'), 3)
+
+    def test_max_distance(self):
+        """Stops early and reports max_distance + 1 when too far apart"""
+        self.assertEqual(levenshtein('paper', 'plastic bottle', max_distance=2), 3)
+        self.assertEqual(levenshtein('bottle', 'bottles', max_distance=2), 1)
+
+
+class TrigramIndexTestCase(TestCase):
+    def test_search(self):
+        """Finds every word within the distance, closest first"""
+        index = TrigramIndex()
+        for word in ['bottle', 'bottles', 'battle', 'paper', 'bottle']:
+            index.add(word)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.search('bottle', 1), [(0, 'bottle'), (1, 'battle'), (1, 'bottles')])
+        self.assertEqual(index.search('cardboard', 2), [])
+        self.assertEqual(TrigramIndex().search('bottle', 2), [])
+
+    def test_edits_at_the_ends(self):
+        """Edits to the first and last characters, or too short to filter, still match"""
+        index = TrigramIndex()
+        for word in ['plastic bottle', 'cup']:
+            index.add(word)
+        self.assertEqual(index.search('blastic bottlf', 2), [(2, 'plastic bottle')])
+        self.assertEqual(index.search('lastic bottl', 2), [(2, 'plastic bottle')])
+        self.assertEqual(index.search('cap', 1), [(1, 'cup')])
+
+    def test_matches_brute_force(self):
+        """Returns exactly the words a full scan with levenshtein would"""
+        words = ['paper', 'papers', 'paper cup', 'pepper', 'tape', 'ape', 'plastic cup',
+                 'plastic cap', 'aaaa', 'aaab', 'abab', 'paper towel', 'paper towels']
+        index = TrigramIndex()
+        for word in words:
+            index.add(word)
+        for query in words + ['papr', 'plastik cups', 'ba', 'towel paper']:
+            for max_distance in range(4):
+                expected = sorted((levenshtein(query, word), word) for word in words
+                                  if levenshtein(query, word) <= max_distance)
+                self.assertEqual(index.search(query, max_distance), expected)
+
+
+@override_settings(FUZZY_MATCH_MAX_DISTANCE=2, FUZZY_MATCH_CHARS_PER_EDIT=5)
+class FuzzyIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = FuzzyIndex()
+        Disposable.objects.create(name='plastic bottle')
+        Disposable.objects.create(name='can')
+
+    def test_matches(self):
+        """Misspellings of long enough names match, the name itself doesn't"""
+        self.assertEqual(self.index.matches('plastc bottles'), ['plastic bottle'])
+        self.assertEqual(self.index.matches('plastic bottle'), [])
+        self.assertEqual(self.index.matches('cat'), [])
+
+    def test_incremental_refresh(self):
+        """Rows created after loading show up once the index refreshes"""
+        self.index.refresh()
+        Disposable.objects.create(name='paper towel')
+        self.index.refresh()
+        self.assertEqual(self.index.matches('paper towels'), [])
+        with self.assertNumQueries(1):
+            self.index.refresh(force=True)
+        self.assertEqual(self.index.matches('paper towels'), ['paper towel'])
+
+    def test_add(self):
+        """Added rows match without a refresh"""
+        self.index.refresh()
+        self.index.add(1000, 'glass jar')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.matches('glass jars'), ['glass jar'])
+
+
+@override_settings(AUTOCOMPLETE_MAX_RESULTS=2)
+class PrefixIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.category = Category.objects.create(name='whatever')
+        for name, count in [('plastic bag', 1), ('plastic bottle', 3),
+                            ('plastic cup', 0), ('paper', 9)]:
+            disposable = Disposable.objects.create(name=name)
+            if count:
+                DisposableVote.objects.create(disposable=disposable,
+                                              category=self.category, count=count)
+
+    def test_matches(self):
+        """Names with the prefix are returned most voted first, up to the limit"""
+        self.assertEqual(self.index.matches('Plastic '), ['plastic bottle', 'plastic bag'])
+        self.assertEqual(self.index.matches('plastic', limit=5),
+                         ['plastic bottle', 'plastic bag', 'plastic cup'])
+        self.assertEqual(self.index.matches('p', limit=1), ['paper'])
+        self.assertEqual(self.index.matches('glass'), [])
+        self.assertEqual(self.index.matches(''), [])
+
+    def test_refresh_totals(self):
+        """Vote totals that changed elsewhere are picked up by the next refresh"""
+        self.index.matches('plastic')
+        cup = Disposable.objects.get(name='plastic cup')
+        DisposableVote.objects.create(disposable=cup, category=self.category, count=7)
+        self.index.refresh(force=True)
+        self.assertEqual(self.index.matches('plastic'), ['plastic cup', 'plastic bottle'])
+
+    def test_add(self):
+        """Added names are suggested without a refresh"""
+        self.index.matches('plastic')
+        self.index.add(1000, 'plastic box')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.matches('plastic b'),
+                             ['plastic bottle', 'plastic bag'])
+            self.assertEqual(self.index.matches('plastic bo', limit=5),
+                             ['plastic bottle', 'plastic box'])
+
+
+@override_settings(FUZZY_MATCH_MAX_DISTANCE=2, FUZZY_MATCH_CHARS_PER_EDIT=5)
+class BackgroundRefreshTestCase(TransactionTestCase):
+    """The refresh thread reads through its own connection, so the data is committed"""
+
+    def test_background_refresh(self):
+        """Using the index starts a refresh without waiting for it"""
+        Disposable.objects.create(name='plastic bottle')
+        index = FuzzyIndex(background=True)
+        with self.assertNumQueries(0):
+            index.matches('plastc bottles')
+        index._refresher.join(timeout=5)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.matches('plastc bottles'), ['plastic bottle'])
+        self.assertFalse(index._refresher.is_alive())
+
+    def test_background_prefix_refresh(self):
+        """Autocomplete never queries on the request, not even to load the totals"""
+        Disposable.objects.create(name='plastic bottle')
+        index = PrefixIndex(background=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.matches('plastic'), [])
+        index._refresher.join(timeout=5)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.matches('plastic'), ['plastic bottle'])
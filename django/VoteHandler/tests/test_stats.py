@@ -0,0 +1,12 @@
+"""Tests for VoteHandler's statistics helpers"""
+from django.test import SimpleTestCase
+
+from ..stats import percentile
+
+
+class PercentileTestCase(SimpleTestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
@@ -3,11 +3,14 @@ from unittest.mock import patch
 
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
 
-from Config.models import CanInfo
-from ..models import Category, Disposable, DisposableVote
-from ..utils import send_rotate_to_can, votes_to_percentages
+from .. import presence
+from ..models import Category, Disposable, DisposableSummary, DisposableVote
+from ..utils import (can_group_name, counts_to_percentages, send_rotate_to_can,
+                     update_disposable_summary, votes_to_percentages)
 
 
 class SendRotateToCanTestCase(TestCase):
@@ -21,35 +24,86 @@ class SendRotateToCanTestCase(TestCase):
                                             password='')
 
     def setUp(self):
-        _ = Category.objects.create(id=19, name='Landfill')
-        CanInfo.objects.update_or_create(can_id=self.UUID,
-                                         owner=self.USER,
-                                         channel_name=self.CHANNEL_NAME)
+        cache.clear()
 
     def test_user_is_none(self):
         """Does a None user return False"""
         self.assertFalse(send_rotate_to_can(None, self.BIN_NUM))
 
-    def test_can_info_does_not_exist(self):
-        """A CanInfo where a matching user cannot be found returns False"""
+    def test_not_a_can_account(self):
+        """A user that isn't named by a can id returns False"""
         fake_user = User(username='Fake', password='')
         self.assertFalse(send_rotate_to_can(fake_user, self.BIN_NUM))
 
-    def test_request_channel_is_none(self):
-        """When the channel on the CanInfo is None, return False"""
-        CanInfo.objects.filter(can_id=self.UUID).update(channel_name=None)
+    def test_can_is_offline(self):
+        """When the can has no connected socket, return False"""
         self.assertFalse(send_rotate_to_can(self.USER, self.BIN_NUM))
 
     # So it turns out you need to address where the funcends up, not where it
     # comes from. You also need to address this location in a way that this
     # file can find it, hence the VoteHandler prefix
-    @patch('VoteHandler.utils.get_channel_layer')
-    @patch('VoteHandler.utils.async_to_sync')
-    def test_valid_input_succeeds(self, async_patch, chan_patch):
+    @patch('VoteHandler.utils.channel_dispatcher')
+    def test_valid_input_succeeds(self, dispatcher_patch):
         """When called with valid input, the func returns True"""
-        self.assertTrue(send_rotate_to_can(self.USER, self.BIN_NUM))
-        async_patch.assert_called_once()
-        chan_patch.assert_called_once()
+        presence.mark_online(self.UUID, self.CHANNEL_NAME)
+        with self.assertNumQueries(0):
+            self.assertTrue(send_rotate_to_can(self.USER, self.BIN_NUM))
+        dispatcher_patch.group_send.assert_called_once_with(
+            can_group_name(self.UUID), {'type': 'ws.rotate', 'category': self.BIN_NUM})
+
+
+class UpdateDisposableSummaryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.disposable = Disposable.objects.create(name='test_Disposable')
+        cls.category_1 = Category.objects.create(name='test_Category_1')
+        cls.category_2 = Category.objects.create(name='test_Category_2')
+
+    def test_disposable_does_not_exist(self):
+        """Returns None when there is no disposable with that id"""
+        self.assertIsNone(update_disposable_summary(self.disposable.id + 1000))
+
+    def test_no_votes(self):
+        """Returns None and removes stale summaries when there are no votes"""
+        DisposableSummary.objects.create(disposable=self.disposable, top_category=self.category_1)
+        self.assertIsNone(update_disposable_summary(self.disposable.id))
+        self.assertFalse(DisposableSummary.objects.exists())
+
+    def test_matches_votes(self):
+        """The summary agrees with the vote helpers it replaces"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=100)
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_2, count=300)
+        # Rebuild from a stale row to make sure nothing is carried over
+        DisposableSummary.objects.filter(disposable=self.disposable).update(total_votes=0)
+
+        summary = update_disposable_summary(self.disposable.id)
+        votes = DisposableVote.objects.filter(disposable=self.disposable)
+        self.assertEqual(summary.total_votes, 400)
+        self.assertEqual(summary.top_category, self.disposable.get_top_category())
+        self.assertEqual(summary.get_percentages(), votes_to_percentages(votes))
+        self.assertEqual(DisposableSummary.objects.get(disposable=self.disposable), summary)
+
+    def test_ties_match_top_category(self):
+        """Ties go to the same category that get_top_category picks"""
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_1, count=5)
+        DisposableVote.objects.create(disposable=self.disposable, category=self.category_2, count=5)
+        summary = update_disposable_summary(self.disposable.id)
+        self.assertEqual(summary.top_category, self.disposable.get_top_category())
+
+
+class CountsToPercentagesTestCase(TestCase):
+    def test_success(self):
+        """Counts are normalized against MIN_NORMALIZE_COUNT or the total"""
+        under = [('a', 1), ('b', 3)]
+        over = [('a', settings.MIN_NORMALIZE_COUNT), ('b', settings.MIN_NORMALIZE_COUNT*3)]
+        self.assertEqual(counts_to_percentages(under),
+                         [('b', 300/settings.MIN_NORMALIZE_COUNT),
+                          ('a', 100/settings.MIN_NORMALIZE_COUNT)])
+        self.assertEqual(counts_to_percentages(over), [('b', 75.0), ('a', 25.0)])
+
+    def test_known_total(self):
+        """A known total is used instead of summing"""
+        self.assertEqual(counts_to_percentages([('a', 100)], total=400), [('a', 25.0)])
 
 
 class VotesToPercentagesTestCase(TestCase):
@@ -90,6 +144,27 @@ class VotesToPercentagesTestCase(TestCase):
         expected_over = [(category_2.name, 3/4*100), (category_1.name, 1/4*100)]
         self.assertEqual(expected_over, tuples_over)
 
+    def test_single_query(self):
+        """Percentages are computed with one query"""
+        disposable = Disposable.objects.create(name=self.DISPOSABLE_NAME)
+        self.make_votes([(disposable, Category.objects.create(name=f'{self.CATEGORY_NAME}_{i}'), i)
+                         for i in range(1, 6)])
+        votes = DisposableVote.objects.filter(disposable=disposable)
+        with self.assertNumQueries(1):
+            tuples = votes_to_percentages(votes)
+        self.assertEqual([name for name, _ in tuples],
+                         [f'{self.CATEGORY_NAME}_{i}' for i in range(5, 0, -1)])
+
+    def test_without_window_functions(self):
+        """Databases without window functions sum the rows themselves"""
+        disposable = Disposable.objects.create(name=self.DISPOSABLE_NAME)
+        category = Category.objects.create(name=self.CATEGORY_NAME)
+        self.make_votes([(disposable, category, settings.MIN_NORMALIZE_COUNT * 2)])
+        votes = DisposableVote.objects.filter(disposable=disposable)
+        with patch.object(connection.features, 'supports_over_clause', False):
+            with self.assertNumQueries(1):
+                self.assertEqual(votes_to_percentages(votes), [(category.name, 100.0)])
+
     def test_wrong_input_type(self):
         """If votes is not a QuerySet or contains the wrong model, TypeError is raised"""
         with self.assertRaises(TypeError):
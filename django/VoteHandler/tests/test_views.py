@@ -1,14 +1,18 @@
 """Tests for VoteHandler's views"""
+import json
 from unittest.mock import patch
 from urllib.parse import urlencode
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from Config.models import Bin, CanInfo
+from ..cache import normalize_name
 from ..models import Category, Disposable, DisposableVote
+from ..search import fuzzy_index, prefix_index
 
 
 BIN_NUM = 0
@@ -22,6 +26,15 @@ class ViewsBaseObjectsMixin:
         cls.user = User.objects.create_user('someone', password='')
 
     def setUp(self):
+        # Cached classifications and indexed names outlive the rolled back test data
+        cache.clear()
+        fuzzy_index.reset()
+        prefix_index.reset()
+        # A background refresh couldn't see the uncommitted test data
+        for index in (fuzzy_index, prefix_index):
+            background = patch.object(index, 'background', False)
+            background.start()
+            self.addCleanup(background.stop)
         self.client.force_login(self.user)
         self.disposable, _ = Disposable.objects.update_or_create(name='test')
         self.category, _ = Category.objects.update_or_create(name='whatever')
@@ -60,6 +73,17 @@ class CategorizeTestCase(ViewsBaseObjectsMixin, TestCase):
         self.assertContains(resp, self.category.name)
         self.assertTemplateUsed(resp, 'VoteHandler/categorize.html')
 
+    def test_votes_from_summary(self):
+        """The votes are read from the summary, most voted first"""
+        paper = Category.objects.create(name='paper')
+        DisposableVote.objects.create(disposable=self.disposable, category=paper, count=3)
+        url = reverse('VoteHandler:categorize', kwargs={'disposable_name': self.disposable.name})
+        with patch.object(Disposable, 'get_top_votes') as get_top_votes:
+            resp = self.client.get(url)
+        get_top_votes.assert_not_called()
+        self.assertEqual(list(resp.context['votes'].items()),
+                         [('paper', 3), (self.category.name, 1)])
+
 
 class CarouselVoteTestCase(ViewsBaseObjectsMixin, TestCase):
     def test_disposable_not_found(self):
@@ -68,6 +92,15 @@ class CarouselVoteTestCase(ViewsBaseObjectsMixin, TestCase):
         with self.assertRaises(Disposable.DoesNotExist):
             self.client.post(reverse('VoteHandler:carousel_vote'), data)
 
+    def test_unnormalized_name(self):
+        """Votes for a name typed with other case and spacing reach its row"""
+        paper_cup = Disposable.objects.create(name=normalize_name('Paper  Cup'))
+        data = {'disp_item': 'Paper  Cup', 'vote': self.category.name}
+        resp = self.client.post(reverse('VoteHandler:carousel_vote'), data)
+        self.assertRedirects(resp, reverse('VoteHandler:home'), fetch_redirect_response=False)
+        vote_count = DisposableVote.objects.get(disposable=paper_cup).count
+        self.assertEqual(vote_count, settings.CATEGORIZE_VOTE_WEIGHT)
+
     def test_category_not_found(self):
         """DoesNotExist error when category doesn't exist"""
         data = {'disp_item': self.disposable, 'vote': 'does not exist'}
@@ -93,6 +126,127 @@ class CarouselVoteTestCase(ViewsBaseObjectsMixin, TestCase):
         self.assertEqual(old_count + settings.CATEGORIZE_VOTE_WEIGHT, new_count)
         self.assertRedirects(resp, reverse('VoteHandler:home'))
 
+    @override_settings(VOTE_BUFFER_ENABLED=True)
+    @patch('VoteHandler.views.vote_buffer')
+    def test_buffered(self, buffer_mock):
+        """When buffering is enabled, the vote goes to the buffer"""
+        old_count = self.vote_1.count
+        data = {'disp_item': self.disposable, 'vote': self.category}
+        resp = self.client.post(reverse('VoteHandler:carousel_vote'), data, follow=True)
+        buffer_mock.add.assert_called_once_with(self.disposable, self.category,
+                                                settings.CATEGORIZE_VOTE_WEIGHT)
+        self.assertEqual(old_count, DisposableVote.objects.get(disposable=self.disposable).count)
+        self.assertRedirects(resp, reverse('VoteHandler:home'))
+
+
+class VoteBatchTestCase(ViewsBaseObjectsMixin, TestCase):
+    def post_json(self, data):
+        """Convenience method for posting a JSON body"""
+        return self.client.post(reverse('VoteHandler:vote_batch'),
+                                json.dumps(data),
+                                content_type='application/json')
+
+    def test_bad_body(self):
+        """A body that isn't a vote list is a 400"""
+        for data in ({}, {'votes': 'nope'}, ['not', 'an', 'object']):
+            self.assertEqual(self.post_json(data).status_code, 400)
+
+    def test_too_many_votes(self):
+        """Batches over the maximum size are a 400"""
+        votes = [[self.disposable.name, self.category.name]] * (settings.VOTE_BATCH_MAX_SIZE + 1)
+        self.assertEqual(self.post_json({'votes': votes}).status_code, 400)
+
+    def test_success(self):
+        """Every accepted vote is applied and rejections are reported"""
+        old_count = self.vote_1.count
+        votes = [
+            [self.disposable.name, self.category.name, 2],
+            [self.disposable.name, self.category.name, 3],
+            [self.disposable.name, 'does not exist', 1],
+        ]
+        resp = self.post_json({'votes': votes})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['accepted'], 2)
+        self.assertEqual([error['index'] for error in resp.json()['rejected']], [2])
+        new_count = DisposableVote.objects.get(disposable=self.disposable).count
+        self.assertEqual(old_count + 5, new_count)
+
+
+class AutocompleteTestCase(ViewsBaseObjectsMixin, TestCase):
+    def test_suggestions(self):
+        """Known items starting with the text are suggested, most voted first"""
+        other = Disposable.objects.create(name='testing kit')
+        DisposableVote.objects.create(disposable=other, category=self.category, count=5)
+        Disposable.objects.create(name='paper')
+
+        resp = self.client.get(reverse('VoteHandler:autocomplete'), {'q': 'TE'})
+        self.assertEqual(resp.json(), {'results': ['testing kit', 'test']})
+
+    def test_no_queries_once_loaded(self):
+        """Keystrokes are answered from memory, only the login is read"""
+        self.client.get(reverse('VoteHandler:autocomplete'), {'q': 't'})
+        # The session and its user
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('VoteHandler:autocomplete'), {'q': 'tes'})
+        self.assertEqual(resp.json(), {'results': ['test']})
+
+    def test_login_required(self):
+        """Anonymous clients are sent to log in instead of listing items"""
+        self.client.logout()
+        url = reverse('VoteHandler:autocomplete')
+        resp = self.client.get(url, {'q': 't'})
+        self.assertRedirects(resp, f"{settings.LOGIN_URL}?{urlencode({'next': url + '?q=t'})}",
+                             fetch_redirect_response=False)
+
+    def test_empty(self):
+        """Nothing is suggested for blank or missing text"""
+        for params in ({}, {'q': '  '}):
+            resp = self.client.get(reverse('VoteHandler:autocomplete'), params)
+            self.assertEqual(resp.json(), {'results': []})
+
+
+class ClassifyTestCase(ViewsBaseObjectsMixin, TestCase):
+    def post_json(self, data):
+        """Convenience method for posting a JSON body"""
+        return self.client.post(reverse('VoteHandler:classify'),
+                                json.dumps(data),
+                                content_type='application/json')
+
+    def test_bad_body(self):
+        """A body that isn't a list of names is a 400"""
+        for data in ({}, {'items': 'nope'}, {'items': [1, 2]}):
+            self.assertEqual(self.post_json(data).status_code, 400)
+
+    def test_too_many_items(self):
+        """Batches over the maximum size are a 400"""
+        items = ['test'] * (settings.CLASSIFY_BATCH_MAX_SIZE + 1)
+        self.assertEqual(self.post_json({'items': items}).status_code, 400)
+
+    def test_success(self):
+        """Known items get their classification and unknown items get None"""
+        resp = self.post_json({'items': ['TEST', 'not in db']})
+        self.assertEqual(resp.status_code, 200)
+        known, unknown = resp.json()['results']
+        self.assertEqual(known['item'], 'TEST')
+        self.assertEqual(known['category'], self.category.name)
+        self.assertEqual(known['percentages'], [[self.category.name, 1.0]])
+        self.assertFalse(known['confident'])
+        self.assertIsNone(known['bin'])
+        self.assertIsNone(unknown['category'])
+
+    def test_query_count_is_fixed(self):
+        """Classifying many items costs the same as classifying one"""
+        names = [f'item {i}' for i in range(10)]
+        for name in names:
+            disposable = Disposable.objects.create(name=name)
+            DisposableVote.objects.create(disposable=disposable, category=self.category, count=1)
+        cache.clear()
+        with self.assertNumQueries(4):
+            self.post_json({'items': names[:1]})
+        cache.clear()
+        with self.assertNumQueries(4):
+            self.post_json({'items': names})
+
 
 class DisposeTestCase(ViewsBaseObjectsMixin, TestCase):
     def test_no_text_input(self):
@@ -137,6 +291,31 @@ class DisposeTestCase(ViewsBaseObjectsMixin, TestCase):
         self.assertRedirects(resp, reverse('VoteHandler:categorize', args=[self.disposable.name]))
         self.assertTemplateUsed(resp, 'VoteHandler/categorize.html')
 
+    @patch('VoteHandler.views.send_rotate_to_can')
+    def test_misspelled(self, rotate_mock):
+        """A misspelling of an item with votes is classified as that item"""
+        self.disposable.name = 'plastic bottle'
+        self.disposable.save()
+        self.vote_1.count = settings.MIN_NORMALIZE_COUNT
+        self.vote_1.save()
+        resp = self.client.post(
+            reverse('VoteHandler:dispose'), data={'disposable_item': 'Plastc Bottles'}
+        )
+
+        args = (self.disposable.id, self.category.id)
+        self.assertTrue(resp.url.startswith(reverse('VoteHandler:result', args=args)))
+        self.assertFalse(Disposable.objects.filter(name='plastc bottles').exists())
+        rotate_mock.assert_called_once()
+
+    def test_misspelled_without_votes(self):
+        """A misspelling of an item without votes is created as a new item"""
+        DisposableVote.objects.all().delete()
+        text = self.disposable.name + 's'
+        resp = self.client.post(reverse('VoteHandler:dispose'), data={'disposable_item': text})
+        self.assertRedirects(resp, reverse('VoteHandler:categorize', args=[text]),
+                             fetch_redirect_response=False)
+        self.assertTrue(Disposable.objects.filter(name=text).exists())
+
     @patch('VoteHandler.views.send_rotate_to_can')
     def test_success(self, rotate_mock):
         """Send rotate cmd and render the results page when there are enough votes"""
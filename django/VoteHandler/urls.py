@@ -8,7 +8,10 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('categorize/<str:disposable_name>', views.categorize, name='categorize'),
     path('dispose/', views.dispose, name='dispose'),
+    path('classify/', views.classify, name='classify'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('result/<int:disposable_id>/<int:category_id>/', views.result, name='result'),
     path('vote/carousel', views.carousel_vote, name='carousel_vote'),
+    path('vote/batch', views.vote_batch, name='vote_batch'),
     path('manual_rotate/', views.manual_rotate, name='manual_rotate'),
 ]
\ No newline at end of file
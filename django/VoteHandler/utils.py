@@ -1,58 +1,166 @@
 """Utility functions for use with categorization and disposal
 
 Functions:
+    can_group_name -- The channel layer group of a can's sockets
+    notify_bins_changed -- Tells a can's sockets to reload their bin routing
+    send_rotate_to_can -- Send the rotate command to the bin assosciated with
+        the user
+    counts_to_percentages -- Returns a descending list of categories with
+        confidence percentages from (category, count) pairs
+    update_disposable_summary -- Rebuilds the DisposableSummary of a disposable
+        from its votes
     votes_to_percentages -- Returns a descending list of categories with
         confidence percentages
 """
-from typing import List, Tuple
+from typing import Iterable, List, Optional, Tuple, Union
+import uuid
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db.models import QuerySet
+from django.db import connections, transaction
+from django.db.models import QuerySet, Sum, Window
 
 from Config.models import CanInfo
-from .models import DisposableVote
+from . import presence
+from .cache import invalidate_classification
+from .dispatch import channel_dispatcher
+from .models import Disposable, DisposableSummary, DisposableVote
+
+
+def can_group_name(can_id: Union[str, uuid.UUID]) -> str:
+    """The channel layer group of a can's sockets
+
+    Arguments:
+        can_id {Union[str, uuid.UUID]} -- The can's uuid, with or without hyphens
+
+    Returns:
+        str -- The group name
+    """
+    return f'can.{uuid.UUID(str(can_id)).hex}'
+
+
+def notify_bins_changed(can_info: CanInfo) -> None:
+    """Tells a can's sockets to reload their bin routing
+
+    The message is sent once the current transaction commits, so the sockets
+    never reload the old bins.
+
+    Arguments:
+        can_info {CanInfo} -- The can whose bins or default category changed
+    """
+    group = can_group_name(can_info.can_id)
+    transaction.on_commit(lambda: channel_dispatcher.group_send(
+        group,
+        {
+            "type": "ws.refresh_bins"
+        }
+    ))
+
 
 def send_rotate_to_can(user: User, bin_num: int) -> bool:
     """Send the rotate command to the bin assosciated with the user
 
+    The command goes to the can's channel layer group, and presence is read
+    from the cache, so nothing is queried from the database. The send itself
+    happens in the background, see VoteHandler.dispatch, so the request
+    doesn't wait on the channel layer.
+
     Arguments:
         user {User} -- The user account the can is logged in as
         bin_num {int} -- The bin number to rotate to
 
     Returns:
-        bool -- True if the command was sent, False otherwise.
+        bool -- True if the command was queued, False if the can is offline
+            or the command was dropped.
     """
     if user is None:
         return False
 
-    try:
-        can_info = CanInfo.objects.get(owner=user)
-    except CanInfo.DoesNotExist:
+    can_id = presence.can_id_for_user(user)
+    if can_id is None or not presence.is_online(can_id):
         return False
 
-    request_channel = can_info.channel_name
-    if request_channel is None:
-        return False
-
-    # Send msg to channel synchronously
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.send)(
-        request_channel,
+    return channel_dispatcher.group_send(
+        can_group_name(can_id),
         {
             "type": "ws.rotate",
             "category": bin_num
         }
     )
 
-    return True
+
+def update_disposable_summary(disposable_id: int) -> Optional[DisposableSummary]:
+    """Rebuilds the DisposableSummary of a disposable from its votes
+
+    The summary is recomputed from the DisposableVote rows rather than patched,
+    so it is always consistent with the votes once the transaction commits. The
+    disposable row is locked first so concurrent rebuilds for the same item are
+    serialized. The cached classification of the item is invalidated.
+
+    Arguments:
+        disposable_id {int} -- The id of the Disposable to summarize
+
+    Returns:
+        Optional[DisposableSummary] -- The new summary, or None if the
+            disposable does not exist or has no votes
+    """
+    with transaction.atomic():
+        names = Disposable.objects.select_for_update().filter(id=disposable_id)
+        name = names.values_list('name', flat=True).first()
+        if name is None:
+            return None
+        invalidate_classification(name)
+
+        # Order the same way get_top_category breaks ties, lowest id wins
+        votes = DisposableVote.objects.filter(disposable=disposable_id).order_by('-count', 'id')
+        rows = list(votes.values_list('category_id', 'category__name', 'count'))
+        if not rows:
+            DisposableSummary.objects.filter(disposable=disposable_id).delete()
+            return None
+
+        counts = [(category_name, count) for _, category_name, count in rows]
+        summary = DisposableSummary(
+            disposable_id=disposable_id,
+            total_votes=sum(count for _, count in counts),
+            top_category_id=rows[0][0]
+        )
+        summary.set_percentages(counts_to_percentages(counts))
+        summary.set_vote_counts(rows)
+        summary.save()
+    return summary
+
+
+def counts_to_percentages(counts: Iterable[Tuple[str, int]],
+                          total: int = None) -> List[Tuple[str, float]]:
+    """Returns a descending list of categories with confidence percentages
+
+    Arguments:
+        counts {Iterable[Tuple[str, int]]} -- ('category', count) pairs
+
+    Keyword Arguments:
+        total {int} -- The sum of the counts if it is already known
+            (default: {None})
+
+    Returns:
+        List[Tuple[str, float]] -- list of categories with confidence percentages
+            in ('category', percentage) format
+    """
+    counts = list(counts)
+    if total is None:
+        total = sum(count for _, count in counts)
+    # If there are less than MIN_NORMALIZE_COUNT votes, treat it as less certain
+    if total < settings.MIN_NORMALIZE_COUNT:
+        total = settings.MIN_NORMALIZE_COUNT
+    normalized_dict = {name: 100*count/total for name, count in counts}
+    return sorted(normalized_dict.items(), key=lambda x: x[1], reverse=True)
 
 
 def votes_to_percentages(votes: QuerySet) -> List[Tuple[str, float]]:
     """Returns a descending list of categories with confidence percentages
 
+    Runs a single query. Where the database supports window functions the
+    total is summed by the database alongside the rows.
+
     Arguments:
         votes {QuerySet} -- DisposableVotes to analyze
 
@@ -63,14 +171,15 @@ def votes_to_percentages(votes: QuerySet) -> List[Tuple[str, float]]:
     if not isinstance(votes, QuerySet) or votes.model is not DisposableVote:
         raise TypeError('votes must be a QuerySet of DisposableVotes')
 
-    if not votes.exists():
-        raise ValueError('votes cannot be empty')
+    total = None
+    if connections[votes.db].features.supports_over_clause:
+        rows = list(votes.annotate(total=Window(expression=Sum('count')))
+                    .values_list('category__name', 'count', 'total'))
+        if rows:
+            total = rows[0][2]
+    else:
+        rows = list(votes.values_list('category__name', 'count'))
 
-    total = 0
-    for vote in votes:
-        total += vote.count
-    # If there are less than MIN_NORMALIZE_COUNT votes, treat it as less certain
-    if total < settings.MIN_NORMALIZE_COUNT:
-        total = settings.MIN_NORMALIZE_COUNT
-    normalized_dict = {v.category.name: 100*v.count/total for v in votes}
-    return sorted(normalized_dict.items(), key=lambda x: x[1], reverse=True)
+    if not rows:
+        raise ValueError('votes cannot be empty')
+    return counts_to_percentages([(row[0], row[1]) for row in rows], total)
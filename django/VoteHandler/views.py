@@ -3,67 +3,149 @@
 from __future__ import unicode_literals
 import collections
 from contextlib import suppress
+import json
 from urllib.parse import urlencode
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import EmptyResultSet
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, reverse, redirect
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 
 from Config.models import CanInfo, Bin
-from .models import Category, Disposable, DisposableVote
-from .utils import send_rotate_to_can, votes_to_percentages
+from .bins import BinRouting
+from .buffer import vote_buffer
+from .cache import get_classification, get_classifications, normalize_name
+from .ingestion import apply_vote_deltas, ingest_votes
+from .models import Category, Disposable, DisposableSummary
+from .search import fuzzy_index, prefix_index
+from .utils import send_rotate_to_can
 
 
 @login_required
 @require_POST
 def dispose(request):
     """View that receives POST requests for disposals from home's form"""
-    try:
-        user_text = request.POST.get('disposable_item')
-        if user_text is None:
-            return render(request, 'VoteHandler/home.html',
-                          {'error_message' : 'Please enter text.'}
-                         )
-        disposable = Disposable.objects.get(name=user_text.lower())
-    except Disposable.DoesNotExist:
-        # Create the object, so we have something to assosciate the votes with
-        Disposable.objects.create(name=user_text)
-        return redirect('VoteHandler:categorize', disposable_name=user_text)
-
-    # If we don't have any votes, ask the user to categorize
-    try:
-        top_category = disposable.get_top_category()
-    except EmptyResultSet:
+    user_text = request.POST.get('disposable_item')
+    if user_text is None:
+        return render(request, 'VoteHandler/home.html',
+                      {'error_message' : 'Please enter text.'}
+                     )
+
+    # Served from the cache, or a single read of the DisposableSummary
+    name = normalize_name(user_text)
+    classification = vote_buffer.merge(name, get_classification(name))
+
+    # Before making a new item, see if this is a misspelling of one with votes
+    if classification is None:
+        candidates = fuzzy_index.matches(name)
+        if candidates:
+            candidate_classifications = get_classifications(candidates)
+            for candidate in candidates:
+                classification = vote_buffer.merge(candidate, candidate_classifications[candidate])
+                if classification is not None:
+                    user_text = candidate
+                    break
+
+    if classification is None:
+        # Either the item is new or it doesn't have any votes, so ask the user
+        # to categorize. Create the object if needed, so we have something to
+        # assosciate the votes with
+        Disposable.objects.get_or_create(name=name)
         return redirect('VoteHandler:categorize', disposable_name=user_text)
 
-    # Get the top category and redirect to categorization if the system is not confident
-    top_category_id = top_category.id
-    votes = disposable.get_top_votes()
-    percentage_tuples = votes_to_percentages(votes)
+    # Redirect to categorization if the system is not confident
+    top_category_id = classification.top_category_id
+    percentage_tuples = classification.percentages
     if percentage_tuples[0][1] / 100 < settings.MIN_CONFIDENCE:
         return redirect('VoteHandler:categorize', disposable_name=user_text)
 
     send_rotate_to_can(user=request.user, bin_num=top_category_id)
 
-    args = (disposable.id, top_category_id)
+    args = (classification.disposable_id, top_category_id)
     url = f"{reverse('VoteHandler:result', args=args)}?{urlencode(percentage_tuples)}"
     return HttpResponseRedirect(url)
 
 
+@login_required
+@require_POST
+def classify(request):
+    """
+    A JSON POST view that classifies many items at once, ex. a whole tray.
+
+    Expects a body like {"items": ["item", ...]} and answers with the top
+    category, the percentages and the bin on the caller's can for each item,
+    in the same order. Uses the same number of queries for any number of items.
+    """
+    try:
+        items = json.loads(request.body.decode('utf-8'))['items']
+        if not isinstance(items, list) or not all(isinstance(i, str) for i in items):
+            raise TypeError
+    except (UnicodeDecodeError, ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Body must be JSON like {"items": [...]}'}, status=400)
+
+    if len(items) > settings.CLASSIFY_BATCH_MAX_SIZE:
+        return JsonResponse(
+            {'error': f'At most {settings.CLASSIFY_BATCH_MAX_SIZE} items can be sent at once'},
+            status=400
+        )
+
+    classifications = get_classifications(items)
+    routing = BinRouting.for_user(request.user)
+    results = []
+    for item in items:
+        name = normalize_name(item)
+        classification = vote_buffer.merge(name, classifications[name])
+        if classification is None:
+            results.append({'item': item, 'category': None, 'percentages': [],
+                            'confident': False, 'bin': None})
+            continue
+        percentage_tuples = classification.percentages
+        results.append({
+            'item': item,
+            # Percentages are ordered the same way the top category is chosen
+            'category': percentage_tuples[0][0],
+            'percentages': percentage_tuples,
+            'confident': percentage_tuples[0][1] / 100 >= settings.MIN_CONFIDENCE,
+            'bin': routing.get_bin(classification.top_category_id)
+        })
+    return JsonResponse({'results': results})
+
+
+@login_required
+@require_GET
+def autocomplete(request):
+    """
+    A JSON GET view that suggests known items for the text typed so far.
+
+    Answers ?q=<prefix> with {"results": ["item", ...]}, most voted first,
+    straight from the in-process prefix index. Like the other views it needs
+    a login, so the catalogue can't be listed anonymously, and only the
+    session and user are read from the database. With
+    settings.NAME_INDEX_BACKGROUND_REFRESH the index is refreshed from a
+    background thread, otherwise one request every
+    settings.NAME_INDEX_REFRESH_INTERVAL seconds loads the names and totals
+    that changed.
+    """
+    return JsonResponse({'results': prefix_index.matches(request.GET.get('q', ''))})
+
+
 @login_required
 def categorize(request, disposable_name):
     """View that guides user to selecting the correct category"""
     err_msg, votes = None, None
+    # The summary comes along in the same query, it only exists once there are votes
+    disposables = Disposable.objects.select_related('summary')
     try:
-        disposeable = Disposable.objects.get(name=disposable_name.lower())
+        disposeable = disposables.get(name=normalize_name(disposable_name))
     except Disposable.DoesNotExist:
         err_msg = "The item '{0}' does not exist in the database".format(disposable_name)
     else:
-        with suppress(EmptyResultSet):
-            votes = {v.category.name: v.count for v in disposeable.get_top_votes()}
+        with suppress(DisposableSummary.DoesNotExist):
+            votes = collections.OrderedDict(
+                (category_name, count)
+                for _, category_name, count in disposeable.summary.get_vote_counts()
+            )
 
     return render(request, 'VoteHandler/categorize.html',
                   {
@@ -80,7 +162,7 @@ def home(request):
     bin_num_to_cats = None
     with suppress(CanInfo.DoesNotExist):
         can_instance = CanInfo.objects.get(owner=request.user)
-        bins = Bin.objects.filter(s_id__can_id=can_instance.can_id)
+        bins = Bin.objects.filter(s_id__can_id=can_instance.can_id).select_related('category')
 
         # Ordered dict of bin_num to list of categories
         default_pairs = sorted([(can_bin.bin_num, []) for can_bin in bins], reverse=True)
@@ -113,22 +195,47 @@ def carousel_vote(request):
     """
     # Get disposable and category
     data = request.POST
-    disposable = Disposable.objects.get(name=data['disp_item'])
+    # Disposables are stored under their normalized names, see dispose
+    disposable = Disposable.objects.get(name=normalize_name(data['disp_item']))
     category = Category.objects.get(name=data['vote'])
 
-    # Create with zero votes if it didn't exist
-    d_votes, _ = DisposableVote.objects.get_or_create(
-        disposable=disposable,
-        category=category,
-        defaults={'count': 0}
-    )
-
-    d_votes.add_votes(settings.CATEGORIZE_VOTE_WEIGHT)
+    if settings.VOTE_BUFFER_ENABLED:
+        vote_buffer.add(disposable, category, settings.CATEGORIZE_VOTE_WEIGHT)
+    else:
+        # Atomic increment, creates the votes if they didn't exist
+        apply_vote_deltas([(disposable.id, category.id, settings.CATEGORIZE_VOTE_WEIGHT)])
     send_rotate_to_can(user=request.user, bin_num=category.id)
 
     return redirect('VoteHandler:home')
 
 
+@login_required
+@require_POST
+def vote_batch(request):
+    """
+    A JSON POST view for submitting many votes at once, ex. a kiosk flushing
+    the votes it queued while offline.
+
+    Expects a body like {"votes": [["item", "Category", weight], ...]} where
+    weight is optional. Every accepted vote is applied in one transaction.
+    """
+    try:
+        votes = json.loads(request.body.decode('utf-8'))['votes']
+        if not isinstance(votes, list):
+            raise TypeError
+    except (UnicodeDecodeError, ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Body must be JSON like {"votes": [...]}'}, status=400)
+
+    if len(votes) > settings.VOTE_BATCH_MAX_SIZE:
+        return JsonResponse(
+            {'error': f'At most {settings.VOTE_BATCH_MAX_SIZE} votes can be sent at once'},
+            status=400
+        )
+
+    accepted, rejected = ingest_votes(votes)
+    return JsonResponse({'accepted': accepted, 'rejected': rejected})
+
+
 @login_required
 @require_POST
 def manual_rotate(request):
@@ -0,0 +1,64 @@
+"""Encodings of the messages between the server and the cans
+
+Every socket starts out speaking JSON text frames. A can may list the
+encodings it understands when it identifies, ex.
+{"command": "identify", ..., "encodings": ["msgpack", "json"]}, and the server
+answers with {"command": "encoding", "encoding": "msgpack"} as its last JSON
+frame before switching. msgpack frames are binary and carry the same
+messages, only smaller and cheaper to parse. Either side decodes frames by
+their type, so a frame sent around the switch is never misread.
+
+Attributes:
+    JSON {str} -- The encoding every socket starts with
+    MSGPACK {str} -- Binary frames packed with msgpack
+    ENCODINGS {Tuple[str, ...]} -- The encodings the server speaks, preferred
+        first
+
+Functions:
+    negotiate -- Picks the encoding to use with a can
+    encode -- Packs a message into a binary frame
+    decode -- Unpacks a binary frame
+"""
+from typing import Iterable, Optional
+
+import msgpack
+
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+ENCODINGS = (MSGPACK, JSON)
+
+
+def negotiate(offered: Optional[Iterable[str]]) -> str:
+    """Picks the encoding to use with a can
+
+    Arguments:
+        offered {Optional[Iterable[str]]} -- The encodings the can listed,
+            None if it listed none
+
+    Returns:
+        str -- The server's most preferred encoding that the can offered,
+            JSON if there is none
+    """
+    if not isinstance(offered, (list, tuple)):
+        return JSON
+    for encoding in ENCODINGS:
+        if encoding in offered:
+            return encoding
+    return JSON
+
+
+def encode(content: dict) -> bytes:
+    """Packs a message into a binary frame"""
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def decode(data: bytes) -> dict:
+    """Unpacks a binary frame
+
+    Raises ValueError if the frame isn't a single msgpack map.
+    """
+    content = msgpack.unpackb(data, raw=False)
+    if not isinstance(content, dict):
+        raise ValueError('Frames must hold a map')
+    return content
@@ -1,41 +1,95 @@
 import asyncio
+from collections import OrderedDict
+from functools import partial
 import json
+import random
+import time
 import typing
 
 import websockets
+try:
+    import msgpack
+except ImportError:
+    # Without msgpack the can keeps speaking JSON
+    msgpack = None
 
 
 class CanWsClient():
-    def __init__(self, bin_q: asyncio.Queue, config: dict,
+    # The most acks remembered to answer resent commands with
+    MAX_ACKS = 64
+    # Bounds of the seconds between reconnects, see next_cooldown
+    COOLDOWN_BASE = 1
+    COOLDOWN_CAP = 120
+
+    def __init__(self, bin_q, config: dict,
                  add_to_queue_coro: typing.Coroutine,
                  hostname: str = 'localhost:8000'):
         self.bin_q = bin_q
         self.config = config
-        self.cooldown = 1
+        self.cooldown = self.COOLDOWN_BASE
+        # Seconds the server asked us to wait before reconnecting
+        self.retry_after = None
         self.hostname = hostname
         self.add_to_queue_coro = add_to_queue_coro
+        self._heartbeat_task = None
+        # When the server's pings are overdue, see _ping_handler
+        self._ping_deadline = None
+        # Lets the can skip the password when it reconnects
+        self.resume_token = None
+        # The encoding of the frames we send, the server picks it at identify
+        self.encoding = 'json'
+        # seq: the last status acked, seqs start over with every connection
+        self._acks = OrderedDict()
 
     async def handler(self):
         async with websockets.connect(f'ws://{self.hostname}') as w_s:
-            self._reset_cooldown()
-            async for msg in w_s:
-                try:
-                    json_data = json.loads(msg)
-                except json.JSONDecodeError:
-                    print(f"Failed to parse json content in msg: '{msg}'")
-                else:
-                    print(f'DEBUG: Server sent: {json_data}')
-                    command = json_data.get('command')
-                    if command == 'identify':
-                        await self._identify_handler(w_s)
-                    elif command == 'info':
-                        self._info_helper(json_data)
-                    elif command == 'echo':
-                        await self._echo_handler(w_s, json_data)
-                    elif command == 'rotate':
-                        await self._rotate_handler(json_data)
+            self._ping_deadline = None
+            self.encoding = 'json'
+            self._acks = OrderedDict()
+            try:
+                async for msg in w_s:
+                    try:
+                        json_data = self._decode(msg)
+                    except ValueError:
+                        print(f"Failed to parse content in msg: '{msg}'")
                     else:
-                        self._unknown_helper(json_data)
+                        print(f'DEBUG: Server sent: {json_data}')
+                        command = json_data.get('command')
+                        seq = json_data.get('seq')
+                        if seq is not None and seq in self._acks:
+                            # A resend of a command we already have, so our ack was lost
+                            await self._ack(w_s, seq, self._acks[seq])
+                            continue
+                        if command == 'identify':
+                            await self._identify_handler(w_s)
+                        elif command == 'info':
+                            self._info_helper(json_data)
+                        elif command == 'echo':
+                            await self._echo_handler(w_s, json_data)
+                        elif command == 'heartbeat':
+                            self._heartbeat_handler(w_s, json_data)
+                        elif command == 'ping':
+                            await self._ping_handler(w_s, json_data)
+                        elif command == 'resume_token':
+                            self.resume_token = json_data.get('token')
+                        elif command == 'encoding':
+                            self._encoding_handler(json_data)
+                        elif command == 'rotate':
+                            await self._rotate_handler(w_s, json_data)
+                        elif command == 'close':
+                            self._close_handler()
+                        elif json_data.get('error') == 'RESUME_REJECTED':
+                            # The server asks for the password next
+                            self.resume_token = None
+                        elif json_data.get('error') == 'OVERLOADED':
+                            # The server closes the socket next
+                            self._overloaded_helper(json_data)
+                        else:
+                            self._unknown_helper(json_data)
+                        if seq is not None and seq not in self._acks:
+                            await self._ack(w_s, seq, 'queued')
+            finally:
+                self._stop_heartbeat()
 
     ##### Handlers
 
@@ -43,27 +97,140 @@ class CanWsClient():
         message = content.get('message')
         await w_s.send(message)
 
+    def _heartbeat_handler(self, w_s, content):
+        # Only identified cans are sent this, so the connection is good
+        self._reset_cooldown()
+        # The server marks the can offline if it misses heartbeats
+        self._stop_heartbeat()
+        interval = content.get('interval')
+        if interval:
+            self._heartbeat_task = asyncio.ensure_future(self._send_heartbeats(w_s, interval))
+
+    def _encoding_handler(self, content):
+        # Everything we send from now on is in the server's pick
+        encoding = content.get('encoding')
+        if encoding in self._encodings():
+            self.encoding = encoding
+
+    async def _ping_handler(self, w_s, content):
+        # Missing a few pings in a row means the connection is half-open
+        interval = content.get('interval')
+        if interval:
+            self._ping_deadline = time.monotonic() + 3 * interval
+        await self._send(w_s, {'command': 'pong', 'id': content.get('id')})
+
     async def _identify_handler(self, w_s):
-        # Be sure to strip the hyphens from the uuid to make the username
-        data = {
-            'command': 'identify',
-            'username': self.config['uuid'].replace('-', ''),
-            'password': self.config['password']
-        }
-        json_data = json.dumps(data)
-        await w_s.send(json_data)
-
-    async def _rotate_handler(self, content):
+        if self.resume_token is not None:
+            data = {'command': 'identify', 'token': self.resume_token}
+        else:
+            # Be sure to strip the hyphens from the uuid to make the username
+            data = {
+                'command': 'identify',
+                'username': self.config['uuid'].replace('-', ''),
+                'password': self.config['password']
+            }
+        data['encodings'] = self._encodings()
+        # Ask for numbered commands, so lost ones are resent
+        data['acks'] = True
+        await self._send(w_s, data)
+
+    def _close_handler(self):
+        # Close the open bin without waiting out its dwell
+        self.bin_q.request_close()
+
+    async def _rotate_handler(self, w_s, content):
         pos = int(content.get('position'))
-        await self.add_to_queue_coro(self.bin_q, pos)
+        seq = content.get('seq')
+        if seq is None:
+            await self.add_to_queue_coro(self.bin_q, pos)
+            return
+        # Acked again once the lids have moved
+        on_done = partial(self._rotate_done_helper, w_s, seq)
+        queued = await self.add_to_queue_coro(self.bin_q, pos, on_done=on_done)
+        await self._ack(w_s, seq, 'queued' if queued else 'rejected')
 
     ##### Other funcs
+    async def _ack(self, w_s, seq, status):
+        self._acks[seq] = status
+        self._acks.move_to_end(seq)
+        while len(self._acks) > self.MAX_ACKS:
+            self._acks.popitem(last=False)
+        await self._send(w_s, {'command': 'ack', 'seq': seq, 'status': status})
+
+    async def _ack_quietly(self, w_s, seq, status):
+        # The socket may have closed while the lids moved
+        try:
+            await self._ack(w_s, seq, status)
+        except Exception as ex:
+            print(f'Failed to ack #{seq} as {status}. Error: {ex}')
+
+    def _decode(self, msg):
+        # Frames are decoded by their type, so the switch of encoding can't
+        # garble a frame that was already on its way
+        if isinstance(msg, bytes):
+            if msgpack is None:
+                raise ValueError('msgpack is not installed')
+            content = msgpack.unpackb(msg, raw=False)
+        else:
+            content = json.loads(msg)
+        if not isinstance(content, dict):
+            raise ValueError('Messages must be objects')
+        return content
+
+    @staticmethod
+    def _encodings():
+        # Preferred first, msgpack is smaller and cheaper to parse
+        return ['msgpack', 'json'] if msgpack is not None else ['json']
+
     def _info_helper(self, content):
         message = content.get('message')
         print(f'INFO from server: {message}')
 
+    def _rotate_done_helper(self, w_s, seq, succeeded):
+        asyncio.ensure_future(self._ack_quietly(w_s, seq, 'done' if succeeded else 'failed'))
+
+    def next_cooldown(self):
+        """
+        Picks the seconds to wait before reconnecting.
+        Decorrelated jitter keeps a fleet that lost the server at once from
+        reconnecting in step, and the server's retry hint comes first.
+        """
+        if self.retry_after is not None:
+            # Spread the cans turned away together over as long again
+            self.cooldown = random.uniform(self.retry_after, 2 * self.retry_after)
+            self.retry_after = None
+        else:
+            self.cooldown = min(self.COOLDOWN_CAP,
+                                random.uniform(self.COOLDOWN_BASE, self.cooldown * 3))
+        return self.cooldown
+
+    def _overloaded_helper(self, content):
+        retry_after = content.get('retry_after')
+        if isinstance(retry_after, (int, float)) and retry_after > 0:
+            self.retry_after = retry_after
+
     def _reset_cooldown(self):
-        self.cooldown = 1
+        self.cooldown = self.COOLDOWN_BASE
+
+    async def _send(self, w_s, content):
+        if self.encoding == 'msgpack':
+            await w_s.send(msgpack.packb(content, use_bin_type=True))
+        else:
+            await w_s.send(json.dumps(content))
+
+    async def _send_heartbeats(self, w_s, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if self._ping_deadline is not None and time.monotonic() > self._ping_deadline:
+                print('No ping from the server in a while, reconnecting')
+                await w_s.close()
+                return
+            await self._send(w_s, {'command': 'heartbeat'})
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
 
     def _unknown_helper(self, json_data):
         print(f'Unknown command in msg: {json_data}')
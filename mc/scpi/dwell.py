@@ -0,0 +1,60 @@
+"""Policies deciding how long an open bin stays open
+
+move_consumer asks its policy for the time to close at whenever something
+changes while a bin is open, a request for the bin, a request for another
+bin, and records how long each opening lasted.
+
+Classes:
+    DwellPolicy -- Keeps a bin open a fixed time after the last request for it
+    AdaptiveDwell -- Shortens the time while other moves wait, up to a maximum
+"""
+from collections import deque
+
+
+class DwellPolicy():
+    """
+    Keeps a bin open a fixed number of seconds after the last request for it.
+    Subclass and override deadline for other policies. Also takes the number
+    of open durations kept for stats.
+    """
+    def __init__(self, seconds: float = 10, window: int = 100):
+        self.seconds = seconds
+        self.open_durations = deque(maxlen=window)
+
+    def deadline(self, opened_at: float, last_request: float, waiting: int) -> float:
+        """
+        Get the time.monotonic() to close the bin at, given when it was opened,
+        the last request for it and the number of requests for other bins
+        waiting.
+        """
+        return last_request + self.seconds
+
+    def record(self, seconds: float) -> None:
+        """Records how long a bin was open"""
+        self.open_durations.append(seconds)
+
+    def stats(self) -> dict:
+        """The number of openings kept, and their median and longest durations"""
+        durations = sorted(self.open_durations)
+        return {
+            'count': len(durations),
+            'open_p50': durations[len(durations) // 2] if durations else None,
+            'open_max': durations[-1] if durations else None,
+        }
+
+
+class AdaptiveDwell(DwellPolicy):
+    """
+    Keeps a bin open seconds after the last request for it, or busy_seconds
+    while requests for other bins wait, and never longer than max_seconds in
+    all.
+    """
+    def __init__(self, seconds: float = 10, busy_seconds: float = 4,
+                 max_seconds: float = 30, window: int = 100):
+        super().__init__(seconds, window)
+        self.busy_seconds = busy_seconds
+        self.max_seconds = max_seconds
+
+    def deadline(self, opened_at: float, last_request: float, waiting: int) -> float:
+        seconds = self.busy_seconds if waiting else self.seconds
+        return min(last_request + seconds, opened_at + self.max_seconds)
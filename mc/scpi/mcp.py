@@ -7,14 +7,22 @@ import argparse
 import asyncio
 from functools import partial
 import signal
+import sys
+import time
 
 import websockets
 
+if '--simulate' in sys.argv:
+    # Stands in for RPi.GPIO, so it has to be installed before anything imports that
+    import sim_gpio
+    sim_gpio.install()
 import RPi.GPIO as GPIO
 
 from can_ws_client import CanWsClient
+from dwell import AdaptiveDwell, DwellPolicy
 from lid_controller import LidController
 from motor_controller import MotorController
+from move_scheduler import PEDAL, REMOTE, MoveScheduler
 from registration import Registration, HOSTNAME
 from rotary_encoder import RotaryEncoderPair
 
@@ -42,43 +50,92 @@ CHAN_TO_BINS = {
     36: 2
 }
 
+# Moves waiting at once, past this new ones are rejected
+BIN_QUEUE_SIZE = 10
+# Seconds a bin stays open after the last request for it, while other
+# moves wait, and at most, see AdaptiveDwell
+OPEN_SECONDS = 10
+BUSY_OPEN_SECONDS = 4
+MAX_OPEN_SECONDS = 30
+
 
 ##### Bin methods
 
-async def add_to_queue(bin_q, bin_num, delay_s=0):
+async def add_to_queue(bin_q: MoveScheduler, bin_num, delay_s=0, on_done=None,
+                       priority=REMOTE):
     """
     Add a bin number to the queue. Can specify a delay in seconds before adding
-    the bin number to the queue.
+    the bin number to the queue, a callback that is passed whether the move
+    succeeded once the lids have moved, and the priority of the request.
+    Returns whether the move was queued.
     """
-    try:
-        await asyncio.sleep(delay_s)
-        await bin_q.put(bin_num)
-    except Exception as ex:
-        print(f"Failed to add 'move to bin #{bin_num}'. Error: {ex}")
-    else:
-        print(f"Added 'move to bin #{bin_num}' to queue")
+    await asyncio.sleep(delay_s)
+    if not bin_q.put(bin_num, on_done, priority):
+        print(f"Failed to add 'move to bin #{bin_num}'. The queue is full")
+        return False
+    print(f"Added 'move to bin #{bin_num}' to queue, {bin_q.depth} waiting")
+    return True
 
 
-async def move_consumer(bin_q, lid_controller: LidController):
+async def hold_open(bin_q: MoveScheduler, bin_num, dwell: DwellPolicy):
+    """
+    Keeps a bin open for as long as the dwell policy says, or until the
+    server asks to close early.
+    Returns the seconds it was open.
+    """
+    opened_at = last_request = time.monotonic()
+    # A close asked for before the bin opened is not for this bin
+    bin_q.clear_close()
+    while True:
+        again = bin_q.take(bin_num)
+        if again is not None:
+            print(f"Keeping bin #{bin_num} open for {len(again.requested)} more requests")
+            again.done(True)
+            last_request = time.monotonic()
+        if bin_q.close_requested:
+            print(f"Closing bin #{bin_num} early")
+            break
+        remaining = dwell.deadline(opened_at, last_request, bin_q.depth) - time.monotonic()
+        if remaining <= 0:
+            break
+        await bin_q.wait_for_put(remaining)
+    open_for = time.monotonic() - opened_at
+    dwell.record(open_for)
+    return open_for
+
+
+async def move_consumer(bin_q: MoveScheduler, lid_controller: LidController,
+                        dwell: DwellPolicy = None):
     """
     Run the next move in the queue.
-    Will yield and wait if the Queue is empty.
+    Will yield and wait if the queue is empty. The dwell policy decides how
+    long each bin stays open, AdaptiveDwell by default, and the lids aren't
+    closed if another move is waiting already.
     """
+    if dwell is None:
+        dwell = AdaptiveDwell(OPEN_SECONDS, BUSY_OPEN_SECONDS, MAX_OPEN_SECONDS)
     while True:
+        move = await bin_q.get()
+        bin_num = move.bin_num
+        print(f"Consuming 'move to bin #{bin_num}' for {len(move.requested)} requests")
         try:
-            bin_num = await bin_q.get()
-            print(f"Consuming 'move to bin #{bin_num}'")
             await lid_controller.open(bin_num)
-            await asyncio.sleep(10)
         except Exception as ex:
             print(f"Failed to 'move to bin #{bin_num}'. Error: {ex}")
+            move.done(False)
         else:
             print(f"Succesful 'move to bin #{bin_num}'")
-        finally:
-            try:
-                await lid_controller.close()
-            except Exception as ex:
-                print(f"Failed to close after 'move to bin #{bin_num}'. Error: {ex}")
+            move.done(True)
+            open_for = await hold_open(bin_q, bin_num, dwell)
+            print(f"Bin #{bin_num} was open {open_for:.1f}s, {dwell.stats()}")
+        print(f'Move queue: {bin_q.stats()}')
+        if bin_q.depth:
+            # Opening the next bin moves both lids anyway
+            continue
+        try:
+            await lid_controller.close()
+        except Exception as ex:
+            print(f"Failed to close after 'move to bin #{bin_num}'. Error: {ex}")
 
 
 ##### Setup funcs
@@ -106,8 +163,11 @@ def setup_gpio(loop, bin_q):
         )
 
 
-def setup_lid_controller(loop):
-    """Sets up the devices for the lid controller"""
+def setup_lid_controller(loop, calibrate=True):
+    """
+    Sets up the devices for the lid controller. Without calibrate the lids
+    are taken to be aligned already.
+    """
     encoder_pair = RotaryEncoderPair(
         top_ccw=ROT_TOP_CCW,
         top_cw=ROT_TOP_CW,
@@ -116,7 +176,7 @@ def setup_lid_controller(loop):
         top_gear_ratio=TOP_GEAR_RATIO,
         btm_gear_ratio=BTM_GEAR_RATIO
     )
-    encoder_pair.calibrate()
+    encoder_pair.calibrate(interactive=calibrate)
 
     top_mc = MotorController(encoder_pair.encoder_top, fwd_pin=MTR_1_FWD, rev_pin=MTR_1_REV)
     btm_mc = MotorController(encoder_pair.encoder_btm, fwd_pin=MTR_2_FWD, rev_pin=MTR_2_REV)
@@ -136,6 +196,10 @@ def get_args() -> object:
     parser = argparse.ArgumentParser(description='The main Smart Can process.')
     parser.add_argument('--offline', action='store_true',
                         help='Run in offline mode, only using pedals as input.')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Run against simulated motors, encoders and pedals, see sim_gpio.')
+    parser.add_argument('--pedals-per-minute', type=float, default=0,
+                        help='With --simulate, how often random pedals are pressed.')
     return parser.parse_args()
 
 
@@ -154,10 +218,10 @@ async def handler_persistance_warpper(bin_q, config):
         except Exception as ex:
             print(f'An exception occured: {ex}')
         finally:
-            # Cooldown between retries, up to 10 minutes
-            client.cooldown = min(client.cooldown * 2, 600)
-            print(f'Cooling down for {client.cooldown} seconds')
-            await asyncio.sleep(client.cooldown)
+            # Jittered cooldown between retries, or what the server asked for
+            cooldown = client.next_cooldown()
+            print(f'Cooling down for {cooldown:.1f} seconds')
+            await asyncio.sleep(cooldown)
 
 
 def on_event_loop(bin_q, channel):
@@ -167,7 +231,8 @@ def on_event_loop(bin_q, channel):
     """
     bin_num = CHAN_TO_BINS[channel]
     print(f'Button press detected on channel {channel} for bin {bin_num}')
-    asyncio.ensure_future(add_to_queue(bin_q, bin_num))
+    # Someone is standing at the can, so pedals go first
+    asyncio.ensure_future(add_to_queue(bin_q, bin_num, priority=PEDAL))
 
 
 #### Main
@@ -177,16 +242,19 @@ def main():
     # This restores the Ctrl+C signal handler, normally the loop ignores it
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+    # Argument setup and parsing
+    args = get_args()
+    offline = args.offline
+
     # Initialize devices
     loop = asyncio.get_event_loop()
-    lid = setup_lid_controller(loop)
+    if args.simulate:
+        sim_gpio.attach_motor(MTR_1_FWD, MTR_1_REV, ROT_TOP_CCW, ROT_TOP_CW)
+        sim_gpio.attach_motor(MTR_2_FWD, MTR_2_REV, ROT_BTM_CCW, ROT_BTM_CW)
+    lid = setup_lid_controller(loop, calibrate=not args.simulate)
 
     # Initialize queue
-    bin_q = asyncio.Queue()
-
-    # Argument setup and parsing
-    args = get_args()
-    offline = args.offline
+    bin_q = MoveScheduler(maxsize=BIN_QUEUE_SIZE)
 
     # Registration
     if not offline:
@@ -201,6 +269,8 @@ def main():
 
     # Setup pedal events with GPIO
     setup_gpio(loop, bin_q)
+    if args.simulate and args.pedals_per_minute:
+        sim_gpio.press_randomly(list(CHAN_TO_BINS), args.pedals_per_minute)
 
     # Schedule the tasks
     tasks = [move_consumer(bin_q, lid)]
@@ -5,12 +5,21 @@ import RPi.GPIO as io
 
 
 class MotorController():
-    """A class for controlling a motor attached the raspberry pi"""
-    def __init__(self, encoder, fwd_pin, rev_pin, num_bins=3):
+    """
+    A class for controlling a motor attached the raspberry pi.
+    In closed loop mode moves run the motor until the encoder reports the
+    target was reached, otherwise in bursts of move_seconds until the encoder
+    stops getting closer. move_timeout is the most seconds a closed loop move
+    may take, in case the motor stalls.
+    """
+    def __init__(self, encoder, fwd_pin, rev_pin, num_bins=3, closed_loop=True,
+                 move_timeout=10):
         self.encoder = encoder
         self.f_pin = fwd_pin
         self.r_pin = rev_pin
         self.num_bins = num_bins
+        self.closed_loop = closed_loop
+        self.move_timeout = move_timeout
         self._curr_bin = 0
         self._setup_motor()
 
@@ -58,8 +67,33 @@ class MotorController():
     async def move_degrees(self, deg, fwd=True) -> None:
         """
         Moves the lid deg degrees in the fwd or reverse direction up to 179 degrees.
+        Raises asyncio.TimeoutError if a closed loop move takes longer than
+        move_timeout.
         Returns nothing.
         """
+        if not self.closed_loop:
+            await self._move_degrees_open_loop(deg, fwd)
+            return
+
+        steps = self.encoder.degrees_to_steps(deg)
+        # Wait for the target before starting, so no step is missed
+        reached = self.encoder.wait_for_steps(steps if fwd else -steps)
+        if fwd:
+            self.fwd()
+        else:
+            self.rev()
+        try:
+            await asyncio.wait_for(reached, self.move_timeout)
+        except asyncio.TimeoutError:
+            stopped_at = self.encoder.snapshot()
+            print(f'{self.encoder.name} did not turn {deg} degrees in {self.move_timeout}s, '
+                  f'stuck at {stopped_at.degrees:.1f} degrees')
+            raise
+        finally:
+            self.off()
+
+    async def _move_degrees_open_loop(self, deg, fwd) -> None:
+        """Moves in bursts until the encoder stops getting closer"""
         curr_loc = self.encoder.get_degrees()
         start_loc = curr_loc
         last_loc = curr_loc
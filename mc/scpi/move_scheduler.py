@@ -0,0 +1,142 @@
+"""Contains the MoveScheduler that orders the moves of the lids
+
+Requests for a bin that is already waiting are merged into the waiting move,
+so a burst of requests opens the bin once. Pedal presses go before rotates
+sent by the server, someone is standing at the can. Since there is at most
+one waiting move per bin, the backlog can't grow past the number of bins.
+
+Classes:
+    Move -- One opening of a bin, serving one or more requests
+    MoveScheduler -- A queue of moves that merges and prioritizes them
+"""
+import asyncio
+from collections import deque
+import time
+from typing import Callable, Dict, List, Optional
+
+
+# Priorities, lower goes first
+PEDAL = 0
+REMOTE = 1
+
+
+class Move():
+    """One opening of a bin, serving one or more requests"""
+    def __init__(self, bin_num: int, priority: int, order: int):
+        self.bin_num = bin_num
+        self.priority = priority
+        # Breaks ties between moves of the same priority, first come first
+        self.order = order
+        # The time.monotonic() of each request
+        self.requested: List[float] = []
+        self._on_done: List[Callable[[bool], None]] = []
+
+    def add_request(self, priority: int, on_done: Callable[[bool], None] = None):
+        """Adds a request to the move, taking on its priority if higher"""
+        self.priority = min(self.priority, priority)
+        self.requested.append(time.monotonic())
+        if on_done is not None:
+            self._on_done.append(on_done)
+
+    def done(self, succeeded: bool) -> None:
+        """Tells every request whether the bin was opened"""
+        for on_done in self._on_done:
+            try:
+                on_done(succeeded)
+            except Exception as ex:
+                print(f"Failed to report 'move to bin #{self.bin_num}'. Error: {ex}")
+        self._on_done = []
+
+
+class MoveScheduler():
+    """
+    A queue of moves that merges requests for the same bin and puts pedal
+    presses first. Takes the most moves waiting at once, and the number of
+    waits kept for stats.
+    """
+    def __init__(self, maxsize: int = 10, wait_window: int = 100):
+        self.maxsize = maxsize
+        self._waiting: Dict[int, Move] = {}
+        self._order = 0
+        self._put_event = asyncio.Event()
+        # Whether the server asked to close the open bin early
+        self.close_requested = False
+        # Seconds between each request and its bin opening
+        self._waits = deque(maxlen=wait_window)
+        self.served = 0
+        self.merged = 0
+        self.rejected = 0
+
+    @property
+    def depth(self) -> int:
+        """The number of requests waiting, merged ones included"""
+        return sum(len(move.requested) for move in self._waiting.values())
+
+    def put(self, bin_num: int, on_done: Callable[[bool], None] = None,
+            priority: int = REMOTE) -> bool:
+        """
+        Requests a bin be opened. on_done is passed whether it was, once
+        the lids have moved.
+        Returns whether the request was queued.
+        """
+        move = self._waiting.get(bin_num)
+        if move is not None:
+            self.merged += 1
+        elif len(self._waiting) >= self.maxsize:
+            self.rejected += 1
+            return False
+        else:
+            self._order += 1
+            move = Move(bin_num, priority, self._order)
+            self._waiting[bin_num] = move
+        move.add_request(priority, on_done)
+        self._put_event.set()
+        return True
+
+    async def get(self) -> Move:
+        """Waits for the next move, the highest priority and oldest first"""
+        while not self._waiting:
+            self._put_event.clear()
+            await self._put_event.wait()
+        move = min(self._waiting.values(), key=lambda move: (move.priority, move.order))
+        return self._serve(move)
+
+    def take(self, bin_num: int) -> Optional[Move]:
+        """Takes the waiting move for a bin, if any, ex. while it is open already"""
+        move = self._waiting.get(bin_num)
+        return self._serve(move) if move is not None else None
+
+    def request_close(self) -> None:
+        """Asks for the open bin to be closed without waiting out its dwell"""
+        self.close_requested = True
+        self._put_event.set()
+
+    def clear_close(self) -> None:
+        self.close_requested = False
+
+    async def wait_for_put(self, timeout: float) -> None:
+        """Waits up to timeout seconds for the next request or close"""
+        self._put_event.clear()
+        try:
+            await asyncio.wait_for(self._put_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> dict:
+        """The depth of the queue, the counts of requests and the waits in seconds"""
+        waits = sorted(self._waits)
+        return {
+            'depth': self.depth,
+            'served': self.served,
+            'merged': self.merged,
+            'rejected': self.rejected,
+            'wait_p50': waits[len(waits) // 2] if waits else None,
+            'wait_max': waits[-1] if waits else None,
+        }
+
+    def _serve(self, move: Move) -> Move:
+        del self._waiting[move.bin_num]
+        now = time.monotonic()
+        self._waits.extend(now - requested for requested in move.requested)
+        self.served += len(move.requested)
+        return move
@@ -1,12 +1,17 @@
 """Classes for working with rotary encoding on an rpi
 
 Classes:
+    EdgeRing - A fixed size buffer of the latest edges of an encoder
+    EncoderSnapshot - The position and motion of an encoder at one time
     Encoder - A single rotary encoder to be aggregated as necessary
     RotaryEncoderPair - For reading rotations of a pair of rotary encoders on rPi
 """
-from typing import Tuple
+from array import array
+import asyncio
+import threading
+import time
+from typing import List, NamedTuple, Tuple
 import warnings
-import tkinter as tk
 
 try:
     import RPi.GPIO as GPIO
@@ -15,54 +20,186 @@ except ImportError:
     warnings.warn("For testing purposes you need to Mock 'GPIO'")
 
 
+# The step between two states of the pins, indexed [previous][new] where a
+# state is (ccw pin << 1) | cw pin. Turning ccw the ccw pin leads,
+# 00 -> 10 -> 11 -> 01 -> 00. None is a jump over a state, a missed edge.
+_TRANSITIONS = (
+    (0, -1, 1, None),
+    (1, 0, None, -1),
+    (-1, None, 0, 1),
+    (None, 1, -1, 0),
+)
+# Steps of the decoded position per quadrature cycle, one per edge
+EDGES_PER_CYCLE = 4
+
+
+class EdgeRing():
+    """A fixed size buffer of the latest edges of an encoder
+
+    Each edge is its time.monotonic() and the encoder's count after it, kept
+    in preallocated arrays so recording one allocates nothing.
+
+    Arguments:
+        size {int} -- The number of edges kept
+    """
+
+    def __init__(self, size: int = 64):
+        self._times = array('d', [0.0]) * size
+        self._counts = array('q', [0]) * size
+        self._next = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, timestamp: float, count: int) -> None:
+        self._times[self._next] = timestamp
+        self._counts[self._next] = count
+        self._next = (self._next + 1) % len(self._times)
+        self._len = min(self._len + 1, len(self._times))
+
+    def clear(self) -> None:
+        self._len = 0
+
+    def latest(self, num: int) -> List[Tuple[float, int]]:
+        """Get the latest num edges, oldest first
+
+        Returns:
+            List[Tuple[float, int]] -- [(timestamp, count)]
+        """
+        num = min(num, self._len)
+        size = len(self._times)
+        indexes = [(self._next - num + i) % size for i in range(num)]
+        return [(self._times[i], self._counts[i]) for i in indexes]
+
+
+class EncoderSnapshot(NamedTuple):
+    """The position and motion of an encoder at one time"""
+    # Steps since start up, never rolled over
+    count: int
+    # Steps within the rollover, see Encoder.get_raw_pos
+    pos: int
+    degrees: float
+    # Degrees per second, positive ccw, 0 once the encoder stopped
+    velocity: float
+    # Degrees per second squared
+    acceleration: float
+    # The time.monotonic() the snapshot was taken at
+    time: float
+
+
 class Encoder():
-    """A single rotary encoder
+    """A single quadrature rotary encoder
+
+    Every edge of either pin is decoded from the state of both pins, so the
+    position moves by four steps per cycle and bouncing pins cancel out.
+    Transitions that skip a state can't tell the direction, those are only
+    counted in invalid_transitions. Besides its position the encoder counts
+    steps without rolling over, so a move can wait for the count to reach a
+    target, see wait_for_steps, and times its latest edges for its velocity,
+    see snapshot.
 
     Arguments:
         ccw_pin {int} -- The counter-clockwise pin number
         cw_pin {int} -- The clockwise pin number
         rollover_steps {int} -- The amount of steps to mod the position by
         name {str} -- A human readable name of the encoder for messages
+        ring_size {int} -- The number of edges timed
+        velocity_edges {int} -- The number of latest edges velocity is
+            averaged over
+        stopped_after {float} -- Seconds without an edge after which the
+            encoder counts as stopped
     """
 
     def __init__(self, ccw_pin: int, cw_pin: int, rollover_steps: int = 360,
-                 name: str = 'encoder'):
+                 name: str = 'encoder', ring_size: int = 64, velocity_edges: int = 8,
+                 stopped_after: float = 0.1):
         self._ccw_pin = ccw_pin
         self._cw_pin = cw_pin
         self._rollover_steps = rollover_steps
         self._pos = 0
+        # Steps since start up, increasing ccw, never rolled over
+        self._count = 0
+        self._state = 0
+        self._edges = EdgeRing(ring_size)
+        # [(target count, direction, future, loop)] waiting to be reached
+        self._targets = []
+        # GPIO callbacks run on their own thread
+        self._lock = threading.Lock()
+        self.invalid_transitions = 0
+        self.velocity_edges = velocity_edges
+        self.stopped_after = stopped_after
         self.calibrated = True
         self.name = name
 
         self._setup()
 
-    def _decrement(self) -> None:
-        self._pos = (self._pos - 1) % self._rollover_steps
-
-    def _increment(self) -> None:
-        self._pos = (self._pos + 1) % self._rollover_steps
+    def _edge(self, ccw_level: int, cw_level: int, timestamp: float = None) -> None:
+        """Decodes an edge from the levels of the pins right after it"""
+        state = (2 if ccw_level else 0) | (1 if cw_level else 0)
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            step = _TRANSITIONS[self._state][state]
+            self._state = state
+            if step is None:
+                self.invalid_transitions += 1
+                return
+            if step == 0:
+                return
+            self._pos = (self._pos + step) % self._rollover_steps
+            self._count += step
+            self._edges.append(timestamp, self._count)
+            if self._targets:
+                self._resolve_reached()
+
+    def _read_edge(self) -> None:
+        self._edge(GPIO.input(self._ccw_pin), GPIO.input(self._cw_pin))
+
+    def _resolve_reached(self) -> None:
+        """Hands the futures of reached targets back to their event loops,
+        call with self._lock held"""
+        waiting = []
+        for target in self._targets:
+            target_count, direction, future, loop = target
+            if (self._count - target_count) * direction >= 0:
+                loop.call_soon_threadsafe(_set_reached, future)
+            else:
+                waiting.append(target)
+        self._targets = waiting
+
+    def _forget_target(self, future: asyncio.Future) -> None:
+        with self._lock:
+            self._targets = [target for target in self._targets if target[2] is not future]
 
     def _setup(self) -> None:
         GPIO.setmode(GPIO.BOARD)
         GPIO.setwarnings(False)
         GPIO.setup([self._ccw_pin, self._cw_pin], GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self._state = (2 if GPIO.input(self._ccw_pin) else 0) | \
+                      (1 if GPIO.input(self._cw_pin) else 0)
 
-        # NOTE: might need to pass in loop to get this working async
-        # GPIO events
-        GPIO.add_event_detect(self._ccw_pin, GPIO.RISING, lambda _: self._increment())
-        GPIO.add_event_detect(self._cw_pin, GPIO.FALLING, lambda _: self._decrement())
+        # GPIO events, on their own thread
+        for pin in (self._ccw_pin, self._cw_pin):
+            GPIO.add_event_detect(pin, GPIO.BOTH, lambda _: self._read_edge())
 
     # TODO: Maybe make this a decorator
     def _warn_if_uncalibrated(self):
         if not self.calibrated:
             warnings.warn(f"Encoder titled '{self.name}' has not been calibrated.")
 
-    def calibrate(self) -> None:
-        """Asks user to perform initial calibration"""
-        # tkinter popup for calibration
-        self.generate_tkinter_popup()
+    def calibrate(self, interactive: bool = True) -> None:
+        """Asks user to perform initial calibration
 
-        self._pos = 0
+        Keyword Arguments:
+            interactive {bool} -- Whether to ask, otherwise the current
+                position is taken as aligned, ex. when simulated (default: {True})
+        """
+        if interactive:
+            # tkinter popup for calibration
+            self.generate_tkinter_popup()
+
+        with self._lock:
+            self._pos = 0
         self.calibrated = True
 
     def get_degrees(self) -> float:
@@ -85,8 +222,71 @@ class Encoder():
         self._warn_if_uncalibrated()
         return self._pos
 
+    def snapshot(self) -> EncoderSnapshot:
+        """Get the position and motion of the encoder, all from the same instant
+
+        Cheap enough to poll while moving, it copies a few numbers under the
+        lock and estimates the velocity from the latest velocity_edges edges.
+        """
+        now = time.monotonic()
+        with self._lock:
+            count = self._count
+            pos = self._pos
+            edges = self._edges.latest(self.velocity_edges)
+
+        velocity = acceleration = 0.0
+        if len(edges) >= 2 and now - edges[-1][0] < self.stopped_after:
+            velocity = self._rate(edges[0], edges[-1])
+            if len(edges) >= 3:
+                # The change in velocity between the halves of the edges
+                middle = edges[len(edges) // 2]
+                elapsed = (edges[-1][0] - edges[0][0]) / 2
+                if elapsed > 0:
+                    acceleration = (self._rate(middle, edges[-1]) -
+                                    self._rate(edges[0], middle)) / elapsed
+        self._warn_if_uncalibrated()
+        degrees = (pos / self._rollover_steps * 360) % 360
+        return EncoderSnapshot(count, pos, degrees, velocity, acceleration, now)
+
+    def _rate(self, first: Tuple[float, int], last: Tuple[float, int]) -> float:
+        """Degrees per second between two edges"""
+        elapsed = last[0] - first[0]
+        if elapsed <= 0:
+            return 0.0
+        return (last[1] - first[1]) / elapsed / self._rollover_steps * 360
+
+    def degrees_to_steps(self, degrees: float) -> int:
+        """The whole number of steps closest to turning degrees"""
+        return round(degrees / 360 * self._rollover_steps)
+
+    def wait_for_steps(self, steps: int) -> asyncio.Future:
+        """Get a future that resolves once the encoder has turned steps from here
+
+        Must be called from the event loop the future is awaited on. The
+        target counts as reached once crossed, so a missed step can't leave
+        the future waiting forever.
+
+        Arguments:
+            steps {int} -- The steps to turn, positive ccw and negative cw
+
+        Returns:
+            asyncio.Future -- Resolves to None once reached. Cancelling it,
+                ex. on a timeout, stops waiting.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if steps == 0:
+            future.set_result(None)
+            return future
+        with self._lock:
+            self._targets.append((self._count + steps, 1 if steps > 0 else -1, future, loop))
+        future.add_done_callback(self._forget_target)
+        return future
+
     def generate_tkinter_popup(self):
         """ Generates calibration pop up message for the user """
+        # Only needed here, and not every machine has a display
+        import tkinter as tk
         root = tk.Tk()
 
         # Gets the requested values of the height and widht.
@@ -113,21 +313,32 @@ class Encoder():
         root.mainloop()
 
 
+def _set_reached(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
 class RotaryEncoderPair():
-    """A pair of encoders for use with the LidController"""
+    """A pair of encoders for use with the LidController
+
+    steps_per_revolution is the number of quadrature cycles per turn of an
+    encoder's shaft. Each cycle is four steps of the decoded position, so a
+    lid turns once every steps_per_revolution * 4 * gear ratio steps.
+    """
 
     def __init__(self, top_ccw=37, top_cw=35, btm_ccw=33, btm_cw=31,
                  steps_per_revolution: int = 360, top_gear_ratio: float = 6,
                  btm_gear_ratio: float = 5.8):
-        top_rollover_steps = int(steps_per_revolution * top_gear_ratio)
-        btm_rollover_steps = int(steps_per_revolution * btm_gear_ratio)
+        edges_per_revolution = steps_per_revolution * EDGES_PER_CYCLE
+        top_rollover_steps = int(edges_per_revolution * top_gear_ratio)
+        btm_rollover_steps = int(edges_per_revolution * btm_gear_ratio)
         self.encoder_top = Encoder(top_ccw, top_cw, top_rollover_steps, 'top encoder')
         self.encoder_btm = Encoder(btm_ccw, btm_cw, btm_rollover_steps, 'bottom encoder')
 
-    def calibrate(self) -> None:
-        """Calibrates each encoder"""
-        self.encoder_top.calibrate()
-        self.encoder_btm.calibrate()
+    def calibrate(self, interactive: bool = True) -> None:
+        """Calibrates each encoder, see Encoder.calibrate"""
+        self.encoder_top.calibrate(interactive)
+        self.encoder_btm.calibrate(interactive)
 
     def get_raw_pos(self) -> Tuple[int, int]:
         """Get the raw positions of the top and bottom encoders
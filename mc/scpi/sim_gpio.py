@@ -0,0 +1,243 @@
+"""A simulated stand in for RPi.GPIO, to run the can off a pi
+
+install() puts this module in sys.modules as RPi.GPIO, so everything that
+imports RPi.GPIO afterwards runs against it unchanged. Pins keep the levels
+they are set to. A motor attached with attach_motor spins up, coasts and
+stops with some inertia while its forward or reverse pin drives it, and
+turns a quadrature encoder whose edges call back from a thread of their
+own, like RPi.GPIO's do. press and press_randomly stand in for the pedals.
+
+Ex. mcp.py --simulate --offline
+
+Classes:
+    Motor -- A DC motor turning a quadrature encoder
+    Board -- The pins, callbacks and motors of the simulated board
+
+Functions:
+    install -- Makes this module the RPi.GPIO everything imports
+    attach_motor -- Connects a simulated motor between motor and encoder pins
+    press -- Presses the pedal on a pin
+    press_randomly -- Presses random pedals in the background
+    The rest are the parts of the RPi.GPIO API the can uses
+"""
+import math
+import random
+import sys
+import threading
+import time
+import types
+from typing import Callable, Dict, List
+
+
+BOARD = 10
+BCM = 11
+OUT = 0
+IN = 1
+LOW = 0
+HIGH = 1
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+# The levels of the (ccw, cw) encoder pins by count % 4, ccw leads
+_QUADRATURE = ((0, 0), (1, 0), (1, 1), (0, 1))
+
+
+class Motor():
+    """
+    A DC motor turning a quadrature encoder, counting the encoder's edges.
+    Takes its top speed in edges per second, and the time constants in
+    seconds of spinning up while driven and of coasting to a stop while not.
+    """
+    def __init__(self, max_speed: float = 1000, spin_up: float = 0.15, coast: float = 0.05):
+        self.max_speed = max_speed
+        self.spin_up = spin_up
+        self.coast = coast
+        # 1 forward (ccw), -1 reverse, 0 off
+        self.drive = 0
+        # Edges per second, and edges turned
+        self.velocity = 0.0
+        self.position = 0.0
+
+    @property
+    def count(self) -> int:
+        return math.floor(self.position)
+
+    def step(self, seconds: float) -> int:
+        """Moves the motor on by seconds, returns the new count"""
+        target = self.drive * self.max_speed
+        time_constant = self.spin_up if self.drive else self.coast
+        self.velocity += (target - self.velocity) * min(seconds / time_constant, 1)
+        if not self.drive and abs(self.velocity) < self.max_speed / 100:
+            # Friction stops it
+            self.velocity = 0.0
+        self.position += self.velocity * seconds
+        return self.count
+
+
+class Board():
+    """
+    The pins, callbacks and motors of the simulated board. Motors are moved
+    on every tick seconds from a background thread.
+    """
+    def __init__(self, tick: float = 0.001):
+        self.tick = tick
+        self._levels: Dict[int, int] = {}
+        self._callbacks: Dict[int, List[tuple]] = {}
+        # (motor, fwd pin, rev pin, ccw pin, cw pin)
+        self._motors: List[tuple] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None) -> None:
+        channels = channel if isinstance(channel, (list, tuple)) else [channel]
+        with self._lock:
+            for chan in channels:
+                if initial is not None:
+                    self._levels[chan] = initial
+                else:
+                    self._levels.setdefault(chan, HIGH if pull_up_down == PUD_UP else LOW)
+
+    def output(self, channel, level) -> None:
+        self._set_level(channel, HIGH if level else LOW)
+
+    def input(self, channel) -> int:
+        return self._levels.get(channel, LOW)
+
+    def add_event_detect(self, channel, edge, callback: Callable[[int], None] = None,
+                         bouncetime=None) -> None:
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append((edge, callback))
+
+    def remove_event_detect(self, channel) -> None:
+        with self._lock:
+            self._callbacks.pop(channel, None)
+
+    def attach_motor(self, motor: Motor, fwd_pin: int, rev_pin: int, ccw_pin: int,
+                     cw_pin: int) -> None:
+        with self._lock:
+            levels = (self._levels.get(ccw_pin), self._levels.get(cw_pin))
+            if levels in _QUADRATURE:
+                # Start where the encoder pins already are, so no edge is made up
+                motor.position = float(_QUADRATURE.index(levels))
+            else:
+                self._levels[ccw_pin], self._levels[cw_pin] = _QUADRATURE[motor.count % 4]
+            self._motors.append((motor, fwd_pin, rev_pin, ccw_pin, cw_pin))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sim-gpio', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        last = time.monotonic()
+        while True:
+            time.sleep(self.tick)
+            now = time.monotonic()
+            for motor, fwd_pin, rev_pin, ccw_pin, cw_pin in list(self._motors):
+                self._move(motor, now - last, fwd_pin, rev_pin, ccw_pin, cw_pin)
+            last = now
+
+    def _move(self, motor: Motor, seconds: float, fwd_pin, rev_pin, ccw_pin, cw_pin) -> None:
+        fwd, rev = self.input(fwd_pin), self.input(rev_pin)
+        # Like the motor driver, one pin high drives, both high or low is off
+        motor.drive = 1 if fwd and not rev else -1 if rev and not fwd else 0
+        count = motor.count
+        new_count = motor.step(seconds)
+        direction = 1 if new_count > count else -1
+        while count != new_count:
+            count += direction
+            ccw_level, cw_level = _QUADRATURE[count % 4]
+            # One pin changes per edge
+            if self.input(ccw_pin) != ccw_level:
+                self._set_level(ccw_pin, ccw_level)
+            else:
+                self._set_level(cw_pin, cw_level)
+
+    def _set_level(self, channel, level) -> None:
+        with self._lock:
+            previous = self._levels.get(channel, LOW)
+            self._levels[channel] = level
+            callbacks = list(self._callbacks.get(channel, []))
+        if previous == level:
+            return
+        for edge, callback in callbacks:
+            if callback is not None and (edge == BOTH or (edge == RISING) == bool(level)):
+                callback(channel)
+
+
+_board = Board()
+
+
+##### The RPi.GPIO API
+
+def setmode(mode) -> None:
+    pass
+
+
+def setwarnings(flag) -> None:
+    pass
+
+
+def cleanup(channel=None) -> None:
+    pass
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=None) -> None:
+    _board.setup(channel, direction, pull_up_down, initial)
+
+
+def output(channel, level) -> None:
+    _board.output(channel, level)
+
+
+# Shadows the builtin, as RPi.GPIO's does
+def input(channel) -> int:
+    return _board.input(channel)
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None) -> None:
+    _board.add_event_detect(channel, edge, callback, bouncetime)
+
+
+def remove_event_detect(channel) -> None:
+    _board.remove_event_detect(channel)
+
+
+##### Simulation
+
+def install() -> None:
+    """Makes this module the RPi.GPIO everything imports from now on"""
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = sys.modules[__name__]
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = rpi.GPIO
+
+
+def attach_motor(fwd_pin: int, rev_pin: int, ccw_pin: int, cw_pin: int, **kwargs) -> Motor:
+    """
+    Connects a simulated motor between the pins driving it and the pins of
+    its encoder. kwargs are passed on to Motor.
+    """
+    motor = Motor(**kwargs)
+    _board.attach_motor(motor, fwd_pin, rev_pin, ccw_pin, cw_pin)
+    return motor
+
+
+def press(channel) -> None:
+    """Presses and releases the pedal on a pin, wired to pull it low"""
+    _board.output(channel, LOW)
+    _board.output(channel, HIGH)
+
+
+def press_randomly(channels: List[int], per_minute: float) -> threading.Thread:
+    """Presses random pedals from a background thread, per_minute on average"""
+    def run():
+        while True:
+            time.sleep(random.expovariate(per_minute / 60))
+            press(random.choice(channels))
+
+    thread = threading.Thread(target=run, name='sim-pedals', daemon=True)
+    thread.start()
+    return thread
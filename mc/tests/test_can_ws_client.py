@@ -1,6 +1,8 @@
 """Tests for the CanWsClient"""
 import asyncio
 import asynctest
+from unittest import mock
+import msgpack
 import sys
 import websockets
 sys.path.append("..") # Adds higher directory to python modules path
@@ -8,6 +10,31 @@ sys.path.append("..") # Adds higher directory to python modules path
 from mc.scpi.can_ws_client import CanWsClient
 
 
+class FakeWebSocket():
+    """A connected socket that yields messages, then closes, and records sends"""
+    def __init__(self, messages):
+        self._messages = iter(messages)
+        self.sent = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._messages)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
 class CanWsClientTest(asynctest.TestCase):
     async def test_echo_handler(self):
         """Echo sends back the message it receives"""
@@ -16,3 +43,111 @@ class CanWsClientTest(asynctest.TestCase):
         content = {'message': 'test'}
         await cws._echo_handler(w_s_mock, content)
         w_s_mock.send.assert_awaited_once_with(content['message'])
+
+    async def test_heartbeat_handler(self):
+        """Heartbeats are sent every interval until stopped"""
+        cws = CanWsClient(None, None, None, None)
+        w_s_mock = asynctest.CoroutineMock(websockets.WebSocketClientProtocol)
+        cws._heartbeat_handler(w_s_mock, {'command': 'heartbeat', 'interval': 0.01})
+        await asyncio.sleep(0.035)
+        cws._stop_heartbeat()
+        sent = w_s_mock.send.await_count
+        self.assertGreaterEqual(sent, 2)
+        w_s_mock.send.assert_awaited_with('{"command": "heartbeat"}')
+        await asyncio.sleep(0.02)
+        self.assertEqual(w_s_mock.send.await_count, sent)
+
+    async def test_ping_handler(self):
+        """Pings are answered with a pong carrying the same id"""
+        cws = CanWsClient(None, None, None, None)
+        w_s_mock = asynctest.CoroutineMock(websockets.WebSocketClientProtocol)
+        await cws._ping_handler(w_s_mock, {'command': 'ping', 'id': 3, 'interval': 15})
+        w_s_mock.send.assert_awaited_once_with('{"command": "pong", "id": 3}')
+
+    async def test_ping_overdue(self):
+        """The socket is closed when the server's pings stop"""
+        cws = CanWsClient(None, None, None, None)
+        w_s_mock = asynctest.CoroutineMock(websockets.WebSocketClientProtocol)
+        await cws._ping_handler(w_s_mock, {'command': 'ping', 'id': 1, 'interval': 0.001})
+        await asyncio.sleep(0.01)
+        await cws._send_heartbeats(w_s_mock, 0.001)
+        w_s_mock.close.assert_awaited_once_with()
+
+    async def test_identify_with_resume_token(self):
+        """A stored resume token is sent instead of the password"""
+        cws = CanWsClient(None, {'uuid': 'a-b', 'password': 'secret'}, None, None)
+        w_s_mock = asynctest.CoroutineMock(websockets.WebSocketClientProtocol)
+        await cws._identify_handler(w_s_mock)
+        w_s_mock.send.assert_awaited_once_with(
+            '{"command": "identify", "username": "ab", "password": "secret", '
+            '"encodings": ["msgpack", "json"], "acks": true}')
+        cws.resume_token = 'token'
+        await cws._identify_handler(w_s_mock)
+        w_s_mock.send.assert_awaited_with(
+            '{"command": "identify", "token": "token", "encodings": ["msgpack", "json"], '
+            '"acks": true}')
+
+    async def test_encoding(self):
+        """After the server picks msgpack, frames are sent packed"""
+        cws = CanWsClient(None, None, None, None)
+        w_s_mock = asynctest.CoroutineMock(websockets.WebSocketClientProtocol)
+        cws._encoding_handler({'command': 'encoding', 'encoding': 'msgpack'})
+        await cws._ping_handler(w_s_mock, {'command': 'ping', 'id': 1})
+        w_s_mock.send.assert_awaited_once_with(
+            msgpack.packb({'command': 'pong', 'id': 1}, use_bin_type=True))
+        # Both kinds of frames are still understood
+        self.assertEqual(cws._decode(msgpack.packb({'command': 'rotate'})), {'command': 'rotate'})
+        self.assertEqual(cws._decode('{"command": "rotate"}'), {'command': 'rotate'})
+        with self.assertRaises(ValueError):
+            cws._decode('[]')
+
+    async def test_rotate_acks(self):
+        """Numbered rotates are acked when queued and again when done"""
+        add_to_queue = asynctest.CoroutineMock(return_value=True)
+        cws = CanWsClient(None, None, add_to_queue, None)
+        w_s_mock = asynctest.CoroutineMock(websockets.WebSocketClientProtocol)
+        await cws._rotate_handler(w_s_mock, {'command': 'rotate', 'position': '2', 'seq': 1})
+        w_s_mock.send.assert_awaited_once_with('{"command": "ack", "seq": 1, "status": "queued"}')
+        add_to_queue.call_args[1]['on_done'](True)
+        await asyncio.sleep(0)
+        w_s_mock.send.assert_awaited_with('{"command": "ack", "seq": 1, "status": "done"}')
+        # A full queue rejects the rotate
+        add_to_queue.return_value = False
+        await cws._rotate_handler(w_s_mock, {'command': 'rotate', 'position': '2', 'seq': 2})
+        w_s_mock.send.assert_awaited_with('{"command": "ack", "seq": 2, "status": "rejected"}')
+
+    async def test_duplicate(self):
+        """A resent command is acked again instead of being run twice"""
+        add_to_queue = asynctest.CoroutineMock(return_value=True)
+        cws = CanWsClient(None, None, add_to_queue, None)
+        rotate = '{"command": "rotate", "position": "2", "seq": 1}'
+        w_s = FakeWebSocket([rotate, rotate])
+        with mock.patch('websockets.connect', return_value=w_s):
+            await cws.handler()
+        add_to_queue.assert_awaited_once()
+        self.assertEqual(w_s.sent, ['{"command": "ack", "seq": 1, "status": "queued"}'] * 2)
+
+    def test_next_cooldown(self):
+        """Cooldowns are jittered and grow up to the cap"""
+        cws = CanWsClient(None, None, None, None)
+        with mock.patch('random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([cws.next_cooldown() for _ in range(6)], [3, 9, 27, 81, 120, 120])
+        cws._reset_cooldown()
+        for _ in range(100):
+            self.assertTrue(cws.COOLDOWN_BASE <= cws.next_cooldown() <= cws.COOLDOWN_CAP)
+
+    def test_retry_after(self):
+        """The server's retry hint is used once, spread over as long again"""
+        cws = CanWsClient(None, None, None, None)
+        cws._overloaded_helper({'error': 'OVERLOADED', 'retry_after': 10})
+        self.assertTrue(10 <= cws.next_cooldown() <= 20)
+        self.assertIsNone(cws.retry_after)
+        cws._overloaded_helper({'error': 'OVERLOADED', 'retry_after': 'soon'})
+        self.assertIsNone(cws.retry_after)
+
+    async def test_close_handler(self):
+        """The server can close the open bin early"""
+        bin_q = mock.Mock()
+        cws = CanWsClient(bin_q, None, None, None)
+        cws._close_handler()
+        bin_q.request_close.assert_called_once_with()
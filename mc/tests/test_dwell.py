@@ -0,0 +1,26 @@
+"""Tests for the dwell policies"""
+import sys
+
+import asynctest
+sys.path.append("..") # Adds higher directory to python modules path
+
+from mc.scpi.dwell import AdaptiveDwell, DwellPolicy
+
+
+class DwellPolicyTest(asynctest.TestCase):
+    def test_fixed(self):
+        """Bins stay open a fixed time after the last request"""
+        dwell = DwellPolicy(seconds=10)
+        self.assertEqual(dwell.deadline(100, 105, waiting=2), 115)
+        self.assertEqual(dwell.stats(), {'count': 0, 'open_p50': None, 'open_max': None})
+        for seconds in (3, 10, 4):
+            dwell.record(seconds)
+        self.assertEqual(dwell.stats(), {'count': 3, 'open_p50': 4, 'open_max': 10})
+
+    def test_adaptive(self):
+        """Waiting moves shorten the dwell, repeats extend it up to the max"""
+        dwell = AdaptiveDwell(seconds=10, busy_seconds=4, max_seconds=30)
+        self.assertEqual(dwell.deadline(100, 100, waiting=0), 110)
+        self.assertEqual(dwell.deadline(100, 100, waiting=1), 104)
+        self.assertEqual(dwell.deadline(100, 115, waiting=0), 125)
+        self.assertEqual(dwell.deadline(100, 125, waiting=0), 130)
@@ -0,0 +1,121 @@
+"""Tests for the Encoder and closed loop moves of the MotorController"""
+import asyncio
+import sys
+import threading
+from unittest import mock
+
+import asynctest
+# There is no GPIO off the pi
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = sys.modules['RPi'].GPIO
+sys.modules['RPi.GPIO'].input.return_value = 0
+sys.path.append("..") # Adds higher directory to python modules path
+
+from mc.scpi.motor_controller import MotorController
+from mc.scpi.rotary_encoder import EdgeRing, Encoder
+
+
+# The states of the pins turning ccw, see rotary_encoder._TRANSITIONS
+CCW_STATES = [(0, 0), (1, 0), (1, 1), (0, 1)]
+
+
+def turn(encoder, steps, start=0.0, interval=0.001):
+    """Feeds the edges of turning steps, ccw if positive"""
+    state = CCW_STATES.index(((encoder._state >> 1) & 1, encoder._state & 1))
+    direction = 1 if steps > 0 else -1
+    for i in range(abs(steps)):
+        state = (state + direction) % 4
+        encoder._edge(*CCW_STATES[state], timestamp=start + i * interval)
+
+
+class EdgeRingTest(asynctest.TestCase):
+    def test_wraps(self):
+        """Only the latest edges are kept, oldest first"""
+        ring = EdgeRing(size=3)
+        self.assertEqual(ring.latest(2), [])
+        for count in range(5):
+            ring.append(count / 10, count)
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.latest(5), [(0.2, 2), (0.3, 3), (0.4, 4)])
+        self.assertEqual(ring.latest(2), [(0.3, 3), (0.4, 4)])
+
+
+class EncoderTest(asynctest.TestCase):
+    async def test_wait_for_steps(self):
+        """Targets resolve once crossed, from the GPIO thread too"""
+        encoder = Encoder(1, 2, rollover_steps=100)
+        reached = encoder.wait_for_steps(3)
+        turn(encoder, 2)
+        await asyncio.sleep(0)
+        self.assertFalse(reached.done())
+        thread = threading.Thread(target=turn, args=(encoder, 1))
+        thread.start()
+        thread.join()
+        await asyncio.wait_for(reached, 1)
+        # Backwards past the roll over
+        reached = encoder.wait_for_steps(-5)
+        turn(encoder, -5)
+        await asyncio.wait_for(reached, 1)
+        self.assertEqual(encoder.get_raw_pos(), 98)
+        self.assertEqual(encoder._targets, [])
+
+    async def test_cancel(self):
+        """Cancelled targets are forgotten"""
+        encoder = Encoder(1, 2)
+        reached = encoder.wait_for_steps(10)
+        reached.cancel()
+        await asyncio.sleep(0)
+        self.assertEqual(encoder._targets, [])
+
+
+    def test_quadrature(self):
+        """Bounces cancel out and skipped states aren't counted"""
+        encoder = Encoder(1, 2)
+        encoder._edge(1, 0)
+        encoder._edge(0, 0)
+        encoder._edge(1, 0)
+        self.assertEqual(encoder.get_raw_pos(), 1)
+        encoder._edge(0, 1)
+        self.assertEqual(encoder.get_raw_pos(), 1)
+        self.assertEqual(encoder.invalid_transitions, 1)
+
+    @mock.patch('time.monotonic')
+    def test_snapshot(self, monotonic):
+        """Velocity and acceleration come from the latest edges"""
+        encoder = Encoder(1, 2, rollover_steps=360, velocity_edges=5)
+        turn(encoder, 10, start=1, interval=0.01)
+        monotonic.return_value = 1.1
+        snapshot = encoder.snapshot()
+        self.assertEqual((snapshot.count, snapshot.pos, snapshot.degrees), (10, 10, 10))
+        self.assertAlmostEqual(snapshot.velocity, 100)
+        self.assertAlmostEqual(snapshot.acceleration, 0)
+        turn(encoder, -20, start=1.2, interval=0.01)
+        monotonic.return_value = 1.4
+        snapshot = encoder.snapshot()
+        self.assertEqual((snapshot.count, snapshot.pos), (-10, 350))
+        self.assertAlmostEqual(snapshot.velocity, -100)
+        # Stopped
+        monotonic.return_value = 2
+        self.assertEqual(encoder.snapshot().velocity, 0)
+
+
+class MotorControllerTest(asynctest.TestCase):
+    async def test_closed_loop(self):
+        """The motor runs until the encoder reaches the target, then stops"""
+        encoder = Encoder(1, 2, rollover_steps=360)
+        motor = MotorController(encoder, 3, 4)
+        motor.fwd = mock.Mock(side_effect=lambda: self.loop.call_later(
+            0.01, turn, encoder, 90))
+        motor.off = mock.Mock()
+        await motor.move_degrees(90)
+        motor.fwd.assert_called_once_with()
+        motor.off.assert_called_once_with()
+        self.assertEqual(encoder.get_degrees(), 90)
+
+    async def test_stall(self):
+        """A motor that doesn't turn is stopped after the timeout"""
+        motor = MotorController(Encoder(1, 2), 3, 4, move_timeout=0.01)
+        motor.off = mock.Mock()
+        with self.assertRaises(asyncio.TimeoutError):
+            await motor.move_degrees(90, fwd=False)
+        motor.off.assert_called_once_with()
@@ -0,0 +1,70 @@
+"""Tests for the MoveScheduler"""
+import asyncio
+import sys
+from unittest import mock
+
+import asynctest
+sys.path.append("..") # Adds higher directory to python modules path
+
+from mc.scpi.move_scheduler import PEDAL, REMOTE, MoveScheduler
+
+
+class MoveSchedulerTest(asynctest.TestCase):
+    async def test_merge(self):
+        """Requests for a waiting bin are served by one move"""
+        scheduler = MoveScheduler()
+        on_done = mock.Mock()
+        for bin_num in (1, 1, 2, 1):
+            self.assertTrue(scheduler.put(bin_num, on_done))
+        self.assertEqual(scheduler.depth, 4)
+        move = await scheduler.get()
+        self.assertEqual((move.bin_num, len(move.requested)), (1, 3))
+        move.done(True)
+        self.assertEqual(on_done.call_count, 3)
+        on_done.assert_called_with(True)
+        self.assertEqual(scheduler.stats()['merged'], 2)
+        self.assertEqual(scheduler.depth, 1)
+
+    async def test_priority(self):
+        """Pedal presses go first, otherwise first come first served"""
+        scheduler = MoveScheduler()
+        scheduler.put(0, priority=REMOTE)
+        scheduler.put(1, priority=REMOTE)
+        scheduler.put(2, priority=PEDAL)
+        # Merging a pedal press raises the waiting move's priority
+        scheduler.put(1, priority=PEDAL)
+        order = [(await scheduler.get()).bin_num for _ in range(3)]
+        self.assertEqual(order, [1, 2, 0])
+
+    async def test_full(self):
+        """New bins are rejected once maxsize moves are waiting"""
+        scheduler = MoveScheduler(maxsize=1)
+        self.assertTrue(scheduler.put(0))
+        self.assertTrue(scheduler.put(0))
+        self.assertFalse(scheduler.put(1))
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+
+    async def test_wait(self):
+        """get waits for a request, and waits are reported"""
+        scheduler = MoveScheduler()
+        move = asyncio.ensure_future(scheduler.get())
+        await asyncio.sleep(0.01)
+        self.assertFalse(move.done())
+        scheduler.put(2)
+        self.assertEqual((await asyncio.wait_for(move, 1)).bin_num, 2)
+        self.assertIsNone(scheduler.take(2))
+        await scheduler.wait_for_put(0.01)
+        stats = scheduler.stats()
+        self.assertEqual((stats['depth'], stats['served']), (0, 1))
+        self.assertLess(stats['wait_max'], 1)
+
+    async def test_close(self):
+        """Asking to close wakes whoever waits for a request"""
+        scheduler = MoveScheduler()
+        waiting = asyncio.ensure_future(scheduler.wait_for_put(1))
+        await asyncio.sleep(0)
+        scheduler.request_close()
+        await asyncio.wait_for(waiting, 0.1)
+        self.assertTrue(scheduler.close_requested)
+        scheduler.clear_close()
+        self.assertFalse(scheduler.close_requested)
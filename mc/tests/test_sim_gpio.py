@@ -0,0 +1,93 @@
+"""Tests for the simulated GPIO"""
+import asyncio
+import sys
+from unittest import mock
+
+import asynctest
+# The tests point the can's modules at the simulation themselves
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = sys.modules['RPi'].GPIO
+sys.modules['RPi.GPIO'].input.return_value = 0
+sys.path.append("..") # Adds higher directory to python modules path
+
+from mc.scpi import motor_controller, rotary_encoder, sim_gpio
+from mc.scpi.motor_controller import MotorController
+from mc.scpi.rotary_encoder import Encoder, RotaryEncoderPair
+
+
+class MotorTest(asynctest.TestCase):
+    def test_inertia(self):
+        """Motors spin up while driven and coast to a stop after"""
+        motor = sim_gpio.Motor(max_speed=1000, spin_up=0.1, coast=0.05)
+        motor.drive = 1
+        # Half way to top speed after half the time constant
+        motor.step(0.05)
+        self.assertEqual(motor.velocity, 500)
+        for _ in range(100):
+            motor.step(0.01)
+        self.assertAlmostEqual(motor.velocity, 1000, delta=1)
+        motor.drive = 0
+        count = motor.step(0.01)
+        self.assertGreater(motor.velocity, 0)
+        for _ in range(100):
+            motor.step(0.01)
+        self.assertEqual(motor.velocity, 0)
+        self.assertGreater(motor.count, count)
+
+
+class BoardTest(asynctest.TestCase):
+    def setUp(self):
+        # A board of its own, and the can's modules pointed at the simulation
+        patches = [
+            mock.patch.object(sim_gpio, '_board', sim_gpio.Board()),
+            mock.patch.object(rotary_encoder, 'GPIO', sim_gpio, create=True),
+            mock.patch.object(motor_controller, 'io', sim_gpio),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def turn(self, ccw_pin, cw_pin, cycles):
+        """Turns an encoder ccw by a number of quadrature cycles, an edge at a time"""
+        start = sim_gpio._QUADRATURE.index((sim_gpio.input(ccw_pin), sim_gpio.input(cw_pin)))
+        for count in range(start + 1, start + cycles * 4 + 1):
+            ccw_level, cw_level = sim_gpio._QUADRATURE[count % 4]
+            sim_gpio.output(ccw_pin, ccw_level)
+            sim_gpio.output(cw_pin, cw_level)
+
+    def test_revolution(self):
+        """A lid's revolution of quadrature cycles reads 360 degrees"""
+        encoders = RotaryEncoderPair(top_ccw=3, top_cw=4, btm_ccw=5, btm_cw=6,
+                                     steps_per_revolution=360, top_gear_ratio=6)
+        encoder = encoders.encoder_top
+        # 360 cycles per turn of the encoder, geared down 6 times to the lid
+        self.turn(3, 4, 360 * 6 // 4)
+        self.assertEqual(encoder.get_degrees(), 90)
+        self.turn(3, 4, 360 * 6 * 3 // 4)
+        self.assertEqual(encoder.snapshot().count, encoder.degrees_to_steps(360))
+        self.assertEqual(encoder.get_degrees(), 0)
+        self.assertEqual(encoder.invalid_transitions, 0)
+
+    def test_pedal(self):
+        """Pressing a pedal calls back on the rising edge"""
+        callback = mock.Mock()
+        sim_gpio.setup(40, sim_gpio.IN, pull_up_down=sim_gpio.PUD_UP)
+        sim_gpio.add_event_detect(40, sim_gpio.RISING, callback=callback, bouncetime=1000)
+        sim_gpio.press(40)
+        callback.assert_called_once_with(40)
+
+    async def test_closed_loop(self):
+        """The encoder counts every edge of a move, and the motor coasts past"""
+        motor = sim_gpio.attach_motor(1, 2, 3, 4, max_speed=5000)
+        encoder = Encoder(3, 4, rollover_steps=1440)
+        controller = MotorController(encoder, 1, 2)
+        await controller.move_degrees(90)
+        target = encoder.degrees_to_steps(90)
+        self.assertGreaterEqual(encoder.snapshot().count, target)
+        # Let it coast to a stop
+        while motor.velocity:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        self.assertEqual(encoder.snapshot().count, motor.count)
+        self.assertLess(encoder.snapshot().count - target, 200)
+        self.assertEqual(encoder.invalid_transitions, 0)